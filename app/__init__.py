@@ -6,6 +6,8 @@ from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
 
 from core.configuration.configuration import get_app_version
+from core.ingestion.pipeline import record_pipeline
+from core.jobs.worker import publication_worker
 from core.managers.config_manager import ConfigManager
 from core.managers.error_handler_manager import ErrorHandlerManager
 from core.managers.logging_manager import LoggingManager
@@ -34,6 +36,12 @@ def create_app(config_name="development"):
     db.init_app(app)
     migrate.init_app(app, db)
 
+    # Buffered writer for view and download records
+    record_pipeline.init_app(app)
+
+    # Background publication of datasets to Zenodo
+    publication_worker.init_app(app)
+
     # Register modules
     module_manager = ModuleManager(app)
     module_manager.register_modules()
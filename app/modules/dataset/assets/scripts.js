@@ -128,6 +128,59 @@ var currentId = 0;
             upload_error.style.display = 'block';
         }
 
+        const publication_steps = {
+            created: 'Creating the Zenodo deposition and uploading files',
+            files_uploaded: 'Publishing the deposition',
+            published: 'Waiting for the DOI',
+            doi_assigned: 'Published',
+        };
+
+        // About a minute: publications waiting for Zenodo carry on in the background without the page
+        const publication_poll_limit = 30;
+
+        function continue_in_background(status) {
+            status.textContent += '. Publishing continues in the background: the dataset moves to your synchronized datasets once it has a DOI.';
+            setTimeout(() => window.location.href = "/dataset/list", 3000);
+        }
+
+        // The dataset already exists: follow its publication to Zenodo, which runs in the background
+        function poll_publication(status_url, polls = 0) {
+            const status = document.getElementById("publication_status");
+            const poll_again = (delay) => {
+                if (polls + 1 >= publication_poll_limit) {
+                    continue_in_background(status);
+                } else {
+                    setTimeout(() => poll_publication(status_url, polls + 1), delay);
+                }
+            };
+            fetch(status_url)
+                .then(response => response.json())
+                .then(job => {
+                    let text = publication_steps[job.state];
+                    if (job.state === 'created' && job.progress) {
+                        text += ` (${job.progress.files_done}/${job.progress.files_total})`;
+                    }
+                    if (job.status === 'pending' && job.error) {
+                        text += '. Retrying after an error: ' + job.error;
+                    }
+                    status.textContent = text;
+
+                    if (job.status === 'completed') {
+                        window.location.href = "/dataset/list";
+                    } else if (job.status === 'failed') {
+                        // not hide_loading(): uploading again would create a second dataset
+                        document.getElementById("loading").style.display = "none";
+                        write_upload_error('The dataset was saved, but publishing it to Zenodo failed: ' + job.error);
+                    } else if (job.status === 'pending' && job.error) {
+                        // Zenodo is failing: the retries back off for minutes, no need to wait for them here
+                        continue_in_background(status);
+                    } else {
+                        poll_again(2000);
+                    }
+                })
+                .catch(() => poll_again(5000));
+        }
+
         window.onload = function () {
 
             test_zenodo_connection();
@@ -206,7 +259,11 @@ var currentId = 0;
                                     console.log('Dataset sent successfully');
                                     response.json().then(data => {
                                         console.log(data.message);
-                                        window.location.href = "/dataset/list";
+                                        if (data.status_url) {
+                                            poll_publication(data.status_url);
+                                        } else {
+                                            window.location.href = "/dataset/list";
+                                        }
                                     });
                                 } else {
                                     response.json().then(data => {
@@ -10,7 +10,8 @@ class Version(db.Model):
     version_number = db.Column(db.String(20), nullable=False)  # por ejemplo "1.0", "1.1", "2.0"
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     snapshot_path = db.Column(db.String(255), nullable=True)
-    
+    manifest = db.Column(db.JSON, nullable=True)  # {"metadata": {...}, "files": [{"name", "checksum", "size"}]}
+
     dataset = db.relationship("BaseDataset", back_populates="versions")
 
     def __repr__(self):
@@ -177,3 +177,57 @@ class DOIMapping(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     dataset_doi_old = db.Column(db.String(120))
     dataset_doi_new = db.Column(db.String(120))
+
+
+class PublicationJob(db.Model):
+    """
+    Publication of a dataset to Zenodo, run in the background (see PublicationService). `state` is the last step
+    completed and `status` whether the job is waiting for a worker, running, completed or given up on.
+    """
+
+    __tablename__ = "publication_job"
+
+    CREATED, FILES_UPLOADED, PUBLISHED, DOI_ASSIGNED = "created", "files_uploaded", "published", "doi_assigned"
+    STATES = (CREATED, FILES_UPLOADED, PUBLISHED, DOI_ASSIGNED)
+    PENDING, RUNNING, COMPLETED, FAILED = "pending", "running", "completed", "failed"
+
+    id = db.Column(db.Integer, primary_key=True)
+    dataset_id = db.Column(
+        db.Integer, db.ForeignKey("base_dataset.id", ondelete="CASCADE"), nullable=False, unique=True
+    )
+    state = db.Column(db.String(20), nullable=False, default=CREATED)
+    status = db.Column(db.String(20), nullable=False, default=PENDING, index=True)
+    deposition_id = db.Column(db.Integer)
+    bucket_url = db.Column(db.String(255))
+    doi = db.Column(db.String(120))
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    progress = db.Column(db.JSON)  # UploadProgress snapshot of the files upload
+    locked_by = db.Column(db.String(120))
+    heartbeat_at = db.Column(db.DateTime)
+    next_attempt_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (self.COMPLETED, self.FAILED)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "dataset_id": self.dataset_id,
+            "state": self.state,
+            "status": self.status,
+            "steps": {state: self.STATES.index(state) <= self.STATES.index(self.state) for state in self.STATES},
+            "deposition_id": self.deposition_id,
+            "doi": self.doi,
+            "attempts": self.attempts,
+            "error": self.error,
+            "progress": self.progress,
+            "next_attempt_at": self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def __repr__(self):
+        return f"<PublicationJob dataset_id={self.dataset_id} state={self.state} status={self.status}>"
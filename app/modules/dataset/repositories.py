@@ -1,11 +1,19 @@
 import logging
 from datetime import datetime, timezone
-from typing import Optional
+from typing import List, Optional
 
 from flask_login import current_user
-from sqlalchemy import desc, func
-
-from app.modules.dataset.models import Author, DataSet, DOIMapping, DSDownloadRecord, DSMetaData, DSViewRecord
+from sqlalchemy import and_, desc, func, or_, update
+
+from app.modules.dataset.models import (
+    Author,
+    DataSet,
+    DOIMapping,
+    DSDownloadRecord,
+    DSMetaData,
+    DSViewRecord,
+    PublicationJob,
+)
 from core.repositories.BaseRepository import BaseRepository
 
 logger = logging.getLogger(__name__)
@@ -32,6 +40,15 @@ class DSMetaDataRepository(BaseRepository):
     def filter_by_doi(self, doi: str) -> Optional[DSMetaData]:
         return self.model.query.filter_by(dataset_doi=doi).first()
 
+    def shares_metrics(self, ds_meta_data: DSMetaData) -> bool:
+        """Whether other datasets point at the same metrics row, as the seeded ones do."""
+        return (
+            self.session.query(self.model.id)
+            .filter(self.model.ds_metrics_id == ds_meta_data.ds_metrics_id, self.model.id != ds_meta_data.id)
+            .first()
+            is not None
+        )
+
 
 class DSViewRecordRepository(BaseRepository):
     def __init__(self):
@@ -106,3 +123,67 @@ class DOIMappingRepository(BaseRepository):
 
     def get_new_doi(self, old_doi: str) -> str:
         return self.model.query.filter_by(dataset_doi_old=old_doi).first()
+
+
+class PublicationJobRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(PublicationJob)
+
+    def get(self, job_id: int) -> Optional[PublicationJob]:
+        return self.session.get(self.model, job_id)
+
+    def get_by_dataset(self, dataset_id: int) -> Optional[PublicationJob]:
+        return self.session.query(self.model).filter_by(dataset_id=dataset_id).first()
+
+    def _due(self, now: datetime, stale_before: datetime):
+        """Pending jobs whose retry time has come, and running jobs whose lease expired."""
+        return or_(
+            and_(
+                self.model.status == PublicationJob.PENDING,
+                or_(self.model.next_attempt_at.is_(None), self.model.next_attempt_at <= now),
+            ),
+            and_(self.model.status == PublicationJob.RUNNING, self.model.heartbeat_at < stale_before),
+        )
+
+    def claim_due(self, limit: int, owner: str, now: datetime, stale_before: datetime) -> List[int]:
+        """
+        Leases up to limit due jobs to owner. Each claim is a conditional UPDATE, so a job another worker claimed
+        in the meantime is skipped.
+        """
+        candidates = [
+            job_id
+            for (job_id,) in self.session.query(self.model.id)
+            .filter(self._due(now, stale_before))
+            .order_by(self.model.id)
+            .limit(limit)
+        ]
+        claimed = []
+        for job_id in candidates:
+            result = self.session.execute(
+                update(self.model)
+                .where(self.model.id == job_id, self._due(now, stale_before))
+                .values(status=PublicationJob.RUNNING, locked_by=owner, heartbeat_at=now)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                claimed.append(job_id)
+        self.session.commit()
+        return claimed
+
+    def heartbeat(self, job_ids: List[int], owner: str, now: datetime, progress: dict):
+        """Renews the lease of the jobs owner is running, storing their latest upload progress."""
+        for job_id in job_ids:
+            values = {"heartbeat_at": now}
+            if job_id in progress:
+                values["progress"] = progress[job_id]
+            self.session.execute(
+                update(self.model)
+                .where(
+                    self.model.id == job_id,
+                    self.model.locked_by == owner,
+                    self.model.status == PublicationJob.RUNNING,
+                )
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+        self.session.commit()
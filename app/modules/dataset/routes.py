@@ -1,12 +1,7 @@
-import json
 import logging
 import os
 import shutil
-import tempfile
 import uuid
-from datetime import datetime, timezone
-from app.modules.dataset.models import DSDownloadRecord, DataSet
-from zipfile import ZipFile
 
 from flask import (
     abort,
@@ -15,23 +10,26 @@ from flask import (
     redirect,
     render_template,
     request,
-    send_from_directory,
     url_for,
 )
 from flask_login import current_user, login_required
 
 from app.modules.dataset import dataset_bp
 from app.modules.dataset.forms import DataSetForm
-from app.modules.dataset.models import DSDownloadRecord
 from app.modules.dataset.services import (
     AuthorService,
     DataSetService,
     DOIMappingService,
-    DSDownloadRecordService,
     DSMetaDataService,
     DSViewRecordService,
+    PublicationService,
+    calculate_checksum_and_size,
 )
-from app.modules.zenodo.services import ZenodoService
+from app.modules.flamapy.services import FlamapyService
+from app.modules.recommendation.services import DatasetSimilarityService, RecommendationService
+from core.archives.cache import archive_response
+from core.ingestion.pipeline import record_pipeline
+from core.storage.hashing import save_stream
 
 logger = logging.getLogger(__name__)
 
@@ -39,9 +37,29 @@ logger = logging.getLogger(__name__)
 dataset_service = DataSetService()
 author_service = AuthorService()
 dsmetadata_service = DSMetaDataService()
-zenodo_service = ZenodoService()
+publication_service = PublicationService()
 doi_mapping_service = DOIMappingService()
 ds_view_record_service = DSViewRecordService()
+recommendation_service = RecommendationService()
+dataset_similarity_service = DatasetSimilarityService()
+flamapy_service = FlamapyService()
+
+
+def validate_temp_files(filenames) -> dict:
+    """Validates uploaded UVL files of the current user, logging what the validation cost."""
+    temp_folder = current_user.temp_folder()
+    report = flamapy_service.validate_files({name: os.path.join(temp_folder, name) for name in filenames})
+    parsed = [result for result in report["files"].values() if not result["cached"]]
+    logger.info(
+        f"Validated {len(report['files'])} UVL files in {report['seconds']}s "
+        f"({len(parsed)} parsed, {sum(result['seconds'] or 0 for result in parsed):.3f}s of parsing)"
+    )
+    return report
+
+
+def invalid_files_message(report: dict) -> str:
+    invalid = [name for name, result in report["files"].items() if not result["valid"]]
+    return f"Invalid UVL files: {', '.join(invalid)}"
 
 
 @dataset_bp.route("/dataset/upload", methods=["GET", "POST"])
@@ -55,58 +73,72 @@ def create_dataset():
         if not form.validate_on_submit():
             return jsonify({"message": form.errors}), 400
 
+        report = validate_temp_files([feature_model.filename.data for feature_model in form.feature_models])
+        if not report["valid"]:
+            return jsonify({"message": invalid_files_message(report), "validation": report}), 400
+
         try:
             logger.info("Creating dataset...")
             dataset = dataset_service.create_from_form(form=form, current_user=current_user)
             logger.info(f"Created dataset: {dataset}")
             dataset_service.move_feature_models(dataset)
+            version = dataset_service.create_version(dataset)
+            dataset_similarity_service.index_dataset(dataset, version_id=version.id)
         except Exception as exc:
             logger.exception(f"Exception while create dataset data in local {exc}")
             return jsonify({"Exception while create dataset data in local: ": str(exc)}), 400
 
-        # send dataset as deposition to Zenodo
-        data = {}
+        # precompute the metrics of the feature models in background jobs
         try:
-            zenodo_response_json = zenodo_service.create_new_deposition(dataset)
-            response_data = json.dumps(zenodo_response_json)
-            data = json.loads(response_data)
+            flamapy_service.submit_analyses(dataset)
         except Exception as exc:
-            data = {}
-            zenodo_response_json = {}
-            logger.exception(f"Exception while create dataset data in Zenodo {exc}")
-
-        if data.get("conceptrecid"):
-            deposition_id = data.get("id")
-
-            # update dataset with deposition id in Zenodo
-            dataset_service.update_dsmetadata(dataset.ds_meta_data_id, deposition_id=deposition_id)
-
-            try:
-                # iterate for each feature model (one feature model = one request to Zenodo)
-                for feature_model in dataset.feature_models:
-                    zenodo_service.upload_file(dataset, deposition_id, feature_model)
+            logger.exception(f"Exception while scheduling the analysis of feature models {exc}")
 
-                # publish deposition
-                zenodo_service.publish_deposition(deposition_id)
-
-                # update DOI
-                deposition_doi = zenodo_service.get_doi(deposition_id)
-                dataset_service.update_dsmetadata(dataset.ds_meta_data_id, dataset_doi=deposition_doi)
-            except Exception as e:
-                msg = f"it has not been possible upload feature models in Zenodo and update the DOI: {e}"
-                return jsonify({"message": msg}), 200
+        # publish the dataset to Zenodo in the background: the publication worker resumes it if interrupted
+        try:
+            job = publication_service.submit(dataset)
+        except Exception as exc:
+            job = None
+            logger.exception(f"Exception while scheduling the publication of the dataset in Zenodo {exc}")
 
-        # Delete temp folder
+        # Delete temp folder: the feature models are in storage already
         file_path = current_user.temp_folder()
         if os.path.exists(file_path) and os.path.isdir(file_path):
             shutil.rmtree(file_path)
 
-        msg = "Everything works!"
-        return jsonify({"message": msg}), 200
+        if job is None:
+            return jsonify({"message": "Dataset created locally, it could not be scheduled for publication"}), 200
+
+        status_url = url_for("dataset.publication_status", dataset_id=dataset.id)
+        response = jsonify(
+            {
+                "message": "Dataset created, publishing it to Zenodo",
+                "dataset_id": dataset.id,
+                "publication": job.to_dict(),
+                "status_url": status_url,
+            }
+        )
+        response.status_code = 202
+        response.headers["Location"] = status_url
+        return response
 
     return render_template("dataset/upload_dataset.html", form=form)
 
 
+@dataset_bp.route("/dataset/<int:dataset_id>/publication", methods=["GET"])
+@login_required
+def publication_status(dataset_id):
+    dataset = dataset_service.get_or_404(dataset_id)
+    job = publication_service.get_by_dataset(dataset_id)
+    if dataset.user_id != current_user.id or job is None:
+        abort(404)
+
+    response = jsonify(job.to_dict())
+    if not job.finished:
+        response.headers["Retry-After"] = "2"
+    return response
+
+
 @dataset_bp.route("/dataset/list", methods=["GET", "POST"])
 @login_required
 def list_dataset():
@@ -144,21 +176,53 @@ def upload():
         new_filename = file.filename
 
     try:
-        file.save(file_path)
+        save_stream(file.stream, file_path, "md5")
     except Exception as e:
         return jsonify({"message": str(e)}), 500
 
+    result = validate_temp_files([new_filename])["files"][new_filename]
+    if not result["valid"]:
+        for path in (file_path, f"{file_path}.md5"):
+            if os.path.exists(path):
+                os.remove(path)
+        return jsonify({"message": "UVL not valid", "errors": result["errors"]}), 400
+
+    # Warn when the files uploaded so far nearly duplicate an existing dataset
+    items = {
+        f"file:{calculate_checksum_and_size(os.path.join(temp_folder, name))[0]}"
+        for name in os.listdir(temp_folder)
+        if name.endswith(".uvl")
+    }
+    near_duplicates = [
+        {"id": dataset.id, "title": dataset.ds_meta_data.title, "similarity": round(similarity, 2)}
+        for dataset, similarity in dataset_similarity_service.near_duplicates(items, user_id=current_user.id)
+    ]
+
     return (
         jsonify(
             {
                 "message": "UVL uploaded and validated successfully",
                 "filename": new_filename,
+                "validation": result,
+                "near_duplicates": near_duplicates,
             }
         ),
         200,
     )
 
 
+@dataset_bp.route("/dataset/file/validate", methods=["POST"])
+@login_required
+def validate_files():
+    """Validates every UVL file uploaded so far and reports the parse time of each one."""
+    temp_folder = current_user.temp_folder()
+    filenames = []
+    if os.path.isdir(temp_folder):
+        filenames = sorted(name for name in os.listdir(temp_folder) if name.endswith(".uvl"))
+    report = validate_temp_files(filenames)
+    return jsonify(report), 200 if report["valid"] else 400
+
+
 @dataset_bp.route("/dataset/file/delete", methods=["POST"])
 def delete():
     data = request.get_json()
@@ -168,6 +232,8 @@ def delete():
 
     if os.path.exists(filepath):
         os.remove(filepath)
+        if os.path.exists(f"{filepath}.md5"):
+            os.remove(f"{filepath}.md5")
         return jsonify({"message": "File deleted successfully"})
 
     return jsonify({"error": "Error: File not found"})
@@ -177,59 +243,27 @@ def delete():
 def download_dataset(dataset_id):
     dataset = dataset_service.get_or_404(dataset_id)
 
-    file_path = f"uploads/user_{dataset.user_id}/dataset_{dataset.id}/"
-
-    temp_dir = tempfile.mkdtemp()
-    zip_path = os.path.join(temp_dir, f"dataset_{dataset_id}.zip")
-
-    with ZipFile(zip_path, "w") as zipf:
-        for subdir, dirs, files in os.walk(file_path):
-            for file in files:
-                full_path = os.path.join(subdir, file)
-
-                relative_path = os.path.relpath(full_path, file_path)
-
-                zipf.write(
-                    full_path,
-                    arcname=os.path.join(os.path.basename(zip_path[:-4]), relative_path),
-                )
+    resp = archive_response(
+        dataset_service.get_archive_entries(dataset),
+        f"dataset_{dataset_id}.zip",
+        dataset_service.get_archive_checksums(dataset),
+    )
+    if resp.status_code == 304:
+        return resp
 
     user_cookie = request.cookies.get("download_cookie")
     if not user_cookie:
         user_cookie = str(uuid.uuid4())  # Generate a new unique identifier if it does not exist
         # Save the cookie to the user's browser
-        resp = make_response(
-            send_from_directory(
-                temp_dir,
-                f"dataset_{dataset_id}.zip",
-                as_attachment=True,
-                mimetype="application/zip",
-            )
-        )
         resp.set_cookie("download_cookie", user_cookie)
-    else:
-        resp = send_from_directory(
-            temp_dir,
-            f"dataset_{dataset_id}.zip",
-            as_attachment=True,
-            mimetype="application/zip",
-        )
 
-    # Check if the download record already exists for this cookie
-    existing_record = DSDownloadRecord.query.filter_by(
+    # Record the download (de-duplicated and written in batches off the request path)
+    record_pipeline.record(
+        "dataset_download",
+        target_id=dataset_id,
+        cookie=user_cookie,
         user_id=current_user.id if current_user.is_authenticated else None,
-        dataset_id=dataset_id,
-        download_cookie=user_cookie,
-    ).first()
-
-    if not existing_record:
-        # Record the download in your database
-        DSDownloadRecordService().create(
-            user_id=current_user.id if current_user.is_authenticated else None,
-            dataset_id=dataset_id,
-            download_date=datetime.now(timezone.utc),
-            download_cookie=user_cookie,
-        )
+    )
 
     return resp
 
@@ -254,7 +288,13 @@ def subdomain_index(doi):
 
     # Save the cookie to the user's browser
     user_cookie = ds_view_record_service.create_cookie(dataset=dataset)
-    resp = make_response(render_template("dataset/view_dataset.html", dataset=dataset))
+    resp = make_response(
+        render_template(
+            "dataset/view_dataset.html",
+            dataset=dataset,
+            related_datasets=recommendation_service.related_datasets(dataset.id),
+        )
+    )
     resp.set_cookie("view_cookie", user_cookie)
 
     return resp
@@ -1,7 +1,6 @@
 # app/modules/dataset/seeders.py
 
 import os
-import shutil
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
@@ -12,6 +11,7 @@ from app.modules.dataset.base_dataset import Version
 from app.modules.featuremodel.models import FeatureModel, FMMetaData
 from app.modules.hubfile.models import Hubfile
 from core.seeders.BaseSeeder import BaseSeeder
+from core.storage.backends import dataset_key, get_storage
 
 
 class DataSetSeeder(BaseSeeder):
@@ -25,11 +25,6 @@ class DataSetSeeder(BaseSeeder):
         if not user1 or not user2:
             raise Exception("Users not found. Please seed users first.")
 
-        # 🔹 Crear métricas
-        ds_metrics = DSMetrics(number_of_models="5", number_of_features="50")
-        db.session.add(ds_metrics)
-        db.session.flush()
-
         # 🔹 Crear metadatos de datasets
         ds_meta_data_list = []
         for i in range(4):
@@ -41,7 +36,7 @@ class DataSetSeeder(BaseSeeder):
                 publication_doi=f"10.1234/dataset{i + 1}",
                 dataset_doi=f"10.1234/dataset{i + 1}",
                 tags="tag1, tag2",
-                ds_metrics_id=ds_metrics.id,
+                ds_metrics=DSMetrics(number_of_models="5", number_of_features="50"),
             )
             ds_meta_data_list.append(ds_meta)
         db.session.add_all(ds_meta_data_list)
@@ -145,22 +140,21 @@ class DataSetSeeder(BaseSeeder):
         working_dir = os.getenv("WORKING_DIR", "")
         src_folder = os.path.join(working_dir, "app", "modules", "dataset", "uvl_examples")
         
+        storage = get_storage()
         hubfiles = []
         for i, feature_model in enumerate(feature_models):
             file_name = f"file{i + 1}.uvl"
             dataset = datasets[i // 3]
             user_id = dataset.user_id
-            dest_folder = os.path.join(working_dir, "uploads", f"user_{user_id}", f"dataset_{dataset.id}")
-            os.makedirs(dest_folder, exist_ok=True)
 
             src_file = os.path.join(src_folder, file_name)
-            dest_file = os.path.join(dest_folder, file_name)
-            shutil.copy(src_file, dest_file)
+            with open(src_file, "rb") as f:
+                storage.save(dataset_key(user_id, dataset.id, file_name), f)
 
             hubfile = Hubfile(
                 name=file_name,
                 checksum=f"checksum{i + 1}",
-                size=os.path.getsize(dest_file),
+                size=os.path.getsize(src_file),
                 feature_model_id=feature_model.id,
             )
             hubfiles.append(hubfile)
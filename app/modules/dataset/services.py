@@ -1,15 +1,16 @@
-import hashlib
 import logging
 import os
-import shutil
 import uuid
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
 
-from flask import request, abort
-import difflib
+from flask import current_app, request, abort
+from flask_login import current_user
 
+from app.modules.auth.repositories import UserRepository
 from app.modules.auth.services import AuthenticationService
-from app.modules.dataset.models import DataSet, DSMetaData, DSViewRecord
+from app.modules.dataset.base_dataset import BaseDataset, Version
+from app.modules.dataset.models import DataSet, DSDownloadRecord, DSMetaData, DSViewRecord, PublicationJob
 from app.modules.dataset.repositories import (
     AuthorRepository,
     DataSetRepository,
@@ -17,6 +18,7 @@ from app.modules.dataset.repositories import (
     DSDownloadRecordRepository,
     DSMetaDataRepository,
     DSViewRecordRepository,
+    PublicationJobRepository,
 )
 from app.modules.featuremodel.repositories import FeatureModelRepository, FMMetaDataRepository
 from app.modules.hubfile.repositories import (
@@ -24,17 +26,25 @@ from app.modules.hubfile.repositories import (
     HubfileRepository,
     HubfileViewRecordRepository,
 )
+from app.modules.zenodo.services import ZenodoService
+from core.archives.cache import get_archive_cache
+from core.diffs.text_diff import html_text_diff
+from core.ingestion.pipeline import record_pipeline
+from core.jobs.worker import publication_worker
 from core.services.BaseService import BaseService
+from core.storage.backends import VERSIONS_DIR, LocalStorage, dataset_key, get_storage
+from core.storage.hashing import file_checksum, file_checksums
+from core.workers.killable import TaskTimeout
+from core.workers.pools import get_process_pool
 
 logger = logging.getLogger(__name__)
 
+record_pipeline.register_kind("dataset_view", DSViewRecord, "dataset_id", "view_date", "view_cookie")
+record_pipeline.register_kind("dataset_download", DSDownloadRecord, "dataset_id", "download_date", "download_cookie")
+
 
 def calculate_checksum_and_size(file_path):
-    file_size = os.path.getsize(file_path)
-    with open(file_path, "rb") as file:
-        content = file.read()
-        hash_md5 = hashlib.md5(content).hexdigest()
-        return hash_md5, file_size
+    return file_checksum(file_path, "md5")
 
 
 class DataSetService(BaseService):
@@ -54,14 +64,58 @@ class DataSetService(BaseService):
         current_user = AuthenticationService().get_authenticated_user()
         source_dir = current_user.temp_folder()
 
-        working_dir = os.getenv("WORKING_DIR", "")
-        dest_dir = os.path.join(working_dir, "uploads", f"user_{current_user.id}", f"dataset_{dataset.id}")
-
-        os.makedirs(dest_dir, exist_ok=True)
-
+        storage = get_storage()
         for feature_model in dataset.feature_models:
             filename = feature_model.fm_meta_data.filename
-            shutil.move(os.path.join(source_dir, filename), dest_dir)
+            checksum = feature_model.files[0].checksum if feature_model.files else None
+            key = dataset_key(current_user.id, dataset.id, filename)
+            storage.put_file(key, os.path.join(source_dir, filename), checksum)
+
+    def get_archive_entries(self, dataset: DataSet) -> list:
+        return get_storage().archive_entries(
+            dataset_key(dataset.user_id, dataset.id), f"dataset_{dataset.id}", exclude=(VERSIONS_DIR,)
+        )
+
+    def get_archive_checksums(self, dataset: DataSet) -> dict:
+        """The stored checksums of the dataset's files, by name inside its archive."""
+        return {
+            f"dataset_{dataset.id}/{file.name}": file.checksum
+            for feature_model in dataset.feature_models
+            for file in feature_model.files
+            if file.checksum
+        }
+
+    def prebuild_archive(self, dataset: DataSet):
+        entries = self.get_archive_entries(dataset)
+        cache = get_archive_cache()
+        return cache.build_async(cache.key_for(entries, self.get_archive_checksums(dataset)), entries)
+
+    def deduplicate_files(self) -> int:
+        """
+        Moves the files of every dataset and version into the blob store, replacing duplicates with links. Files
+        are keyed by a checksum of their current content. Returns the number of files whose duplicate data was freed.
+        Only local storage has a blob store: object stores cannot link files.
+        """
+        storage = get_storage()
+        if not isinstance(storage, LocalStorage) or storage.blob_store is None:
+            return 0
+
+        paths = []
+        for dataset in BaseDataset.query.order_by(BaseDataset.id):
+            paths += [
+                storage.path(dataset_key(dataset.user_id, dataset.id, file.name))
+                for fm in dataset.feature_models
+                for file in fm.files
+            ]
+            for version in dataset.versions:
+                if version.manifest and version.snapshot_path and os.path.isdir(version.snapshot_path):
+                    paths += [os.path.join(version.snapshot_path, entry["name"]) for entry in version.manifest["files"]]
+
+        paths = [path for path in paths if os.path.isfile(path)]
+        freed = 0
+        for path, (checksum, _) in zip(paths, file_checksums(paths, "md5")):
+            freed += storage.blob_store.adopt(path, checksum)
+        return freed
 
     def get_synchronized(self, current_user_id: int) -> DataSet:
         return self.repository.get_synchronized(current_user_id)
@@ -108,7 +162,14 @@ class DataSetService(BaseService):
 
             dataset = self.create(commit=False, user_id=current_user.id, ds_meta_data_id=dsmetadata.id)
 
-            for feature_model in form.feature_models:
+            # Uploaded files were hashed while being saved; any others are hashed here, in parallel
+            file_paths = [
+                os.path.join(current_user.temp_folder(), feature_model.filename.data)
+                for feature_model in form.feature_models
+            ]
+            checksums = file_checksums(file_paths, "md5")
+
+            for feature_model, (checksum, size) in zip(form.feature_models, checksums):
                 filename = feature_model.filename.data
                 fmmetadata = self.fmmetadata_repository.create(commit=False, **feature_model.get_fmmetadata())
                 for author_data in feature_model.get_authors():
@@ -120,9 +181,6 @@ class DataSetService(BaseService):
                 )
 
                 # associated files in feature model
-                file_path = os.path.join(current_user.temp_folder(), filename)
-                checksum, size = calculate_checksum_and_size(file_path)
-
                 file = self.hubfilerepository.create(
                     commit=False, name=filename, checksum=checksum, size=size, feature_model_id=fm.id
                 )
@@ -141,10 +199,47 @@ class DataSetService(BaseService):
         domain = os.getenv("DOMAIN", "localhost")
         return f"http://{domain}/doi/{dataset.ds_meta_data.dataset_doi}"
 
-    def compare_versions(self, dataset_id: int, v1_id: int = None, v2_id: int = None):
-        import difflib
-        from flask import abort
+    def build_version_manifest(self, dataset: DataSet) -> dict:
+        files = [
+            {"name": file.name, "checksum": file.checksum, "size": file.size}
+            for fm in dataset.feature_models
+            for file in fm.files
+        ]
+        return {
+            "metadata": dataset.ds_meta_data.to_dict() if dataset.ds_meta_data else {},
+            "files": sorted(files, key=lambda f: f["name"]),
+        }
+
+    def create_version(self, dataset: DataSet, version_number: str = None) -> Version:
+        """Crea una nueva versión del dataset guardando su manifiesto y una copia de sus ficheros."""
+
+        version = Version(
+            dataset_id=dataset.id,
+            version_number=version_number or dataset.current_version or str(len(dataset.versions) + 1),
+            created_at=datetime.utcnow(),
+        )
+        self.repository.session.add(version)
+        self.repository.session.flush()
+
+        storage = get_storage()
+        version_key = dataset_key(dataset.user_id, dataset.id, VERSIONS_DIR, str(version.id))
+
+        manifest = self.build_version_manifest(dataset)
+        for entry in manifest["files"]:
+            storage.copy(
+                dataset_key(dataset.user_id, dataset.id, entry["name"]),
+                f"{version_key}/{entry['name']}",
+                entry["checksum"],
+            )
+
+        version.snapshot_path = storage.location(version_key)
+        version.manifest = manifest
+        dataset.current_version = version.version_number
 
+        self.repository.session.commit()
+        return version
+
+    def compare_versions(self, dataset_id: int, v1_id: int = None, v2_id: int = None):
         dataset = DataSet.query.get(dataset_id)
         if not dataset:
             abort(404, "Dataset not found.")
@@ -184,12 +279,15 @@ class DataSetService(BaseService):
                 "error": "Selected versions not found.",
             }
 
-        # Comparar metadatos (ejemplo simplificado)
-        meta1 = v1.dataset.ds_meta_data.to_dict() if v1.dataset and v1.dataset.ds_meta_data else {}
-        meta2 = v2.dataset.ds_meta_data.to_dict() if v2.dataset and v2.dataset.ds_meta_data else {}
+        manifest1 = v1.manifest or {}
+        manifest2 = v2.manifest or {}
+
+        # Comparar metadatos guardados en cada versión
+        meta1 = manifest1.get("metadata", {})
+        meta2 = manifest2.get("metadata", {})
 
         metadata_diff = []
-        for key in set(meta1.keys()) | set(meta2.keys()):
+        for key in sorted(set(meta1.keys()) | set(meta2.keys())):
             if meta1.get(key) != meta2.get(key):
                 metadata_diff.append({
                     "field": key,
@@ -197,18 +295,78 @@ class DataSetService(BaseService):
                     "new_value": meta2.get(key),
                 })
 
+        # Comparar ficheros por checksum: los que no cambian no se leen
+        files1 = {f["name"]: f for f in manifest1.get("files", [])}
+        files2 = {f["name"]: f for f in manifest2.get("files", [])}
+
+        added_files = sorted(files2.keys() - files1.keys())
+        deleted_files = sorted(files1.keys() - files2.keys())
+        modified_files = sorted(
+            name for name in files1.keys() & files2.keys() if files1[name]["checksum"] != files2[name]["checksum"]
+        )
+
         return {
             "dataset": dataset,
             "versions": versions,
             "v1": v1,
             "v2": v2,
             "metadata_diff": metadata_diff,
-            "added_files": [],
-            "deleted_files": [],
-            "modified_files": [],
-            "text_diffs": {},
+            "added_files": added_files,
+            "deleted_files": deleted_files,
+            "modified_files": modified_files,
+            "text_diffs": self._text_diffs(v1, v2, [files2[name] for name in modified_files]),
         }
 
+    def _text_diffs(self, v1: Version, v2: Version, modified_files: list) -> dict:
+        """
+        Computes the HTML diffs of the modified UVL files in the process pool, capped in size, time and memory: a
+        diff that overruns VERSION_DIFF_TIMEOUT has its worker process killed.
+        """
+        max_bytes = current_app.config.get("VERSION_DIFF_MAX_BYTES", 512 * 1024)
+        timeout = current_app.config.get("VERSION_DIFF_TIMEOUT", 20)
+        memory_limit = current_app.config.get("VERSION_DIFF_MEMORY_LIMIT")
+
+        storage = get_storage()
+        text_diffs = {}
+        futures = {}
+        for entry in modified_files:
+            name = entry["name"]
+            if not name.endswith(".uvl") or not v1.snapshot_path or not v2.snapshot_path:
+                continue
+            if entry["size"] > max_bytes:
+                text_diffs[name] = f'<p class="text-muted">File too large to diff ({entry["size"]} bytes).</p>'
+                continue
+            try:
+                # Snapshots in an object store are diffed from local copies
+                old_path = storage.fetch(f"{v1.snapshot_path}/{name}")
+                new_path = storage.fetch(f"{v2.snapshot_path}/{name}")
+            except FileNotFoundError:
+                continue
+            futures[name] = get_process_pool().submit(
+                html_text_diff,
+                old_path,
+                new_path,
+                f"Version {v1.version_number}",
+                f"Version {v2.version_number}",
+                max_bytes,
+                timeout=timeout,
+                memory_limit=memory_limit,
+            )
+
+        for name, future in futures.items():
+            try:
+                html = future.result()
+            except TaskTimeout:
+                html = '<p class="text-muted">Diff took too long to compute.</p>'
+            except Exception as exc:
+                logger.warning(f"Diff of {name} failed: {exc}")
+                html = '<p class="text-muted">Diff could not be computed.</p>'
+            if html is None:
+                html = '<p class="text-muted">File too large to diff.</p>'
+            text_diffs[name] = html
+
+        return text_diffs
+
 
 class AuthorService(BaseService):
     def __init__(self):
@@ -247,10 +405,12 @@ class DSViewRecordService(BaseService):
         if not user_cookie:
             user_cookie = str(uuid.uuid4())
 
-        existing_record = self.the_record_exists(dataset=dataset, user_cookie=user_cookie)
-
-        if not existing_record:
-            self.create_new_record(dataset=dataset, user_cookie=user_cookie)
+        record_pipeline.record(
+            "dataset_view",
+            target_id=dataset.id,
+            cookie=user_cookie,
+            user_id=current_user.id if current_user.is_authenticated else None,
+        )
 
         return user_cookie
 
@@ -281,3 +441,179 @@ class SizeService:
             return f"{round(size / (1024 ** 2), 2)} MB"
         else:
             return f"{round(size / (1024 ** 3), 2)} GB"
+
+
+# Latest UploadProgress snapshot of the publications uploading files in this process, saved by the heartbeats
+_upload_progress: Dict[int, dict] = {}
+
+
+class PublicationService(BaseService):
+    """
+    Publishes datasets to Zenodo in the background, as a state machine persisted in PublicationJob:
+
+        created -> files_uploaded -> published -> doi_assigned
+
+    Every step is committed as soon as it completes, and the deposition id as soon as the deposition exists, so a
+    publication interrupted by a crash or a restart resumes from its last completed step when a worker claims it
+    again (see LeaseWorker). Uploading a file again replaces it in the deposition bucket, and a deposition found
+    already published counts as published. Failed steps are retried with exponential backoff, up to
+    PUBLICATION_MAX_ATTEMPTS times in a row.
+    """
+
+    def __init__(self):
+        super().__init__(PublicationJobRepository())
+        self.dataset_repository = DataSetRepository()
+        self.dsmetadata_repository = DSMetaDataRepository()
+        self.user_repository = UserRepository()
+        self.zenodo_service = ZenodoService()
+        # state -> step that takes a job out of it
+        self.steps = {
+            PublicationJob.CREATED: self.upload_files,
+            PublicationJob.FILES_UPLOADED: self.publish,
+            PublicationJob.PUBLISHED: self.assign_doi,
+        }
+
+    def submit(self, dataset: DataSet) -> PublicationJob:
+        """Queues the publication of a dataset. A failed publication is resumed from its last completed step."""
+        job = self.repository.get_by_dataset(dataset.id)
+        if job is None:
+            job = self.repository.create(
+                dataset_id=dataset.id, state=PublicationJob.CREATED, status=PublicationJob.PENDING, attempts=0
+            )
+        elif job.status == PublicationJob.FAILED:
+            job.status, job.attempts, job.error, job.next_attempt_at = PublicationJob.PENDING, 0, None, None
+            self.repository.session.commit()
+        publication_worker.wake()
+        return job
+
+    def get_by_dataset(self, dataset_id: int) -> Optional[PublicationJob]:
+        return self.repository.get_by_dataset(dataset_id)
+
+    def claim_due(self, limit: int, owner: str) -> List[int]:
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=current_app.config["PUBLICATION_LEASE"])
+        return self.repository.claim_due(limit, owner, now, stale_before)
+
+    def heartbeat(self, job_ids: List[int], owner: str):
+        progress = {job_id: _upload_progress[job_id] for job_id in job_ids if job_id in _upload_progress}
+        self.repository.heartbeat(job_ids, owner, datetime.utcnow(), progress)
+
+    def run(self, job_id: int, owner: str):
+        """Runs the remaining steps of a job claimed by owner, stopping at the first failure."""
+        session = self.repository.session
+        job = self.repository.get(job_id)
+        dataset = self.dataset_repository.get_by_id(job.dataset_id) if job else None
+        if dataset is None:
+            return
+
+        while job.state in self.steps:
+            if not self._holds_lease(job, owner):
+                return
+            step = job.state
+            try:
+                self.steps[step](job, dataset)
+            except Exception as exc:
+                session.rollback()
+                if self._holds_lease(job, owner, lock=True):
+                    self._failed(job, step, exc)
+                return
+            if not self._holds_lease(job, owner, lock=True):
+                return
+            job.state = PublicationJob.STATES[PublicationJob.STATES.index(step) + 1]
+            job.attempts, job.error, job.heartbeat_at = 0, None, datetime.utcnow()
+            session.commit()
+            logger.info(f"Publication of dataset {job.dataset_id}: {job.state}")
+
+        if not self._holds_lease(job, owner, lock=True):
+            return
+        job.status, job.locked_by = PublicationJob.COMPLETED, None
+        session.commit()
+        self._published(dataset)
+
+    def _holds_lease(self, job: PublicationJob, owner: str, lock: bool = False) -> bool:
+        """
+        Rereads the job and tells whether owner still holds its lease, rolling back otherwise. With lock, the job's
+        row stays locked until the next commit, so no other worker can claim it before the transition is stored.
+        """
+        session = self.repository.session
+        if lock:
+            session.flush()
+            session.refresh(job, with_for_update=True)
+        else:
+            session.refresh(job)
+        if job.status == PublicationJob.RUNNING and job.locked_by == owner:
+            return True
+        logger.warning(f"Publication of dataset {job.dataset_id} was claimed by another worker")
+        session.rollback()
+        return False
+
+    def upload_files(self, job: PublicationJob, dataset: DataSet):
+        """created -> files_uploaded: creates the deposition, once, and uploads the feature models to it."""
+        if job.deposition_id is None:
+            deposition = self.zenodo_service.create_new_deposition(dataset)
+            job.deposition_id = deposition["id"]
+            job.bucket_url = (deposition.get("links") or {}).get("bucket")
+            # Commits the job too: a retry must upload to this deposition instead of creating another one
+            self.dsmetadata_repository.update(dataset.ds_meta_data_id, deposition_id=job.deposition_id)
+
+        job_id = job.id
+        deposition = {"id": job.deposition_id, "links": {"bucket": job.bucket_url} if job.bucket_url else {}}
+        user = self.user_repository.get_by_id(dataset.user_id)
+        try:
+            progress = self.zenodo_service.upload_files(
+                dataset,
+                deposition,
+                dataset.feature_models,
+                user,
+                lambda snapshot: _upload_progress.update({job_id: snapshot}),
+            )
+        finally:
+            _upload_progress.pop(job_id, None)
+        job.progress = progress.snapshot()
+
+    def publish(self, job: PublicationJob, dataset: DataSet):
+        """files_uploaded -> published"""
+        try:
+            self.zenodo_service.publish_deposition(job.deposition_id)
+        except Exception:
+            # The deposition may have been published by an attempt interrupted before it was recorded
+            if not self.zenodo_service.get_deposition(job.deposition_id).get("submitted"):
+                raise
+
+    def assign_doi(self, job: PublicationJob, dataset: DataSet):
+        """published -> doi_assigned"""
+        doi = self.zenodo_service.get_doi(job.deposition_id)
+        if not doi:
+            raise Exception(f"Deposition {job.deposition_id} has no DOI yet")
+        job.doi = doi
+        self.dsmetadata_repository.update(dataset.ds_meta_data_id, dataset_doi=doi)
+
+    def _failed(self, job: PublicationJob, step: str, exc: Exception):
+        config = current_app.config
+        job.attempts += 1
+        job.error = str(exc)
+        job.locked_by = None
+        if job.attempts >= config["PUBLICATION_MAX_ATTEMPTS"]:
+            job.status, job.next_attempt_at = PublicationJob.FAILED, None
+            logger.error(f"Publication of dataset {job.dataset_id} failed in state {step}, giving up: {exc}")
+        else:
+            delay = min(config["PUBLICATION_BACKOFF"] * 2 ** (job.attempts - 1), 3600)
+            job.status, job.next_attempt_at = PublicationJob.PENDING, datetime.utcnow() + timedelta(seconds=delay)
+            logger.warning(
+                f"Publication of dataset {job.dataset_id} failed in state {step}, retrying in {delay:g}s: {exc}"
+            )
+        self.repository.session.commit()
+
+    def _published(self, dataset: DataSet):
+        try:
+            # build the download archive now that the dataset is public
+            DataSetService().prebuild_archive(dataset)
+        except Exception:
+            logger.exception(f"Exception after publishing dataset {dataset.id}")
+
+
+publication_worker.register(
+    claim=lambda limit, owner: PublicationService().claim_due(limit, owner),
+    run=lambda job_id, owner: PublicationService().run(job_id, owner),
+    heartbeat=lambda job_ids, owner: PublicationService().heartbeat(job_ids, owner),
+)
@@ -0,0 +1,388 @@
+import hashlib
+import io
+import os
+import threading
+import zipfile
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.modules.dataset.services import DataSetService
+from core.archives.cache import ArchiveCache
+from core.archives.zipstream import collect_entries, stream_zip
+from core.diffs.text_diff import html_text_diff
+from core.storage.hashing import file_checksum, file_checksums, save_stream
+
+
+def _version(id, snapshot_path, files, title="Dataset"):
+    return SimpleNamespace(
+        id=id,
+        version_number=f"{id}.0",
+        snapshot_path=str(snapshot_path),
+        manifest={"metadata": {"title": title}, "files": files},
+    )
+
+
+def test_html_text_diff_respects_size_cap(tmp_path):
+    old = tmp_path / "old.uvl"
+    new = tmp_path / "new.uvl"
+    old.write_text("features\n    Root\n")
+    new.write_text("features\n    Root\n        optional\n            A\n")
+
+    html = html_text_diff(str(old), str(new), "v1", "v2")
+    assert html is not None
+    assert "optional" in html
+
+    assert html_text_diff(str(old), str(new), max_bytes=4) is None
+
+
+def test_compare_versions_diffs_files_by_checksum(test_app, tmp_path):
+    v1_dir = tmp_path / "v1"
+    v2_dir = tmp_path / "v2"
+    v1_dir.mkdir()
+    v2_dir.mkdir()
+    (v1_dir / "changed.uvl").write_text("features\n    Root\n")
+    (v2_dir / "changed.uvl").write_text("features\n    Car\n")
+
+    v1 = _version(
+        1,
+        v1_dir,
+        [
+            {"name": "same.uvl", "checksum": "aaa", "size": 10},
+            {"name": "changed.uvl", "checksum": "bbb", "size": 18},
+            {"name": "deleted.uvl", "checksum": "ccc", "size": 10},
+        ],
+    )
+    v2 = _version(
+        2,
+        v2_dir,
+        [
+            {"name": "same.uvl", "checksum": "aaa", "size": 10},
+            {"name": "changed.uvl", "checksum": "ddd", "size": 17},
+            {"name": "added.uvl", "checksum": "eee", "size": 10},
+        ],
+        title="Dataset renamed",
+    )
+    dataset = SimpleNamespace(id=7, versions=[v1, v2])
+
+    with patch("app.modules.dataset.services.DataSet") as mock_dataset, patch(
+        "app.modules.dataset.services.get_process_pool"
+    ) as mock_pool:
+        mock_dataset.query.get.return_value = dataset
+        mock_pool.return_value.submit.side_effect = lambda fn, *args, **options: SimpleNamespace(
+            result=lambda timeout=None: fn(*args)
+        )
+        with test_app.test_request_context():
+            context = DataSetService().compare_versions(7, 1, 2)
+
+    assert context["added_files"] == ["added.uvl"]
+    assert context["deleted_files"] == ["deleted.uvl"]
+    assert context["modified_files"] == ["changed.uvl"]
+    assert list(context["text_diffs"].keys()) == ["changed.uvl"]
+    assert context["metadata_diff"] == [{"field": "title", "old_value": "Dataset", "new_value": "Dataset renamed"}]
+
+
+def test_stream_zip_builds_valid_archive(tmp_path):
+    dataset_dir = tmp_path / "dataset_1"
+    (dataset_dir / "versions" / "1").mkdir(parents=True)
+    (dataset_dir / "model.uvl").write_text("features\n    Root\n" * 1000)
+    (dataset_dir / "poster.jpg").write_bytes(b"\xff\xd8" + bytes(range(256)) * 10)
+    (dataset_dir / "versions" / "1" / "model.uvl").write_text("features\n    Root\n")
+
+    # Version snapshots are copies of the dataset files: they stay out of its archive
+    entries = collect_entries(str(dataset_dir), "dataset_1", exclude=("versions",))
+    chunks = list(stream_zip(entries, chunk_size=512))
+
+    assert len(chunks) > 1
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.testzip() is None
+        assert sorted(zf.namelist()) == [
+            "dataset_1/model.uvl",
+            "dataset_1/poster.jpg",
+        ]
+        assert zf.getinfo("dataset_1/poster.jpg").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("dataset_1/model.uvl").compress_type == zipfile.ZIP_DEFLATED
+        assert zf.read("dataset_1/model.uvl") == (dataset_dir / "model.uvl").read_bytes()
+
+
+def test_archive_cache_shares_builds_and_evicts_lru(tmp_path):
+    dataset_dir = tmp_path / "dataset_1"
+    dataset_dir.mkdir()
+    (dataset_dir / "model.uvl").write_text("features\n    Root\n")
+    entries = collect_entries(str(dataset_dir), "dataset_1")
+
+    cache = ArchiveCache(str(tmp_path / "archives"), max_bytes=10**6)
+    key = cache.key_for(entries)
+    assert cache.get(key) is None
+
+    gate = threading.Event()
+    real_build = cache._build
+
+    def gated_build(*args):
+        gate.wait(timeout=10)
+        return real_build(*args)
+
+    with patch.object(cache, "_build", side_effect=gated_build) as build:
+        first = cache.build_async(key, entries)
+        second = cache.build_async(key, entries)
+        gate.set()
+        assert first.result(timeout=10) == second.result(timeout=10) == cache.path_for(key)
+    assert first is second
+    assert build.call_count == 1
+    assert cache.get(key) == cache.path_for(key)
+
+    # Changing a file changes the manifest hash
+    (dataset_dir / "model.uvl").write_text("features\n    Car\n")
+    new_key = cache.key_for(entries)
+    assert new_key != key
+
+    cache.max_bytes = 1
+    cache.build_async(new_key, entries).result(timeout=10)
+    assert cache.get(key) is None
+
+
+def test_archive_clients_follow_the_build_instead_of_waiting_for_it(tmp_path):
+    import pytest
+
+    from core.archives.cache import ArchiveBuildFailed
+
+    dataset_dir = tmp_path / "dataset_1"
+    dataset_dir.mkdir()
+    (dataset_dir / "model.uvl").write_text("features\n    Root\n")
+    entries = collect_entries(str(dataset_dir), "dataset_1")
+    cache = ArchiveCache(str(tmp_path / "archives"), max_bytes=10**6)
+    key = cache.key_for(entries, {"dataset_1/model.uvl": "abc"})
+
+    # Keys follow the stored checksums, not file times
+    os.utime(dataset_dir / "model.uvl", (0, 0))
+    assert cache.key_for(entries, {"dataset_1/model.uvl": "abc"}) == key
+    assert cache.key_for(entries, {"dataset_1/model.uvl": "abd"}) != key
+
+    assert cache.follow(key, timeout=0.1) is None  # not being built
+    gate = threading.Event()
+
+    def slow_zip(entries):
+        yield b"first"
+        gate.wait(timeout=10)
+        yield b"second"
+
+    with patch("core.archives.cache.stream_zip", side_effect=slow_zip):
+        build = cache.build_async(key, entries)
+        chunks = cache.follow(key, timeout=5)
+        assert next(chunks) == b"first"
+        # The build holds the lock: nobody builds the archive again, here or in another process
+        assert cache._build(key, entries) is None
+        gate.set()
+        assert b"".join(chunks) == b"second"
+    assert build.result(timeout=10) == cache.get(key)
+    with open(cache.get(key), "rb") as f:
+        assert f.read() == b"firstsecond"
+    assert sorted(os.listdir(cache.cache_dir)) == [f"{key}.zip"]
+
+    # Followers of a build that fails are told so instead of getting a truncated archive silently
+    def failing_zip(entries):
+        yield b"first"
+        gate.wait(timeout=10)
+        raise OSError("disk full")
+
+    gate.clear()
+    with patch("core.archives.cache.stream_zip", side_effect=failing_zip):
+        build = cache.build_async("other", entries)
+        chunks = cache.follow("other", timeout=5)
+        assert next(chunks) == b"first"
+        gate.set()
+        with pytest.raises(ArchiveBuildFailed):
+            b"".join(chunks)
+    with pytest.raises(OSError):
+        build.result(timeout=10)
+    assert cache.get("other") is None and sorted(os.listdir(cache.cache_dir)) == [f"{key}.zip"]
+
+
+def test_record_pipeline_dedups_and_applies_backpressure():
+    from core.ingestion.pipeline import RecordPipeline
+
+    pipeline = RecordPipeline()
+    pipeline.init_app(
+        SimpleNamespace(config={"EVENT_QUEUE_MAXSIZE": 1, "EVENT_QUEUE_PUT_TIMEOUT": 0.01, "EVENT_DEDUP_SIZE": 2})
+    )
+
+    with patch.object(pipeline, "write") as write, patch.object(pipeline, "_ensure_worker"):
+        write.side_effect = lambda events: pipeline._settle(events, written=True)
+        assert pipeline.record("dataset_view", target_id=1, cookie="a") is True
+        assert pipeline.record("dataset_view", target_id=1, cookie="a") is False  # queued already
+        assert write.call_count == 0
+
+        # The queue holds a single event: the next one is written inline instead of being dropped
+        assert pipeline.record("dataset_view", target_id=2, cookie="a") is True
+        assert write.call_count == 1
+        assert write.call_args[0][0][0].target_id == 2
+
+        pipeline.flush()
+        assert write.call_count == 2
+        assert write.call_args[0][0][0].target_id == 1
+        assert pipeline.record("dataset_view", target_id=1, cookie="a") is False  # written recently
+
+        # Only the most recently written identities are remembered
+        pipeline.record("dataset_view", target_id=3, cookie="a")
+        pipeline.flush()
+        assert pipeline.record("dataset_view", target_id=2, cookie="a") is True
+        pipeline.flush()
+
+
+def test_record_pipeline_isolates_events_that_fail_to_write():
+    from core.ingestion.pipeline import RecordPipeline
+
+    pipeline = RecordPipeline()
+    pipeline.init_app(SimpleNamespace(config={"EVENT_WRITE_ATTEMPTS": 2}))
+    pipeline.app = SimpleNamespace(app_context=threading.Lock)
+    stored = []
+
+    def insert(session, events):
+        if any(event.target_id == 404 for event in events):
+            raise Exception("foreign key constraint fails")
+        stored.extend(event.target_id for event in events)
+
+    session = SimpleNamespace(rollback=lambda: None, remove=lambda: None)
+    with patch.object(pipeline, "_insert", side_effect=insert) as insert_mock, patch(
+        "app.db", SimpleNamespace(session=session)
+    ), patch.object(pipeline, "_ensure_worker"), patch("core.ingestion.pipeline.time.sleep"):
+        for target_id in (1, 404, 2):
+            pipeline.record("dataset_view", target_id=target_id, cookie="a")
+        pipeline.flush()
+
+        # The batch failed: its good events were written one by one, the bad one was retried and dropped
+        assert stored == [1, 2]
+        assert insert_mock.call_count == 1 + 1 + 2 + 1
+        assert pipeline.dropped == 1
+        assert pipeline.record("dataset_view", target_id=1, cookie="a") is False
+        assert pipeline.record("dataset_view", target_id=404, cookie="a") is True
+        pipeline.flush()
+        assert pipeline.dropped == 2
+
+
+def test_record_pipeline_registers_its_exit_handler_once():
+    from core.ingestion.pipeline import RecordPipeline
+
+    pipeline = RecordPipeline()
+    with patch("core.ingestion.pipeline.atexit.register") as register:
+        pipeline.init_app(SimpleNamespace(config={}))
+        pipeline.init_app(SimpleNamespace(config={}))
+    register.assert_called_once_with(pipeline.shutdown)
+
+
+def test_checksums_are_streamed_and_remembered(tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    path = str(tmp_path / "model.uvl")
+
+    assert save_stream(io.BytesIO(data), path, chunk_size=64 * 1024) == (hashlib.md5(data).hexdigest(), len(data))
+    assert open(path, "rb").read() == data
+
+    # The remembered checksum is reused, and ignored once the file changes
+    with patch("core.storage.hashing.hashlib.new") as new:
+        assert file_checksum(path) == (hashlib.md5(data).hexdigest(), len(data))
+        new.assert_not_called()
+    with open(path, "ab") as file:
+        file.write(b"x")
+    assert file_checksum(path) == (hashlib.md5(data + b"x").hexdigest(), len(data) + 1)
+
+    others = []
+    for i in range(4):
+        other = tmp_path / f"other{i}.uvl"
+        other.write_bytes(data[i:])
+        others.append(str(other))
+    assert file_checksums(others, "sha256") == [(hashlib.sha256(data[i:]).hexdigest(), len(data) - i) for i in range(4)]
+
+
+def test_publication_resumes_from_last_completed_step(test_app, tmp_path):
+    from unittest.mock import MagicMock
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from app.modules.dataset.models import PublicationJob
+    from app.modules.dataset.services import PublicationService
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'publication.db'}", connect_args={"check_same_thread": False})
+    PublicationJob.__table__.create(engine)
+    dataset = SimpleNamespace(id=5, user_id=1, ds_meta_data_id=6, feature_models=[])
+    service = PublicationService()
+    service.repository.session = Session(engine)
+    service.dataset_repository = MagicMock(**{"get_by_id.return_value": dataset})
+    service.dsmetadata_repository = MagicMock()
+    service.user_repository = MagicMock()
+    zenodo = service.zenodo_service = MagicMock()
+    zenodo.create_new_deposition.return_value = {"id": 7, "links": {"bucket": "http://zenodo/bucket"}}
+    zenodo.upload_files.return_value.snapshot.return_value = {"files_done": 0, "files_total": 0}
+    zenodo.publish_deposition.side_effect = Exception("Failed to publish deposition")
+    zenodo.get_deposition.return_value = {"submitted": False}
+    zenodo.get_doi.return_value = "10.5281/zenodo.7"
+
+    with test_app.app_context(), patch.object(service, "_published") as published:
+        test_app.config.update(PUBLICATION_BACKOFF=0, PUBLICATION_LEASE=60, PUBLICATION_MAX_ATTEMPTS=3)
+        job = service.submit(dataset)
+        assert service.claim_due(2, "web-1:10") == [job.id]
+        assert service.claim_due(2, "web-2:20") == []  # leased to web-1
+
+        # The files are uploaded, then publishing fails: the job waits for a retry after the last completed step
+        service.run(job.id, "web-1:10")
+        assert (job.state, job.status, job.attempts, job.deposition_id) == ("files_uploaded", "pending", 1, 7)
+        assert job.to_dict()["steps"] == {
+            "created": True, "files_uploaded": True, "published": False, "doi_assigned": False
+        }
+
+        # web-1 claims it again and dies before finishing: once the lease expires, web-2 takes over
+        assert service.claim_due(1, "web-1:10") == [job.id]
+        test_app.config["PUBLICATION_LEASE"] = 0
+        assert service.claim_due(1, "web-2:20") == [job.id]
+
+        # The lost attempt did publish the deposition: it is recognised instead of failing again
+        zenodo.get_deposition.return_value = {"submitted": True}
+        service.run(job.id, "web-2:20")
+        published.assert_called_once_with(dataset)
+
+        # The stale worker no longer owns the job: it neither completes nor publishes it again
+        completed = job.to_dict()
+        service.run(job.id, "web-1:10")
+        published.assert_called_once_with(dataset)
+        assert job.to_dict() == completed
+
+    assert (job.state, job.status, job.doi, job.locked_by) == ("doi_assigned", "completed", "10.5281/zenodo.7", None)
+    zenodo.create_new_deposition.assert_called_once()
+    zenodo.upload_files.assert_called_once()
+    assert zenodo.upload_files.call_args[0][1] == {"id": 7, "links": {"bucket": "http://zenodo/bucket"}}
+    service.dsmetadata_repository.update.assert_any_call(6, deposition_id=7)
+    service.dsmetadata_repository.update.assert_called_with(6, dataset_doi="10.5281/zenodo.7")
+
+
+def test_process_pool_kills_tasks_that_overrun_their_timeout():
+    import time
+
+    import pytest
+
+    from core.workers.killable import KillablePool, TaskTimeout
+
+    pool = KillablePool(max_workers=1)
+    try:
+        started = time.monotonic()
+        with pytest.raises(TaskTimeout):
+            pool.submit(time.sleep, 30, timeout=1).result()
+        assert time.monotonic() - started < 10
+
+        # The worker was replaced: later tasks run, and none may allocate past its memory limit
+        assert pool.submit(pow, 2, 10, timeout=30).result() == 1024
+        with pytest.raises(MemoryError):
+            pool.submit(bytearray, 2 * 1024**3, timeout=30, memory_limit=512 * 1024**2).result()
+        assert pool.submit(bytearray, 1024, timeout=30).result() == bytearray(1024)
+    finally:
+        pool.shutdown()
+
+
+def test_lease_worker_registers_its_exit_handler_once():
+    from flask import Flask
+
+    from core.jobs.worker import LeaseWorker
+
+    worker = LeaseWorker("TEST")
+    with patch("core.jobs.worker.atexit.register") as register:
+        worker.init_app(Flask("first"))
+        worker.init_app(Flask("second"))
+    register.assert_called_once_with(worker.shutdown)
@@ -5,6 +5,7 @@ from sqlalchemy import any_, or_
 
 from app.modules.dataset.models import Author, DSMetaData, PublicationType
 from app.modules.movie.models import MovieDataset, Movie
+from app.modules.stats.models import StatsTrending
 from core.repositories.BaseRepository import BaseRepository
 
 
@@ -61,8 +62,15 @@ class ExploreRepository(BaseRepository):
 
         datasets = datasets.distinct()
 
-        # Order by created_at
-        if sorting == "oldest":
+        # Order by trending score (datasets nobody has looked at yet last), or by created_at
+        if sorting == "trending":
+            matching_ids = datasets.with_entities(MovieDataset.id).subquery()
+            datasets = (
+                MovieDataset.query.filter(MovieDataset.id.in_(matching_ids.select()))
+                .outerjoin(StatsTrending, StatsTrending.dataset_id == MovieDataset.id)
+                .order_by(StatsTrending.score.is_(None), StatsTrending.score.desc(), MovieDataset.created_at.desc())
+            )
+        elif sorting == "oldest":
             datasets = datasets.order_by(MovieDataset.created_at.asc())
         else:
             datasets = datasets.order_by(MovieDataset.created_at.desc())
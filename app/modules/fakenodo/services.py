@@ -1,7 +1,6 @@
-import hashlib
-
 from app.modules.fakenodo.repositories import FakenodoRepository
 from core.services.BaseService import BaseService
+from core.storage.hashing import file_checksum
 from app.modules.movie.models import MovieDataset, BaseDataset
 from app.modules.featuremodel.models import FeatureModel
 from app.modules.fakenodo.models import Fakenodo
@@ -75,11 +74,10 @@ class FakenodoService(BaseService):
         }
         return response
     
+    @staticmethod
     def checksum(fileName):
         try:
-            with open(fileName, "rb") as file:
-                file_content = file.read()
-                res = hashlib.sha256(file_content).hexdigest()
+            res, _ = file_checksum(fileName, "sha256")
             return res
         except FileNotFoundError:
             raise Exception(f"File {fileName} not found for checksum calculation")
@@ -1,3 +1,5 @@
+import json
+
 from sqlalchemy import Enum as SQLAlchemyEnum
 
 from app import db
@@ -37,8 +39,22 @@ class FMMetaData(db.Model):
 
 class FMMetrics(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    # Checksum of the UVL file the metrics were computed from: files with the same content share one row
+    checksum = db.Column(db.String(64), unique=True, index=True)
+    # JSON documents of the analyses that need the SAT/BDD solvers and of those that do not
     solver = db.Column(db.Text)
     not_solver = db.Column(db.Text)
+    error = db.Column(db.Text)
+    computed_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            "checksum": self.checksum,
+            "solver": json.loads(self.solver) if self.solver else None,
+            "not_solver": json.loads(self.not_solver) if self.not_solver else None,
+            "error": self.error,
+            "computed_at": self.computed_at.isoformat() if self.computed_at else None,
+        }
 
     def __repr__(self):
         return f"FMMetrics<solver={self.solver}, not_solver={self.not_solver}>"
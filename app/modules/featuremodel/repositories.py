@@ -1,6 +1,8 @@
+from typing import Optional
+
 from sqlalchemy import func
 
-from app.modules.featuremodel.models import FeatureModel, FMMetaData
+from app.modules.featuremodel.models import FeatureModel, FMMetaData, FMMetrics
 from core.repositories.BaseRepository import BaseRepository
 
 
@@ -16,3 +18,11 @@ class FeatureModelRepository(BaseRepository):
 class FMMetaDataRepository(BaseRepository):
     def __init__(self):
         super().__init__(FMMetaData)
+
+
+class FMMetricsRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(FMMetrics)
+
+    def get_by_checksum(self, checksum: str) -> Optional[FMMetrics]:
+        return self.session.query(FMMetrics).filter_by(checksum=checksum).one_or_none()
@@ -1,7 +1,20 @@
-from app.modules.flamapy.models import Flamapy
+from typing import List
+
+from app.modules.featuremodel.models import FeatureModel, FMMetaData
+from app.modules.hubfile.models import Hubfile
 from core.repositories.BaseRepository import BaseRepository
 
 
 class FlamapyRepository(BaseRepository):
     def __init__(self):
-        super().__init__(Flamapy)
+        super().__init__(Hubfile)
+
+    def unanalysed_with_checksum(self, checksum: str) -> List[Hubfile]:
+        """Hubfiles with this content whose feature model has no metrics attached yet."""
+        return (
+            self.session.query(Hubfile)
+            .join(FeatureModel, Hubfile.feature_model_id == FeatureModel.id)
+            .join(FMMetaData, FeatureModel.fm_meta_data_id == FMMetaData.id)
+            .filter(Hubfile.checksum == checksum, FMMetaData.fm_metrics_id.is_(None))
+            .all()
+        )
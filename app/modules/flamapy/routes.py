@@ -1,116 +1,205 @@
 import logging
-import os
-import tempfile
+from datetime import datetime
 
-from antlr4 import CommonTokenStream, FileStream
-from antlr4.error.ErrorListener import ErrorListener
-from flamapy.metamodels.fm_metamodel.transformations import GlencoeWriter, SPLOTWriter, UVLReader
-from flamapy.metamodels.pysat_metamodel.transformations import DimacsWriter, FmToPysat
-from flask import jsonify, send_file
-from uvl.UVLCustomLexer import UVLCustomLexer
-from uvl.UVLPythonParser import UVLPythonParser
+from flask import Response, abort, jsonify, request, url_for
 
+from app.modules.dataset.services import DataSetService
 from app.modules.flamapy import flamapy_bp
+from app.modules.flamapy.services import FORMATS, FlamapyService
 from app.modules.hubfile.services import HubfileService
+from core.archives.zipstream import BytesSource, streaming_zip_response
+from core.http.conditional import not_modified, set_validators
+from core.jobs.runner import FAILED, FINISHED
 
 logger = logging.getLogger(__name__)
 
+hubfile_service = HubfileService()
+flamapy_service = FlamapyService()
+dataset_service = DataSetService()
+
 
 @flamapy_bp.route("/flamapy/check_uvl/<int:file_id>", methods=["GET"])
 def check_uvl(file_id):
-    class CustomErrorListener(ErrorListener):
-        def __init__(self):
-            self.errors = []
-
-        def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
-            if "\\t" in msg:
-                warning_message = (
-                    f"The UVL has the following warning that prevents reading it: " f"Line {line}:{column} - {msg}"
-                )
-                print(warning_message)
-                self.errors.append(warning_message)
-            else:
-                error_message = (
-                    f"The UVL has the following error that prevents reading it: " f"Line {line}:{column} - {msg}"
-                )
-                self.errors.append(error_message)
-
+    hubfile = hubfile_service.get_or_404(file_id)
     try:
-        hubfile = HubfileService().get_by_id(file_id)
-        input_stream = FileStream(hubfile.get_path())
-        lexer = UVLCustomLexer(input_stream)
-
-        error_listener = CustomErrorListener()
-
-        lexer.removeErrorListeners()
-        lexer.addErrorListener(error_listener)
-
-        stream = CommonTokenStream(lexer)
-        parser = UVLPythonParser(stream)
-
-        parser.removeErrorListeners()
-        parser.addErrorListener(error_listener)
-
-        # tree = parser.featureModel()
-
-        if error_listener.errors:
-            return jsonify({"errors": error_listener.errors}), 400
-
-        # Optional: Print the parse tree
-        # print(tree.toStringTree(recog=parser))
-
-        return jsonify({"message": "Valid Model"}), 200
-
+        report = flamapy_service.validate_files({hubfile.name: hubfile.get_path()})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    result = report["files"][hubfile.name]
+    if not result["valid"]:
+        return jsonify({"errors": result["errors"], "seconds": result["seconds"]}), 400
+    return jsonify({"message": "Valid Model", "seconds": result["seconds"], "cached": result["cached"]}), 200
+
 
 @flamapy_bp.route("/flamapy/valid/<int:file_id>", methods=["GET"])
 def valid(file_id):
     return jsonify({"success": True, "file_id": file_id})
 
 
+def job_response(job: dict):
+    """The public view of a conversion job, with a 202 and a Location to poll while it is not finished."""
+    body = {
+        "id": job["id"],
+        "status": job["status"],
+        "error": job.get("error"),
+        "file_id": job.get("file_id"),
+        "format": job.get("format"),
+        "status_url": url_for("flamapy.job_status", job_id=job["id"]),
+        "result_url": url_for("flamapy.job_result", job_id=job["id"]) if job["status"] == FINISHED else None,
+    }
+    if job["status"] in (FINISHED, FAILED):
+        return jsonify(body), 200
+    return jsonify(body), 202, {"Location": body["status_url"], "Retry-After": "1"}
+
+
+def text_attachment(data: bytes, download_name: str) -> Response:
+    """Sends a conversion straight from memory, with its Content-Length known up front."""
+    response = Response(data, mimetype="text/plain")
+    response.headers.set("Content-Disposition", "attachment", filename=download_name)
+    return response
+
+
+def conversion_response(file_id: int, output_format: str):
+    hubfile = hubfile_service.get_or_404(file_id)
+
+    # The conversion only depends on the file's content, so its checksum is a strong validator
+    etag = f"{hubfile.checksum}-{output_format}"
+    cached = not_modified(etag)
+    if cached:
+        return cached
+
+    # Only cached conversions are served right away: anything else runs as a job, never in the web worker
+    data = flamapy_service.cached_export(hubfile, output_format)
+    if data is None:
+        job = flamapy_service.submit_conversion(hubfile, output_format)
+        if job["status"] != FINISHED:
+            return job_response(job)
+        data = flamapy_service.job_result(job["id"])
+
+    return set_validators(text_attachment(data, f"{hubfile.name}_{output_format}.txt"), etag)
+
+
+def conversion_entries(results, output_format: str, arc_root: str):
+    """Archive entries of conversions, in the order they finish, plus an errors.txt listing those that failed."""
+    modified = datetime.now()
+    errors = []
+    for name, data, error in results:
+        if error:
+            errors.append(f"{name}: {error}")
+        else:
+            yield BytesSource(data, modified), f"{arc_root}/{name}_{output_format}.txt"
+    if errors:
+        yield BytesSource("\n".join(errors).encode("utf-8"), modified), f"{arc_root}/errors.txt"
+
+
+@flamapy_bp.route("/flamapy/dataset/<int:dataset_id>/<output_format>", methods=["GET"])
+def convert_dataset(dataset_id, output_format):
+    """Zip of the conversions of every feature model of a dataset, or of those in ?files=<id>,<id>,..."""
+    if output_format not in FORMATS:
+        abort(404)
+    dataset = dataset_service.get_or_404(dataset_id)
+
+    hubfiles = dataset.files()
+    if request.args.get("files"):
+        file_ids = {int(file_id) for file_id in request.args["files"].split(",") if file_id.strip().isdigit()}
+        hubfiles = [hubfile for hubfile in hubfiles if hubfile.id in file_ids]
+        if not hubfiles:
+            abort(404)
+
+    arc_root = f"dataset_{dataset_id}_{output_format}"
+    results = flamapy_service.convert_many(hubfiles, output_format)
+    return streaming_zip_response(conversion_entries(results, output_format, arc_root), f"{arc_root}.zip")
+
+
+@flamapy_bp.route("/flamapy/jobs/<int:file_id>/<output_format>", methods=["POST"])
+def submit_job(file_id, output_format):
+    if output_format not in FORMATS:
+        abort(404)
+    hubfile = hubfile_service.get_or_404(file_id)
+    return job_response(flamapy_service.submit_conversion(hubfile, output_format))
+
+
+@flamapy_bp.route("/flamapy/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = flamapy_service.job_status(job_id)
+    if job is None:
+        abort(404)
+    return job_response(job)
+
+
+@flamapy_bp.route("/flamapy/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    job = flamapy_service.job_status(job_id)
+    if job is None:
+        abort(404)
+    if job["status"] != FINISHED:
+        return job_response(job)[0], 409
+
+    # Job ids are derived from the file's checksum and the format, so the result never changes
+    cached = not_modified(job_id)
+    if cached:
+        return cached
+    response = text_attachment(flamapy_service.job_result(job_id), job.get("download_name", f"{job_id}.txt"))
+    return set_validators(response, job_id)
+
+
 @flamapy_bp.route("/flamapy/to_glencoe/<int:file_id>", methods=["GET"])
 def to_glencoe(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix=".json", delete=False)
-    try:
-        hubfile = HubfileService().get_or_404(file_id)
-        fm = UVLReader(hubfile.get_path()).transform()
-        GlencoeWriter(temp_file.name, fm).transform()
-
-        # Return the file in the response
-        return send_file(temp_file.name, as_attachment=True, download_name=f"{hubfile.name}_glencoe.txt")
-    finally:
-        # Clean up the temporary file
-        os.remove(temp_file.name)
+    return conversion_response(file_id, "glencoe")
 
 
 @flamapy_bp.route("/flamapy/to_splot/<int:file_id>", methods=["GET"])
 def to_splot(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix=".splx", delete=False)
-    try:
-        hubfile = HubfileService().get_by_id(file_id)
-        fm = UVLReader(hubfile.get_path()).transform()
-        SPLOTWriter(temp_file.name, fm).transform()
-
-        # Return the file in the response
-        return send_file(temp_file.name, as_attachment=True, download_name=f"{hubfile.name}_splot.txt")
-    finally:
-        # Clean up the temporary file
-        os.remove(temp_file.name)
+    return conversion_response(file_id, "splot")
 
 
 @flamapy_bp.route("/flamapy/to_cnf/<int:file_id>", methods=["GET"])
 def to_cnf(file_id):
-    temp_file = tempfile.NamedTemporaryFile(suffix=".cnf", delete=False)
-    try:
-        hubfile = HubfileService().get_by_id(file_id)
-        fm = UVLReader(hubfile.get_path()).transform()
-        sat = FmToPysat(fm).transform()
-        DimacsWriter(temp_file.name, sat).transform()
-
-        # Return the file in the response
-        return send_file(temp_file.name, as_attachment=True, download_name=f"{hubfile.name}_cnf.txt")
-    finally:
-        # Clean up the temporary file
-        os.remove(temp_file.name)
+    return conversion_response(file_id, "cnf")
+
+
+def analysis_body(hubfile, metrics) -> dict:
+    if metrics is None:
+        return {"file_id": hubfile.id, "name": hubfile.name, "status": "pending"}
+    return {
+        "file_id": hubfile.id,
+        "name": hubfile.name,
+        "status": "failed" if metrics.error else "finished",
+        **metrics.to_dict(),
+    }
+
+
+@flamapy_bp.route("/flamapy/analysis/<int:file_id>", methods=["GET"])
+def file_analysis(file_id):
+    hubfile = hubfile_service.get_or_404(file_id)
+    metrics, job = flamapy_service.get_analysis(hubfile)
+    if metrics is None:
+        body = {**analysis_body(hubfile, None), "status": job["status"]}
+        location = url_for("flamapy.file_analysis", file_id=file_id)
+        return jsonify(body), 202, {"Location": location, "Retry-After": "2"}
+
+    # Stored analyses never change for a given checksum
+    etag = f"{hubfile.checksum}-analysis"
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    return set_validators(jsonify(analysis_body(hubfile, metrics)), etag)
+
+
+@flamapy_bp.route("/flamapy/analysis/dataset/<int:dataset_id>", methods=["GET"])
+def dataset_analysis(dataset_id):
+    dataset = dataset_service.get_or_404(dataset_id)
+    files = [analysis_body(hubfile, flamapy_service.get_analysis(hubfile)[0]) for hubfile in dataset.files()]
+    ds_metrics = flamapy_service.update_dataset_metrics(dataset)
+    body = {
+        "dataset_id": dataset.id,
+        "status": "pending" if any(file["status"] == "pending" for file in files) else "finished",
+        "number_of_models": ds_metrics.number_of_models,
+        "number_of_features": ds_metrics.number_of_features,
+        "files": files,
+    }
+    if body["status"] == "pending":
+        location = url_for("flamapy.dataset_analysis", dataset_id=dataset_id)
+        return jsonify(body), 202, {"Location": location, "Retry-After": "2"}
+    return jsonify(body), 200
@@ -1,7 +1,329 @@
+import hashlib
+import json
+import time
+from concurrent.futures import as_completed
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from flamapy.metamodels.fm_metamodel.models import FeatureModel
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app.modules.dataset.models import DataSet, DSMetrics
+from app.modules.dataset.repositories import DSMetaDataRepository
+from app.modules.featuremodel.models import FMMetrics
+from app.modules.featuremodel.repositories import FMMetricsRepository
 from app.modules.flamapy.repositories import FlamapyRepository
+from app.modules.hubfile.models import Hubfile
+from core.caches.pickle_cache import PickleCache, get_pickle_cache
+from core.conversions.feature_models import FORMATS, analyse, convert, parse, render
+from core.jobs.runner import FAILED, FINISHED, INTERRUPTED, get_job_runner
 from core.services.BaseService import BaseService
+from core.storage.hashing import file_checksums
+from core.validation.uvl_syntax import validate_uvl
+from core.workers.killable import TaskTimeout, WorkerCrashed
+from core.workers.pools import get_process_pool
+
+# Bump when parsing or a writer changes, so entries built by older code are no longer used
+CACHE_VERSION = 1
+
+
+def get_model_cache() -> PickleCache:
+    config = current_app.config
+    return get_pickle_cache(
+        "flamapy", config["FLAMAPY_CACHE_DIR"], config["FLAMAPY_CACHE_MAX_ITEMS"], config["FLAMAPY_CACHE_MAX_BYTES"]
+    )
+
+
+def _job_id(key: str) -> str:
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:40]
 
 
 class FlamapyService(BaseService):
     def __init__(self):
         super().__init__(FlamapyRepository())
+        self.fm_metrics_repository = FMMetricsRepository()
+        self.dsmetadata_repository = DSMetaDataRepository()
+
+    @staticmethod
+    def model_key(hubfile: Hubfile) -> str:
+        return f"{CACHE_VERSION}:model:{hubfile.checksum}"
+
+    @staticmethod
+    def export_key(hubfile: Hubfile, output_format: str) -> str:
+        return f"{CACHE_VERSION}:{output_format}:{hubfile.checksum}"
+
+    def feature_model(self, hubfile: Hubfile) -> FeatureModel:
+        """The parsed feature model of a UVL file, cached by checksum."""
+        return get_model_cache().get_or_build(self.model_key(hubfile), lambda: parse(hubfile.get_path()))
+
+    def export(self, hubfile: Hubfile, output_format: str) -> bytes:
+        """
+        The UVL file converted to one of FORMATS, cached by checksum. Converts in this process on a cache miss, so
+        requests use submit_conversion() instead.
+        """
+        return get_model_cache().get_or_build(
+            self.export_key(hubfile, output_format),
+            lambda: render(self.feature_model(hubfile), output_format),
+        )
+
+    def cached_export(self, hubfile: Hubfile, output_format: str) -> Optional[bytes]:
+        return get_model_cache().get(self.export_key(hubfile, output_format))
+
+    def submit_conversion(self, hubfile: Hubfile, output_format: str) -> dict:
+        """
+        Queues the conversion as a background job and returns its state. The job id only depends on the file's
+        checksum and the format, so repeated requests for a conversion share one job.
+        """
+        if output_format not in FORMATS:
+            raise ValueError(f"Unknown format: {output_format}")
+
+        runner = get_job_runner()
+        export_key = self.export_key(hubfile, output_format)
+        job_id = _job_id(export_key)
+        meta = {
+            "file_id": hubfile.id,
+            "format": output_format,
+            "cache_key": export_key,
+            "download_name": f"{hubfile.name}_{output_format}.txt",
+        }
+
+        cached = self.cached_export(hubfile, output_format)
+        if cached is not None:
+            state = runner.status(job_id)
+            return state if state and state["status"] == FINISHED else runner.complete(job_id, cached, meta)
+
+        config = current_app.config
+        return runner.submit(
+            job_id,
+            convert,
+            (hubfile.get_path(), output_format, get_model_cache().cache_dir, self.model_key(hubfile)),
+            timeout=config["JOB_TIMEOUT"],
+            memory_limit=config["JOB_MEMORY_LIMIT"],
+            meta=meta,
+        )
+
+    def convert_many(
+        self, hubfiles: Iterable[Hubfile], output_format: str
+    ) -> Iterator[Tuple[str, Optional[bytes], Optional[str]]]:
+        """
+        Converts hubfiles in the process pool and yields (name, output, error) as each conversion finishes, cached
+        outputs first. Misses all start at once, up to the size of the pool, and the worker of a conversion that
+        runs for more than JOB_TIMEOUT is killed, so a pathological file cannot hold the batch or the pool.
+        Everything is resolved before the first item, so the iterator can be consumed by a streamed response after
+        the request context is gone.
+        """
+        cache = get_model_cache()
+        timeout = current_app.config["JOB_TIMEOUT"]
+        memory_limit = current_app.config["JOB_MEMORY_LIMIT"]
+        cached, pending = [], []
+        for hubfile in hubfiles:
+            export_key = self.export_key(hubfile, output_format)
+            data = cache.get(export_key)
+            if data is None:
+                pending.append((hubfile.name, export_key, hubfile.get_path(), self.model_key(hubfile)))
+            else:
+                cached.append((hubfile.name, data))
+
+        def results():
+            futures = {}
+            try:
+                for name, export_key, path, model_key in pending:
+                    future = get_process_pool().submit(
+                        convert,
+                        path,
+                        output_format,
+                        cache.cache_dir,
+                        model_key,
+                        timeout=timeout,
+                        memory_limit=memory_limit,
+                    )
+                    futures[future] = (name, export_key)
+                for name, data in cached:
+                    yield name, data, None
+
+                for future in as_completed(list(futures)):
+                    name, export_key = futures.pop(future)
+                    try:
+                        data = future.result()
+                    except TaskTimeout:
+                        yield name, None, f"Timed out after {timeout:g} seconds"
+                        continue
+                    except WorkerCrashed:
+                        yield name, None, "Conversion could not be completed"
+                        continue
+                    except Exception as exc:
+                        yield name, None, f"{type(exc).__name__}: {exc}"
+                        continue
+                    cache.put(export_key, data)
+                    yield name, data, None
+            finally:
+                # Also reached when the client disconnects: drop the conversions that have not started
+                for future in futures:
+                    future.cancel()
+
+        return results()
+
+    def job_status(self, job_id: str) -> Optional[dict]:
+        try:
+            return get_job_runner().status(job_id)
+        except ValueError:
+            return None
+
+    def job_result(self, job_id: str) -> Optional[bytes]:
+        """The output of a finished conversion job, which is also added to the conversion cache."""
+        state = self.job_status(job_id)
+        if not state or state["status"] != FINISHED:
+            return None
+
+        def read():
+            with open(get_job_runner().result_path(job_id), "rb") as f:
+                return f.read()
+
+        return get_model_cache().get_or_build(state["cache_key"], read)
+
+    def validate_files(self, paths: Dict[str, str]) -> dict:
+        """
+        Fully parses UVL files ({name: path}) in the process pool and returns a report with the errors and the
+        parse time of each file. Results are cached by checksum, so a file is only parsed once.
+        """
+        started = time.perf_counter()
+        timeout = current_app.config["UVL_VALIDATION_TIMEOUT"]
+        memory_limit = current_app.config["JOB_MEMORY_LIMIT"]
+        cache = get_model_cache()
+
+        files = {}
+        futures = {}
+        for (name, path), (checksum, _) in zip(paths.items(), file_checksums(list(paths.values()))):
+            key = f"{CACHE_VERSION}:validation:{checksum}"
+            cached = cache.get(key)
+            if cached is not None:
+                files[name] = {**cached, "cached": True}
+            else:
+                # The worker of a file that overruns the timeout is killed, so it cannot keep parsing
+                future = get_process_pool().submit(validate_uvl, path, timeout=timeout, memory_limit=memory_limit)
+                futures[name] = (key, future)
+
+        for name, (key, future) in futures.items():
+            try:
+                result = future.result()
+            except TaskTimeout:
+                error = f"Validation took more than {timeout:g} seconds"
+                result = {"valid": False, "errors": [error], "seconds": timeout}
+            except WorkerCrashed:
+                result = {"valid": False, "errors": ["Validation could not be completed"], "seconds": None}
+            else:
+                cache.put(key, result)
+            files[name] = {**result, "cached": False}
+
+        return {
+            "valid": all(result["valid"] for result in files.values()),
+            "files": files,
+            "seconds": round(time.perf_counter() - started, 4),
+        }
+
+    def get_analysis(self, hubfile: Hubfile) -> Tuple[Optional[FMMetrics], Optional[dict]]:
+        """
+        The stored analysis of a hubfile, or the state of the job computing it. Analyses are stored per checksum,
+        so every distinct file is analysed once and later requests are answered from the database.
+        """
+        metrics = self.fm_metrics_repository.get_by_checksum(hubfile.checksum)
+        if metrics is None:
+            job = self.submit_analysis(hubfile)
+            if job["status"] in (FINISHED, FAILED):
+                metrics = self.store_analysis(job)
+            if metrics is None:
+                return None, job
+        self._attach([hubfile], metrics)
+        return metrics, None
+
+    def submit_analysis(self, hubfile: Hubfile) -> dict:
+        """Queues the analysis of a hubfile as a background job; its result is stored as soon as it finishes."""
+        config = current_app.config
+        app = current_app._get_current_object()
+
+        def on_done(job: dict):
+            with app.app_context():
+                metrics = self.store_analysis(job)
+                if metrics is not None:
+                    self._attach(self.repository.unanalysed_with_checksum(job["checksum"]), metrics)
+
+        return get_job_runner().submit(
+            _job_id(f"{CACHE_VERSION}:analysis:{hubfile.checksum}"),
+            analyse,
+            (hubfile.get_path(), get_model_cache().cache_dir, self.model_key(hubfile)),
+            timeout=config["ANALYSIS_TIMEOUT"],
+            memory_limit=config["JOB_MEMORY_LIMIT"],
+            meta={"file_id": hubfile.id, "checksum": hubfile.checksum},
+            on_done=on_done,
+        )
+
+    def submit_analyses(self, dataset: DataSet):
+        """Precomputes the analyses of the feature models of a dataset that have none yet."""
+        for hubfile in dataset.files():
+            metrics = self.fm_metrics_repository.get_by_checksum(hubfile.checksum)
+            if metrics is None:
+                self.submit_analysis(hubfile)
+            else:
+                self._attach([hubfile], metrics)
+
+    def store_analysis(self, job: dict) -> Optional[FMMetrics]:
+        """
+        Stores the outcome of a finished or failed analysis job. Timeouts and analysis errors are stored too, so
+        they are not retried on every request; interrupted jobs are not.
+        """
+        metrics = self.fm_metrics_repository.get_by_checksum(job["checksum"])
+        if metrics is not None:
+            return metrics
+
+        if job["status"] == FINISHED:
+            with open(get_job_runner().result_path(job["id"]), "rb") as f:
+                analysis = json.load(f)
+            values = {"solver": json.dumps(analysis["solver"]), "not_solver": json.dumps(analysis["not_solver"])}
+        elif job["status"] == FAILED and job.get("error") != INTERRUPTED:
+            values = {"error": job.get("error")}
+        else:
+            return None
+
+        try:
+            return self.fm_metrics_repository.create(
+                checksum=job["checksum"], computed_at=datetime.now(timezone.utc), **values
+            )
+        except IntegrityError:
+            # Stored meanwhile by another worker
+            self.fm_metrics_repository.session.rollback()
+            return self.fm_metrics_repository.get_by_checksum(job["checksum"])
+
+    def _attach(self, hubfiles, metrics: FMMetrics):
+        datasets = {}
+        for hubfile in hubfiles:
+            feature_model = hubfile.feature_model
+            fm_meta_data = feature_model.fm_meta_data if feature_model else None
+            if fm_meta_data is not None and fm_meta_data.fm_metrics_id != metrics.id:
+                fm_meta_data.fm_metrics = metrics
+                datasets[feature_model.data_set_id] = feature_model.dataset
+        for dataset in datasets.values():
+            self.update_dataset_metrics(dataset, commit=False)
+        if datasets:
+            self.repository.session.commit()
+
+    def update_dataset_metrics(self, dataset: DataSet, commit: bool = True) -> DSMetrics:
+        """
+        Updates the number of models of a dataset and, once all of them are analysed, its number of features.
+        """
+        ds_meta_data = dataset.ds_meta_data
+        ds_metrics = ds_meta_data.ds_metrics
+        if ds_metrics is None or self.dsmetadata_repository.shares_metrics(ds_meta_data):
+            # A row shared with other datasets is left alone: this dataset gets its own
+            ds_metrics = DSMetrics()
+            ds_meta_data.ds_metrics = ds_metrics
+
+        fm_metrics = [fm.fm_meta_data.fm_metrics if fm.fm_meta_data else None for fm in dataset.feature_models]
+        ds_metrics.number_of_models = str(len(fm_metrics))
+        if all(metrics is not None and metrics.not_solver for metrics in fm_metrics):
+            features = sum(json.loads(metrics.not_solver)["features"] for metrics in fm_metrics)
+            ds_metrics.number_of_features = str(features)
+
+        if commit:
+            self.repository.session.commit()
+        return ds_metrics
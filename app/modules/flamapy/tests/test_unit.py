@@ -1,3 +1,10 @@
+import os
+import time
+import uuid
+import zlib
+from types import SimpleNamespace
+from unittest.mock import patch
+
 import pytest
 
 
@@ -22,3 +29,287 @@ def test_sample_assertion(test_client):
     """
     greeting = "Hello, World!"
     assert greeting == "Hello, World!", "The greeting does not coincide with 'Hello, World!'"
+
+
+def test_pickle_cache_spills_evicted_entries_to_disk(tmp_path):
+    from core.caches.pickle_cache import PickleCache
+
+    cache = PickleCache(str(tmp_path), max_items=1)
+    cache.put("a", {"value": 1})
+    cache.put("b", {"value": 2})
+
+    assert list(cache._memory) == ["b"]
+    assert cache.get("a") == {"value": 1}  # read back from disk
+    assert list(cache._memory) == ["a"]
+    assert cache.get("missing", "default") == "default"
+    assert cache.get_or_build("b", lambda: pytest.fail("should be cached")) == {"value": 2}
+
+    cache.put("lambda", lambda: None)  # not picklable: memory only
+    assert not os.path.exists(cache.path_for("lambda"))
+
+
+def test_conversions_are_cached_by_checksum(test_app):
+    from app.modules.flamapy import services
+    from app.modules.flamapy.services import FlamapyService
+
+    path = os.path.join(os.path.dirname(__file__), "..", "..", "dataset", "uvl_examples", "file1.uvl")
+    hubfile = SimpleNamespace(checksum=uuid.uuid4().hex, get_path=lambda: path)
+    service = FlamapyService()
+
+    with test_app.app_context(), patch.object(services, "parse", wraps=services.parse) as parse:
+        cnf = service.export(hubfile, "cnf")
+        glencoe = service.export(hubfile, "glencoe")
+        assert service.export(hubfile, "cnf") == cnf
+        services.get_model_cache().clear_memory()
+        assert service.export(hubfile, "glencoe") == glencoe
+
+    assert parse.call_count == 1
+    assert cnf.startswith(b"p cnf")
+    assert b'"features"' in glencoe
+
+
+def test_job_runner_runs_jobs_once_in_child_processes(tmp_path):
+    from core.jobs.runner import FINISHED, JobRunner
+
+    runner = JobRunner(str(tmp_path))
+    job = runner.submit("compress", zlib.compress, (b"feature" * 100,), timeout=30)
+    assert job["status"] in ("queued", "running")
+    assert runner.submit("compress", zlib.compress, (b"other",))["submitted_at"] == job["submitted_at"]
+
+    job = runner.wait("compress", 30)
+    assert job["status"] == FINISHED
+    with open(runner.result_path("compress"), "rb") as f:
+        assert zlib.decompress(f.read()) == b"feature" * 100
+    assert runner.submit("compress", zlib.compress, (b"other",))["status"] == FINISHED
+
+    with pytest.raises(ValueError):
+        runner.status("../escape")
+
+
+def test_job_runner_enforces_timeout_and_memory_limit(tmp_path):
+    from core.jobs.runner import FAILED, JobRunner
+
+    runner = JobRunner(str(tmp_path))
+    started = time.monotonic()
+    runner.submit("slow", time.sleep, (60,), timeout=1)
+    runner.submit("greedy", bytes, (4 * 1024**3,), timeout=30, memory_limit=512 * 1024**2)
+
+    slow, greedy = runner.wait("slow", 30), runner.wait("greedy", 30)
+    assert slow["status"] == FAILED and slow["error"] == "Timed out after 1 seconds"
+    assert greedy["status"] == FAILED and greedy["error"] == "Out of memory"
+    assert time.monotonic() - started < 30
+
+    # Failed jobs are retried on the next submission
+    assert runner.submit("slow", zlib.compress, (b"x",), timeout=30)["status"] == "queued"
+    assert runner.wait("slow", 30)["status"] == "finished"
+
+
+def test_uvl_validation_parses_files_and_caches_results(test_app, tmp_path):
+    from app.modules.flamapy.services import FlamapyService
+
+    valid = tmp_path / "valid.uvl"
+    valid.write_text(f"features\n    Root{uuid.uuid4().hex}\n        mandatory\n            A\n")
+    invalid = tmp_path / "invalid.uvl"
+    invalid.write_text(f"features\n    Root{uuid.uuid4().hex}\n        mandatory\n            A B ((\n")
+    paths = {"valid.uvl": str(valid), "invalid.uvl": str(invalid)}
+    service = FlamapyService()
+
+    with test_app.app_context():
+        report = service.validate_files(paths)
+        assert not report["valid"]
+        assert report["files"]["valid.uvl"]["valid"] and not report["files"]["valid.uvl"]["cached"]
+        assert report["files"]["invalid.uvl"]["errors"][0].startswith("The UVL has the following error")
+        assert report["files"]["invalid.uvl"]["seconds"] >= 0
+
+        again = service.validate_files(paths)
+        assert all(result["cached"] for result in again["files"].values())
+        assert again["files"]["invalid.uvl"]["errors"] == report["files"]["invalid.uvl"]["errors"]
+
+
+def test_uvl_validation_kills_files_that_overrun_the_timeout(test_app, tmp_path):
+    from concurrent.futures import Future
+    from unittest.mock import MagicMock
+
+    from app.modules.flamapy.services import FlamapyService
+    from core.workers.killable import TaskTimeout, WorkerCrashed
+
+    paths = {}
+    for name in ("slow.uvl", "crash.uvl"):
+        (tmp_path / name).write_text(f"features\n    Root{uuid.uuid4().hex}\n")
+        paths[name] = str(tmp_path / name)
+    outcomes = iter([TaskTimeout("timed out"), WorkerCrashed("died")])
+
+    def submit(func, path, **options):
+        future = Future()
+        future.set_exception(next(outcomes))
+        return future
+
+    pool = MagicMock(**{"submit.side_effect": submit})
+    with (
+        test_app.app_context(),
+        patch.dict(test_app.config, UVL_VALIDATION_TIMEOUT=5),
+        patch("app.modules.flamapy.services.get_process_pool", return_value=pool),
+    ):
+        report = FlamapyService().validate_files(paths)
+
+    assert pool.submit.call_args.kwargs == {"timeout": 5, "memory_limit": test_app.config["JOB_MEMORY_LIMIT"]}
+    assert report["files"]["slow.uvl"]["errors"] == ["Validation took more than 5 seconds"]
+    assert report["files"]["crash.uvl"]["errors"] == ["Validation could not be completed"]
+    assert not report["valid"]
+
+
+def test_analyses_are_computed_once_and_stored_by_checksum(test_app, tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from app.modules.featuremodel.models import FeatureModel, FMMetaData, FMMetrics
+    from app.modules.flamapy import services
+    from app.modules.flamapy.services import FlamapyService
+    from app.modules.hubfile.models import Hubfile
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'analysis.db'}", connect_args={"check_same_thread": False})
+    for model in (FMMetrics, FMMetaData, FeatureModel, Hubfile):
+        model.__table__.create(engine)
+    session = Session(engine)
+    service = FlamapyService()
+    service.repository.session = service.fm_metrics_repository.session = session
+
+    path = os.path.join(os.path.dirname(__file__), "..", "..", "dataset", "uvl_examples", "file1.uvl")
+    hubfile = SimpleNamespace(
+        id=1, name="file1.uvl", checksum=uuid.uuid4().hex, get_path=lambda: path, feature_model=None
+    )
+
+    with test_app.app_context():
+        metrics, job = service.get_analysis(hubfile)
+        assert metrics is None and job["status"] in ("queued", "running")
+        assert services.get_job_runner().wait(job["id"], 60)["status"] == "finished"
+
+        with patch.object(services, "get_job_runner", side_effect=AssertionError("analysed twice")):
+            metrics, job = service.get_analysis(hubfile)
+
+    analysis = metrics.to_dict()
+    assert job is None and analysis["checksum"] == hubfile.checksum
+    assert analysis["not_solver"]["features"] == 10
+    assert analysis["solver"]["configurations"] == 24
+    assert analysis["solver"]["core_features"] == ["Chat", "Connection", "Messages"]
+
+
+def test_dataset_conversions_stream_into_one_archive(test_app, tmp_path):
+    import io
+    import zipfile
+
+    from app.modules.flamapy.routes import conversion_entries
+    from app.modules.flamapy.services import FlamapyService
+    from core.archives.zipstream import stream_zip
+
+    examples = os.path.join(os.path.dirname(__file__), "..", "..", "dataset", "uvl_examples")
+    broken = tmp_path / "broken.uvl"
+    broken.write_text("features\n    Root\n        mandatory\n            A B ((\n")
+    hubfiles = [
+        SimpleNamespace(name=name, checksum=uuid.uuid4().hex, get_path=lambda path=path: path)
+        for name, path in [
+            ("file1.uvl", os.path.join(examples, "file1.uvl")),
+            ("file2.uvl", os.path.join(examples, "file2.uvl")),
+            ("broken.uvl", str(broken)),
+        ]
+    ]
+    service = FlamapyService()
+
+    with test_app.app_context():
+        cached = service.export(hubfiles[1], "cnf")
+        results = service.convert_many(hubfiles, "cnf")
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(stream_zip(conversion_entries(results, "cnf", "dataset_1_cnf")))))
+    names = archive.namelist()
+    assert names[0] == "dataset_1_cnf/file2.uvl_cnf.txt"  # cached outputs come first
+    assert archive.read(names[0]) == cached
+    assert archive.read("dataset_1_cnf/file1.uvl_cnf.txt").startswith(b"p cnf")
+    assert names[-1] == "dataset_1_cnf/errors.txt"
+    assert archive.read(names[-1]).startswith(b"broken.uvl: ")
+
+
+def test_conversions_that_overrun_the_timeout_are_reported(test_app):
+    from concurrent.futures import Future
+    from unittest.mock import MagicMock
+
+    from app.modules.flamapy.services import FlamapyService
+    from core.workers.killable import TaskTimeout
+
+    def submit(func, *args, **options):
+        future = Future()
+        future.set_exception(TaskTimeout("timed out"))
+        return future
+
+    hubfile = SimpleNamespace(name="slow.uvl", checksum=uuid.uuid4().hex, get_path=lambda: "slow.uvl")
+    pool = MagicMock(**{"submit.side_effect": submit})
+    with (
+        test_app.app_context(),
+        patch.dict(test_app.config, JOB_TIMEOUT=5),
+        patch("app.modules.flamapy.services.get_process_pool", return_value=pool),
+    ):
+        results = list(FlamapyService().convert_many([hubfile], "cnf"))
+
+    assert results == [("slow.uvl", None, "Timed out after 5 seconds")]
+    assert pool.submit.call_args.kwargs == {"timeout": 5, "memory_limit": test_app.config["JOB_MEMORY_LIMIT"]}
+
+
+def test_in_memory_conversions_match_flamapy_file_writers(test_app, tmp_path):
+    from flamapy.metamodels.fm_metamodel.transformations import GlencoeWriter, SPLOTWriter
+    from flamapy.metamodels.pysat_metamodel.transformations import DimacsWriter, FmToPysat
+
+    from app.modules.flamapy.routes import text_attachment
+    from core.conversions.feature_models import parse, render
+
+    fm = parse(os.path.join(os.path.dirname(__file__), "..", "..", "dataset", "uvl_examples", "file1.uvl"))
+    for output_format, write in [
+        ("glencoe", lambda path: GlencoeWriter(path, fm).transform()),
+        ("splot", lambda path: SPLOTWriter(path, fm).transform()),
+        ("cnf", lambda path: DimacsWriter(path, FmToPysat(fm).transform()).transform()),
+    ]:
+        path = str(tmp_path / output_format)
+        write(path)
+        with open(path, "rb") as f:
+            assert render(fm, output_format) == f.read()
+
+    with test_app.test_request_context():
+        response = text_attachment(b"p cnf 1 0", "model.uvl_cnf.txt")
+    assert response.headers["Content-Length"] == "9"
+    assert response.headers["Content-Disposition"] == "attachment; filename=model.uvl_cnf.txt"
+
+
+def test_dataset_metrics_are_never_shared(test_app):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+
+    from app import db
+    from app.modules.dataset.models import DataSet, DSMetaData, DSMetrics, PublicationType
+    from app.modules.flamapy.services import FlamapyService
+
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine)
+    session = Session(engine)
+    service = FlamapyService()
+    service.repository.session = service.dsmetadata_repository.session = session
+
+    seeded = DSMetrics(number_of_models="5", number_of_features="50")
+    datasets = [
+        DataSet(
+            user_id=1,
+            ds_meta_data=DSMetaData(
+                title=f"t{i}", description="d", publication_type=PublicationType.NONE, ds_metrics=seeded
+            ),
+        )
+        for i in range(2)
+    ]
+    session.add_all(datasets)
+    session.commit()
+
+    with test_app.app_context():
+        first = service.update_dataset_metrics(datasets[0])
+        assert first.id != seeded.id and first.number_of_models == "0"
+        assert (seeded.number_of_models, datasets[1].ds_meta_data.ds_metrics_id) == ("5", seeded.id)
+
+        # The last dataset on the seeded row now owns it
+        assert service.update_dataset_metrics(datasets[1]).id == seeded.id
+        assert service.update_dataset_metrics(datasets[0]).id == first.id
+    session.close()
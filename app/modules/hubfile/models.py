@@ -21,19 +21,19 @@ class Hubfile(db.Model):
         return SizeService().get_human_readable_size(self.size)
 
     def get_owner_user(self) -> User:
-        from app.modules.hubfile.services import HubfileService
+        from app.modules.hubfile.services import get_hubfile_loader
 
-        return HubfileService().get_owner_user_by_hubfile(self)
+        return get_hubfile_loader().owner(self)
 
     def get_dataset(self) -> DataSet:
-        from app.modules.hubfile.services import HubfileService
+        from app.modules.hubfile.services import get_hubfile_loader
 
-        return HubfileService().get_dataset_by_hubfile(self)
+        return get_hubfile_loader().dataset(self)
 
-    def get_path(self) -> DataSet:
-        from app.modules.hubfile.services import HubfileService
+    def get_path(self) -> str:
+        from app.modules.hubfile.services import get_hubfile_loader
 
-        return HubfileService().get_path_by_hubfile(self)
+        return get_hubfile_loader().path(self)
 
     def to_dict(self):
         return {
@@ -1,8 +1,9 @@
+from typing import List, Tuple
+
 from sqlalchemy import func
 
-from app import db
 from app.modules.auth.models import User
-from app.modules.dataset.models import DataSet
+from app.modules.dataset.base_dataset import BaseDataset
 from app.modules.featuremodel.models import FeatureModel
 from app.modules.hubfile.models import Hubfile, HubfileDownloadRecord, HubfileViewRecord
 from core.repositories.BaseRepository import BaseRepository
@@ -12,19 +13,17 @@ class HubfileRepository(BaseRepository):
     def __init__(self):
         super().__init__(Hubfile)
 
-    def get_owner_user_by_hubfile(self, hubfile: Hubfile) -> User:
+    def locate(self, file_ids: List[int]) -> List[Tuple[int, str, BaseDataset, User]]:
+        """(file id, file name, dataset, owner) of every given file, in a single query."""
         return (
-            db.session.query(User)
-            .join(DataSet)
-            .join(FeatureModel)
-            .join(Hubfile)
-            .filter(Hubfile.id == hubfile.id)
-            .first()
+            self.session.query(Hubfile.id, Hubfile.name, BaseDataset, User)
+            .join(FeatureModel, FeatureModel.id == Hubfile.feature_model_id)
+            .join(BaseDataset, BaseDataset.id == FeatureModel.data_set_id)
+            .join(User, User.id == BaseDataset.user_id)
+            .filter(Hubfile.id.in_(file_ids))
+            .all()
         )
 
-    def get_dataset_by_hubfile(self, hubfile: Hubfile) -> DataSet:
-        return db.session.query(DataSet).join(FeatureModel).join(Hubfile).filter(Hubfile.id == hubfile.id).first()
-
 
 class HubfileViewRecordRepository(BaseRepository):
     def __init__(self):
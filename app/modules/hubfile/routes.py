@@ -1,46 +1,52 @@
-import os
 import uuid
-from datetime import datetime, timezone
 
-from flask import current_app, jsonify, make_response, request, send_from_directory
+from flask import abort, jsonify, make_response, request
 from flask_login import current_user
 
-from app import db
 from app.modules.hubfile import hubfile_bp
-from app.modules.hubfile.models import HubfileDownloadRecord, HubfileViewRecord
-from app.modules.hubfile.services import HubfileDownloadRecordService, HubfileService
+from app.modules.hubfile.services import HubfileService
+from core.http.conditional import not_modified, set_validators
+from core.ingestion.pipeline import record_pipeline
+from core.storage.backends import get_storage
+
+hubfile_service = HubfileService()
 
 
 @hubfile_bp.route("/file/download/<int:file_id>", methods=["GET"])
 def download_file(file_id):
-    file = HubfileService().get_or_404(file_id)
+    file = hubfile_service.get_or_404(file_id)
     filename = file.name
-
-    directory_path = f"uploads/user_{file.feature_model.dataset.user_id}/dataset_{file.feature_model.data_set_id}/"
-    parent_directory_path = os.path.dirname(current_app.root_path)
-    file_path = os.path.join(parent_directory_path, directory_path)
+    storage = get_storage()
+    key = hubfile_service.get_key_by_hubfile(file)
+
+    # Answer conditional requests before touching the file or the download records. A matching If-None-Match
+    # is answered from the stored checksum; the backend is only asked for the file when it is actually needed
+    cached = not_modified(file.checksum) if request.if_none_match else None
+    if cached:
+        return cached
+    stored = storage.stat(key) if key else None
+    if stored is None:
+        abort(404)
+    cached = not_modified(file.checksum, stored.modified)
+    if cached:
+        return cached
 
     # Get the cookie from the request or generate a new one if it does not exist
     user_cookie = request.cookies.get("file_download_cookie")
     if not user_cookie:
         user_cookie = str(uuid.uuid4())
 
-    # Check if the download record already exists for this cookie
-    existing_record = HubfileDownloadRecord.query.filter_by(
-        user_id=current_user.id if current_user.is_authenticated else None, file_id=file_id, download_cookie=user_cookie
-    ).first()
-
-    if not existing_record:
-        # Record the download in your database
-        HubfileDownloadRecordService().create(
-            user_id=current_user.id if current_user.is_authenticated else None,
-            file_id=file_id,
-            download_date=datetime.now(timezone.utc),
-            download_cookie=user_cookie,
-        )
+    # Record the download (de-duplicated and written in batches off the request path)
+    record_pipeline.record(
+        "file_download",
+        target_id=file_id,
+        cookie=user_cookie,
+        user_id=current_user.id if current_user.is_authenticated else None,
+    )
 
     # Save the cookie to the user's browser
-    resp = make_response(send_from_directory(directory=file_path, path=filename, as_attachment=True))
+    resp = storage.download_response(key, filename, etag=file.checksum)
+    resp.headers.setdefault("Cache-Control", "no-cache")
     resp.set_cookie("file_download_cookie", user_cookie)
 
     return resp
@@ -48,48 +54,45 @@ def download_file(file_id):
 
 @hubfile_bp.route("/file/view/<int:file_id>", methods=["GET"])
 def view_file(file_id):
-    file = HubfileService().get_or_404(file_id)
-    filename = file.name
-
-    directory_path = f"uploads/user_{file.feature_model.dataset.user_id}/dataset_{file.feature_model.data_set_id}/"
-    parent_directory_path = os.path.dirname(current_app.root_path)
-    file_path = os.path.join(parent_directory_path, directory_path, filename)
+    file = hubfile_service.get_or_404(file_id)
+    storage = get_storage()
+    key = hubfile_service.get_key_by_hubfile(file)
+
+    # Answer conditional requests before reading the file or registering the view, from the stored checksum
+    # alone when If-None-Match matches
+    cached = not_modified(file.checksum) if request.if_none_match else None
+    if cached:
+        return cached
+    stored = storage.stat(key) if key else None
+    if stored is None:
+        return jsonify({"success": False, "error": "File not found"}), 404
+    last_modified = stored.modified
+    cached = not_modified(file.checksum, last_modified)
+    if cached:
+        return cached
 
     try:
-        if os.path.exists(file_path):
-            with open(file_path, "r") as f:
-                content = f.read()
-
-            user_cookie = request.cookies.get("view_cookie")
-            if not user_cookie:
-                user_cookie = str(uuid.uuid4())
-
-            # Check if the view record already exists for this cookie
-            existing_record = HubfileViewRecord.query.filter_by(
-                user_id=current_user.id if current_user.is_authenticated else None,
-                file_id=file_id,
-                view_cookie=user_cookie,
-            ).first()
-
-            if not existing_record:
-                # Register file view
-                new_view_record = HubfileViewRecord(
-                    user_id=current_user.id if current_user.is_authenticated else None,
-                    file_id=file_id,
-                    view_date=datetime.now(),
-                    view_cookie=user_cookie,
-                )
-                db.session.add(new_view_record)
-                db.session.commit()
-
-            # Prepare response
-            response = jsonify({"success": True, "content": content})
-            if not request.cookies.get("view_cookie"):
-                response = make_response(response)
-                response.set_cookie("view_cookie", user_cookie, max_age=60 * 60 * 24 * 365 * 2)
-
-            return response
-        else:
-            return jsonify({"success": False, "error": "File not found"}), 404
+        with storage.open(key) as f:
+            content = f.read().decode("utf-8")
+
+        user_cookie = request.cookies.get("view_cookie")
+        if not user_cookie:
+            user_cookie = str(uuid.uuid4())
+
+        # Register file view
+        record_pipeline.record(
+            "file_view",
+            target_id=file_id,
+            cookie=user_cookie,
+            user_id=current_user.id if current_user.is_authenticated else None,
+        )
+
+        # Prepare response
+        response = make_response(jsonify({"success": True, "content": content}))
+        set_validators(response, file.checksum, last_modified)
+        if not request.cookies.get("view_cookie"):
+            response.set_cookie("view_cookie", user_cookie, max_age=60 * 60 * 24 * 365 * 2)
+
+        return response
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
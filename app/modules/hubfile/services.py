@@ -1,14 +1,85 @@
-import os
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from flask import g, has_app_context
 
 from app.modules.auth.models import User
-from app.modules.dataset.models import DataSet
-from app.modules.hubfile.models import Hubfile
+from app.modules.dataset.base_dataset import BaseDataset
+from app.modules.hubfile.models import Hubfile, HubfileDownloadRecord, HubfileViewRecord
 from app.modules.hubfile.repositories import (
     HubfileDownloadRecordRepository,
     HubfileRepository,
     HubfileViewRecordRepository,
 )
+from core.ingestion.pipeline import record_pipeline
 from core.services.BaseService import BaseService
+from core.storage.backends import dataset_key, get_storage
+
+record_pipeline.register_kind("file_view", HubfileViewRecord, "file_id", "view_date", "view_cookie")
+record_pipeline.register_kind("file_download", HubfileDownloadRecord, "file_id", "download_date", "download_cookie")
+
+
+class HubfileLocation(NamedTuple):
+    dataset: BaseDataset
+    owner: User
+    key: str
+
+
+class HubfileLoader:
+    """
+    Resolves the dataset, owner and storage key of hubfiles in batches and remembers them.
+
+    A miss resolves the requested hubfile together with every other hubfile loaded in the session that is not
+    resolved yet, so listing the files of a dataset costs one query instead of two per file. Use
+    get_hubfile_loader() to get the loader of the current request.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self, repository: Optional[HubfileRepository] = None):
+        self.repository = repository or HubfileRepository()
+        self._locations: Dict[int, Optional[HubfileLocation]] = {}
+
+    def prime(self, hubfiles: Iterable[Hubfile]):
+        """Resolves the given hubfiles now, BATCH_SIZE per query."""
+        ids = sorted({hubfile.id for hubfile in hubfiles if hubfile.id is not None} - self._locations.keys())
+        for start in range(0, len(ids), self.BATCH_SIZE):
+            batch = ids[start:start + self.BATCH_SIZE]
+            for file_id, name, dataset, owner in self.repository.locate(batch):
+                self._locations[file_id] = HubfileLocation(dataset, owner, dataset_key(owner.id, dataset.id, name))
+            for file_id in batch:
+                self._locations.setdefault(file_id, None)
+
+    def location(self, hubfile: Hubfile) -> Optional[HubfileLocation]:
+        if hubfile.id not in self._locations:
+            loaded = [obj for obj in self.repository.session.identity_map.values() if isinstance(obj, Hubfile)]
+            self.prime([hubfile, *loaded])
+        return self._locations.get(hubfile.id)
+
+    def owner(self, hubfile: Hubfile) -> Optional[User]:
+        location = self.location(hubfile)
+        return location.owner if location else None
+
+    def dataset(self, hubfile: Hubfile) -> Optional[BaseDataset]:
+        location = self.location(hubfile)
+        return location.dataset if location else None
+
+    def key(self, hubfile: Hubfile) -> Optional[str]:
+        location = self.location(hubfile)
+        return location.key if location else None
+
+    def path(self, hubfile: Hubfile) -> Optional[str]:
+        """Path of the file on local disk (a cached copy when it lives in an object store)."""
+        key = self.key(hubfile)
+        return get_storage().local_path(key) if key else None
+
+
+def get_hubfile_loader() -> HubfileLoader:
+    """The hubfile loader of the current request (or application context), created on first use."""
+    if not has_app_context():
+        return HubfileLoader()
+    if "hubfile_loader" not in g:
+        g.hubfile_loader = HubfileLoader()
+    return g.hubfile_loader
 
 
 class HubfileService(BaseService):
@@ -18,22 +89,16 @@ class HubfileService(BaseService):
         self.hubfile_download_record_repository = HubfileDownloadRecordRepository()
 
     def get_owner_user_by_hubfile(self, hubfile: Hubfile) -> User:
-        return self.repository.get_owner_user_by_hubfile(hubfile)
-
-    def get_dataset_by_hubfile(self, hubfile: Hubfile) -> DataSet:
-        return self.repository.get_dataset_by_hubfile(hubfile)
+        return get_hubfile_loader().owner(hubfile)
 
-    def get_path_by_hubfile(self, hubfile: Hubfile) -> str:
+    def get_dataset_by_hubfile(self, hubfile: Hubfile) -> BaseDataset:
+        return get_hubfile_loader().dataset(hubfile)
 
-        hubfile_user = self.get_owner_user_by_hubfile(hubfile)
-        hubfile_dataset = self.get_dataset_by_hubfile(hubfile)
-        working_dir = os.getenv("WORKING_DIR")
+    def get_key_by_hubfile(self, hubfile: Hubfile) -> str:
+        return get_hubfile_loader().key(hubfile)
 
-        path = os.path.join(
-            working_dir, "uploads", f"user_{hubfile_user.id}", f"dataset_{hubfile_dataset.id}", hubfile.name
-        )
-
-        return path
+    def get_path_by_hubfile(self, hubfile: Hubfile) -> str:
+        return get_hubfile_loader().path(hubfile)
 
     def total_hubfile_views(self) -> int:
         return self.hubfile_view_record_repository.total_hubfile_views()
@@ -1,3 +1,12 @@
+import hashlib
+import io
+import os
+import threading
+import urllib.request
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
 import pytest
 
 
@@ -22,3 +31,344 @@ def test_sample_assertion(test_client):
     """
     greeting = "Hello, World!"
     assert greeting == "Hello, World!", "The greeting does not coincide with 'Hello, World!'"
+
+
+def test_send_download_supports_range_requests(test_app, tmp_path):
+    from core.http.downloads import send_download
+
+    path = tmp_path / "model.uvl"
+    path.write_bytes(b"0123456789")
+
+    with test_app.test_request_context(headers={"Range": "bytes=4-"}):
+        response = send_download(str(path), "model.uvl")
+        response.direct_passthrough = False
+
+    assert response.status_code == 206
+    assert response.headers["Content-Range"] == "bytes 4-9/10"
+    assert response.get_data() == b"456789"
+
+
+def test_send_download_offloads_to_nginx_in_accel_mode(test_app, tmp_path, monkeypatch):
+    from core.http.downloads import send_download
+
+    uploads = tmp_path / "uploads" / "user_1" / "dataset_2"
+    uploads.mkdir(parents=True)
+    (uploads / "my model.uvl").write_text("features\n")
+    monkeypatch.setenv("WORKING_DIR", str(tmp_path))
+    monkeypatch.setitem(test_app.config, "DOWNLOAD_MODE", "accel")
+
+    with test_app.test_request_context():
+        response = send_download(str(uploads / "my model.uvl"), "my model.uvl", etag="abc")
+
+    assert response.headers["X-Accel-Redirect"] == "/protected-uploads/user_1/dataset_2/my%20model.uvl"
+    assert response.get_data() == b""
+    assert response.get_etag() == ("abc", False)
+
+
+def test_not_modified_checks_etag_before_last_modified(test_app):
+    from datetime import datetime, timezone
+
+    from core.http.conditional import not_modified
+
+    last_modified = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    with test_app.test_request_context(headers={"If-None-Match": '"abc123"'}):
+        response = not_modified("abc123", last_modified)
+        assert response.status_code == 304
+        assert response.get_etag() == ("abc123", False)
+        assert response.headers["Cache-Control"] == "no-cache"
+
+    # A stale ETag wins over a fresh If-Modified-Since
+    with test_app.test_request_context(
+        headers={"If-None-Match": '"old"', "If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT"}
+    ):
+        assert not_modified("abc123", last_modified) is None
+
+    with test_app.test_request_context(headers={"If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT"}):
+        assert not_modified("abc123", last_modified).status_code == 304
+
+    with test_app.test_request_context():
+        assert not_modified("abc123", last_modified) is None
+
+
+def test_file_routes_answer_a_matching_etag_without_touching_storage(test_app):
+    from datetime import datetime, timezone
+    from types import SimpleNamespace
+    from unittest.mock import MagicMock, patch
+
+    storage = MagicMock()
+    storage.stat.return_value = SimpleNamespace(modified=datetime(2025, 1, 1, tzinfo=timezone.utc))
+    file = SimpleNamespace(id=1, name="model.uvl", checksum="abc123")
+    client = test_app.test_client()
+
+    with patch("app.modules.hubfile.routes.hubfile_service.get_or_404", return_value=file), patch(
+        "app.modules.hubfile.routes.hubfile_service.get_key_by_hubfile", return_value="user_1/dataset_2/model.uvl"
+    ), patch("app.modules.hubfile.routes.get_storage", return_value=storage), patch(
+        "app.modules.hubfile.routes.record_pipeline.record"
+    ) as record:
+        for url in ("/file/download/1", "/file/view/1"):
+            response = client.get(url, headers={"If-None-Match": '"abc123"'})
+            assert response.status_code == 304
+        storage.stat.assert_not_called()
+
+        # If-Modified-Since needs the file's modification time
+        response = client.get("/file/view/1", headers={"If-Modified-Since": "Wed, 01 Jan 2025 00:00:00 GMT"})
+        assert response.status_code == 304
+        storage.stat.assert_called_once_with("user_1/dataset_2/model.uvl")
+    record.assert_not_called()
+
+
+def test_blob_store_deduplicates_uploads_and_collects_garbage(tmp_path):
+    import hashlib
+    import os
+
+    from core.storage.blobs import BlobStore
+
+    store = BlobStore(str(tmp_path / "blobs"))
+    content = b"features\n    Root\n"
+    checksum = hashlib.md5(content).hexdigest()
+
+    first_upload, second_upload = tmp_path / "temp_1.uvl", tmp_path / "temp_2.uvl"
+    first_upload.write_bytes(content)
+    second_upload.write_bytes(content)
+    first, second = tmp_path / "dataset_1" / "model.uvl", tmp_path / "dataset_2" / "copy.uvl"
+
+    assert store.store(str(first_upload), str(first), checksum) is True
+    assert store.store(str(second_upload), str(second), checksum) is False
+    assert not first_upload.exists() and not second_upload.exists()
+    assert os.path.samefile(first, second) and first.read_bytes() == content
+    assert store.references(checksum) == 2
+    assert store.resolve(checksum, "fallback") == store.path_for(checksum)
+    assert store.resolve("checksum1", "fallback") == "fallback"
+
+    # Another content claiming the same checksum (a collision) is kept as is, never replaced by the blob
+    colliding_upload, colliding = tmp_path / "temp_3.uvl", tmp_path / "dataset_3" / "other.uvl"
+    colliding_upload.write_bytes(b"features\n    Other\n")
+    assert store.store(str(colliding_upload), str(colliding), checksum) is True
+    assert colliding.read_bytes() == b"features\n    Other\n" and store.references(checksum) == 2
+    assert store.link(checksum, str(tmp_path / "version" / "other.uvl"), str(colliding)) is False
+    assert store.adopt(str(colliding), checksum) is False
+    assert colliding.read_bytes() == b"features\n    Other\n"
+
+    first.unlink()
+    assert store.gc(min_age=0) == 0
+    second.unlink()
+    assert store.gc(min_age=0) == 1
+    assert not store.exists(checksum)
+
+
+class _S3StandIn(BaseHTTPRequestHandler):
+    """Just enough of the S3 REST API (objects, listing, copies, multipart uploads) to exercise S3Storage."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _parse(self):
+        url = urlsplit(self.path)
+        _, _, key = unquote(url.path).lstrip("/").partition("/")
+        return key, parse_qs(url.query, keep_blank_values=True)
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def _not_found(self):
+        self._send(404, b"<Error><Code>NoSuchKey</Code><Message>Not found</Message></Error>")
+
+    def do_PUT(self):
+        key, query = self._parse()
+        body = self._body()
+        store = self.server.store
+        if "partNumber" in query:
+            store["uploads"][query["uploadId"][0]][int(query["partNumber"][0])] = body
+            self._send(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+        elif "x-amz-copy-source" in self.headers:
+            source = unquote(self.headers["x-amz-copy-source"]).lstrip("/").partition("/")[2]
+            if source not in store["objects"]:
+                return self._not_found()
+            store["objects"][key] = store["objects"][source]
+            self._send(200, b"<CopyObjectResult><ETag>\"copy\"</ETag></CopyObjectResult>")
+        else:
+            store["objects"][key] = body
+            self._send(200, headers={"ETag": f'"{hashlib.md5(body).hexdigest()}"'})
+
+    def do_POST(self):
+        key, query = self._parse()
+        self._body()
+        store = self.server.store
+        if "uploads" in query:
+            upload_id = str(len(store["uploads"]) + 1)
+            store["uploads"][upload_id] = {}
+            body = f"<InitiateMultipartUploadResult><Key>{key}</Key><UploadId>{upload_id}</UploadId>"
+            self._send(200, (body + "</InitiateMultipartUploadResult>").encode())
+        else:
+            parts = store["uploads"].pop(query["uploadId"][0])
+            store["objects"][key] = b"".join(parts[number] for number in sorted(parts))
+            store["multipart"].append(key)
+            body = f"<CompleteMultipartUploadResult><Key>{key}</Key><ETag>\"multi\"</ETag>"
+            self._send(200, (body + "</CompleteMultipartUploadResult>").encode())
+
+    def do_GET(self):
+        key, query = self._parse()
+        objects = self.server.store["objects"]
+        if "list-type" in query:
+            prefix = query.get("prefix", [""])[0]
+            contents = "".join(
+                f"<Contents><Key>{name}</Key><Size>{len(data)}</Size>"
+                f"<LastModified>2025-01-01T00:00:00.000Z</LastModified><ETag>\"x\"</ETag></Contents>"
+                for name, data in sorted(objects.items())
+                if name.startswith(prefix)
+            )
+            self._send(200, f"<ListBucketResult><IsTruncated>false</IsTruncated>{contents}</ListBucketResult>".encode())
+        elif key in objects:
+            self._send(200, objects[key], {"Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT", "ETag": '"x"'})
+        else:
+            self._not_found()
+
+    def do_HEAD(self):
+        key, _ = self._parse()
+        data = self.server.store["objects"].get(key)
+        if data is None:
+            return self._send(404)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Last-Modified", "Wed, 01 Jan 2025 00:00:00 GMT")
+        self.send_header("ETag", '"x"')
+        self.end_headers()
+
+    def do_DELETE(self):
+        key, _ = self._parse()
+        self.server.store["objects"].pop(key, None)
+        self._send(204)
+
+
+@pytest.fixture
+def s3_stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _S3StandIn)
+    server.store = {"objects": {}, "uploads": {}, "multipart": []}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_local_storage_streams_files_under_dataset_keys(test_app, tmp_path):
+    from core.storage.backends import LocalStorage, dataset_key
+
+    storage = LocalStorage(str(tmp_path / "uploads"))
+    key = dataset_key(1, 2, "model.uvl")
+    storage.save(key, io.BytesIO(b"features\n"))
+
+    assert (tmp_path / "uploads" / "user_1" / "dataset_2" / "model.uvl").read_bytes() == b"features\n"
+    assert storage.copy(key, dataset_key(1, 2, "versions", "1", "model.uvl")) is True
+    assert storage.copy(dataset_key(1, 2, "missing.uvl"), dataset_key(1, 2, "other.uvl")) is False
+    assert [file.key for file in storage.list(dataset_key(1, 2))] == [
+        "user_1/dataset_2/model.uvl",
+        "user_1/dataset_2/versions/1/model.uvl",
+    ]
+    with pytest.raises(ValueError):
+        storage.path("../outside")
+
+    with test_app.test_request_context(headers={"Range": "bytes=2-"}):
+        response = storage.download_response(key, "model.uvl")
+        response.direct_passthrough = False
+    assert response.status_code == 206
+    assert response.get_data() == b"atures\n"
+
+
+def test_s3_storage_against_stand_in(test_app, s3_stand_in, tmp_path):
+    from core.archives.zipstream import stream_zip
+    from core.storage.backends import S3Storage, dataset_key
+
+    endpoint = f"http://127.0.0.1:{s3_stand_in.server_port}"
+    storage = S3Storage(
+        "uvlhub", endpoint_url=endpoint, access_key="key", secret_key="secret", region="us-east-1",
+        multipart_chunksize=5 * 1024 * 1024, cache_dir=str(tmp_path / "cache"),
+    )
+    small, large = dataset_key(1, 2, "model.uvl"), dataset_key(1, 2, "big.bin")
+    large_content = os.urandom(11 * 1024 * 1024)
+
+    storage.save(small, io.BytesIO(b"features\n"))
+    upload = tmp_path / "upload.bin"
+    upload.write_bytes(large_content)
+    storage.put_file(large, str(upload))
+
+    assert not upload.exists()
+    assert s3_stand_in.store["multipart"] == [large]
+    assert storage.stat(small).size == 9 and storage.stat(dataset_key(1, 2, "nope")) is None
+    with storage.open(small) as f:
+        assert f.read() == b"features\n"
+    with pytest.raises(FileNotFoundError):
+        storage.open(dataset_key(1, 2, "nope"))
+    assert open(storage.fetch(storage.location(small)), "rb").read() == b"features\n"
+
+    assert storage.copy(small, dataset_key(1, 2, "versions", "1", "model.uvl")) is True
+    entries = storage.archive_entries(dataset_key(1, 2), "dataset_2")
+    assert [name for _, name in entries] == [
+        "dataset_2/big.bin",
+        "dataset_2/model.uvl",
+        "dataset_2/versions/1/model.uvl",
+    ]
+    entries = storage.archive_entries(dataset_key(1, 2), "dataset_2", exclude=("versions",))
+    assert [name for _, name in entries] == ["dataset_2/big.bin", "dataset_2/model.uvl"]
+    with zipfile.ZipFile(io.BytesIO(b"".join(stream_zip(entries)))) as archive:
+        assert archive.read("dataset_2/big.bin") == large_content
+
+    with test_app.test_request_context():
+        response = storage.download_response(small, "my model.uvl")
+    assert response.status_code == 302
+    location = response.headers["Location"]
+    assert location.startswith(f"{endpoint}/uvlhub/user_1/dataset_2/model.uvl?")
+    assert "response-content-disposition=attachment" in location
+    assert urllib.request.urlopen(location).read() == b"features\n"
+
+    storage.delete(small)
+    assert not storage.exists(small)
+
+
+def test_hubfile_loader_resolves_loaded_files_in_one_query(test_app):
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import Session
+
+    from app.modules.auth.models import User
+    from app.modules.dataset.base_dataset import BaseDataset
+    from app.modules.featuremodel.models import FeatureModel
+    from app.modules.hubfile.models import Hubfile
+    from app.modules.hubfile.services import HubfileLoader, get_hubfile_loader
+
+    engine = create_engine("sqlite://")
+    for model in (User, BaseDataset, FeatureModel, Hubfile):
+        model.__table__.create(engine)
+    session = Session(engine)
+    session.add(User(id=7, email="owner@example.com", password="secret"))
+    session.add(BaseDataset(id=3, user_id=7, dataset_type="base", ds_meta_data_id=1))
+    session.add(FeatureModel(id=5, data_set_id=3))
+    session.add_all(Hubfile(id=i, name=f"file{i}.uvl", checksum="x", size=1, feature_model_id=5) for i in range(1, 21))
+    session.commit()
+
+    loader = HubfileLoader()
+    loader.repository.session = session
+    files = session.query(Hubfile).order_by(Hubfile.id).all()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    paths = [loader.key(file) for file in files]
+    assert len(statements) == 1
+    assert paths[0] == "user_7/dataset_3/file1.uvl"
+    assert loader.owner(files[-1]).id == 7 and loader.dataset(files[-1]).id == 3
+    assert loader.location(Hubfile(id=99, name="gone.uvl")) is None
+    assert len(statements) == 2
+
+    with test_app.test_request_context():
+        assert get_hubfile_loader() is get_hubfile_loader()
@@ -101,4 +101,20 @@ class MovieDataset(BaseDataset):
         }
     
     def __repr__(self):
-        return f"<MovieDataset {self.id}: {self.get_movies_count()} movies>"
\ No newline at end of file
+        return f"<MovieDataset {self.id}: {self.get_movies_count()} movies>"
+
+
+class MovieVector(db.Model):
+    """
+    Similarity vector of a movie added or changed since the on-disk similarity index was built. Searches merge these
+    rows with the index; the next full build folds them in and clears them.
+    """
+    __tablename__ = "movie_vector"
+
+    movie_id = db.Column(
+        db.Integer, db.ForeignKey("movie.id", ondelete="CASCADE"), primary_key=True, autoincrement=False
+    )
+    # Index version and cluster the vector was assigned to; cluster 0 of version "" when there is no index yet
+    index_version = db.Column(db.String(32), nullable=False, default="")
+    cluster = db.Column(db.Integer, nullable=False, index=True)
+    vector = db.Column(db.LargeBinary, nullable=False)
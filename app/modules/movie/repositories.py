@@ -1,7 +1,84 @@
-from app.modules.movie.models import Movie
+from typing import Iterable, Iterator, List, Set
+
+from sqlalchemy import func
+
+from app.modules.movie.models import Movie, MovieVector
 from core.repositories.BaseRepository import BaseRepository
+from core.repositories.upsert import upsert
+
+IN_CLAUSE_CHUNK = 1_000
+
+
+def _chunks(values: list, size: int = IN_CLAUSE_CHUNK):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
 
 
 class MovieRepository(BaseRepository):
     def __init__(self):
         super().__init__(Movie)
+
+    def max_id(self) -> int:
+        return self.session.query(func.max(self.model.id)).scalar() or 0
+
+    def count_up_to(self, up_to_id: int) -> int:
+        return self.session.query(func.count(self.model.id)).filter(self.model.id <= up_to_id).scalar()
+
+    def chunks(self, columns: List[str], chunk_size: int, after_id: int = 0, up_to_id: int = None) -> Iterator[list]:
+        """
+        The id and the given columns of movies in id order, chunk_size rows at a time. Keyset pagination keeps
+        memory bounded on large catalogs.
+        """
+        last_id = after_id
+        while True:
+            entities = [self.model.id, *(getattr(self.model, column) for column in columns)]
+            query = self.session.query(*entities).filter(self.model.id > last_id)
+            if up_to_id is not None:
+                query = query.filter(self.model.id <= up_to_id)
+            chunk = query.order_by(self.model.id).limit(chunk_size).all()
+            if not chunk:
+                return
+            last_id = chunk[-1].id
+            yield chunk
+
+    def get_many(self, movie_ids: Iterable[int]) -> List[Movie]:
+        return [
+            movie
+            for chunk in _chunks(sorted(set(movie_ids)))
+            for movie in self.session.query(self.model).filter(self.model.id.in_(chunk))
+        ]
+
+
+class MovieVectorRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(MovieVector)
+
+    def save(self, rows: List[dict]):
+        """Inserts or replaces vectors. Does not commit."""
+        for chunk in _chunks(rows):
+            upsert(
+                self.session, self.model.__table__, chunk, ["movie_id"], assign=["index_version", "cluster", "vector"]
+            )
+
+    def in_clusters(self, index_version: str, clusters: List[int]) -> List[MovieVector]:
+        return (
+            self.session.query(self.model)
+            .filter(self.model.index_version == index_version, self.model.cluster.in_(clusters))
+            .all()
+        )
+
+    def ids_among(self, movie_ids: Iterable[int]) -> Set[int]:
+        return {
+            movie_id
+            for chunk in _chunks(sorted(set(movie_ids)))
+            for (movie_id,) in self.session.query(self.model.movie_id).filter(self.model.movie_id.in_(chunk))
+        }
+
+    def movie_ids(self) -> List[int]:
+        return [movie_id for (movie_id,) in self.session.query(self.model.movie_id).order_by(self.model.movie_id)]
+
+    def delete_stale(self, index_version: str):
+        """Deletes the vectors assigned against any other index version. Does not commit."""
+        self.session.query(self.model).filter(self.model.index_version != index_version).delete(
+            synchronize_session=False
+        )
@@ -1,24 +1,29 @@
-import os
-import shutil
-import tempfile
-from zipfile import ZipFile
+import uuid
 
 from flask import (
     abort,
     jsonify,
+    make_response,
     redirect,
     render_template,
     request,
-    send_from_directory,
     url_for,
 )
 from flask_login import current_user, login_required
 
+from app.modules.dataset.services import DSViewRecordService
 from app.modules.movie import movie_bp
 from app.modules.movie.forms import MovieForm
-from app.modules.movie.services import MovieService
+from app.modules.movie.services import MovieService, MovieSimilarityService
+from app.modules.recommendation.services import RecommendationService
+from core.archives.cache import archive_response
+from core.ingestion.pipeline import record_pipeline
+from core.storage.backends import VERSIONS_DIR, dataset_key, get_storage
 
 movie_service = MovieService()
+movie_similarity_service = MovieSimilarityService()
+ds_view_record_service = DSViewRecordService()
+recommendation_service = RecommendationService()
 
 #GET MOVIES
 @movie_bp.route('/moviedataset', methods=['GET'])
@@ -51,10 +56,17 @@ def my_datasets():
 def view_dataset(dataset_id):
     """View a movie dataset with all its movies (public view)"""
     dataset = movie_service.get_moviedataset(dataset_id)
-    return render_template(
-        "movie/view_dataset.html",
-        dataset=dataset
+
+    user_cookie = ds_view_record_service.create_cookie(dataset=dataset)
+    resp = make_response(
+        render_template(
+            "movie/view_dataset.html",
+            dataset=dataset,
+            related_datasets=recommendation_service.related_datasets(dataset.id),
+        )
     )
+    resp.set_cookie("view_cookie", user_cookie)
+    return resp
 
 # Manage
 @movie_bp.route("/moviedataset/<int:dataset_id>/manage", methods=["GET"])
@@ -79,39 +91,54 @@ def view_movie(movie_id):
     return render_template(
         "movie/view_movie.html",
         movie=movie,
-        dataset=dataset
+        dataset=dataset,
+        similar_movies=movie_similarity_service.similar(movie.id, k=6),
     )
 
+
+@movie_bp.route("/movie/<int:movie_id>/similar", methods=["GET"])
+def similar_movies(movie_id):
+    movie = movie_service.get_movie(movie_id)
+    limit = min(request.args.get("limit", 10, type=int), 50)
+
+    return jsonify([
+        {
+            "id": similar.id,
+            "title": similar.title,
+            "year": similar.year,
+            "dataset_id": similar.movie_dataset_id,
+            "url": url_for("movie.view_movie", movie_id=similar.id),
+            "score": round(score, 4),
+        }
+        for similar, score in movie_similarity_service.similar(movie.id, k=limit)
+    ])
+
 #Para la descarga 
 @movie_bp.route("/moviedataset/<int:dataset_id>/download", methods=["GET"])
 def download_dataset(dataset_id):
     dataset = movie_service.get_moviedataset(dataset_id)
     
-    file_path = f"uploads/user_{dataset.user_id}/dataset_{dataset.id}/"
-    
-    if not os.path.exists(file_path):
-        abort(404, "Dataset files not found")
-    
-    temp_dir = tempfile.mkdtemp()
-    zip_path = os.path.join(temp_dir, f"movie_dataset_{dataset_id}.zip")
-
-    with ZipFile(zip_path, "w") as zipf:
-        for subdir, dirs, files in os.walk(file_path):
-            for file in files:
-                full_path = os.path.join(subdir, file)
-                relative_path = os.path.relpath(full_path, file_path)
-                zipf.write(
-                    full_path,
-                    arcname=os.path.join(os.path.basename(zip_path[:-4]), relative_path),
-                )
-
-    resp = send_from_directory(
-        temp_dir,
-        f"movie_dataset_{dataset_id}.zip",
-        as_attachment=True,
-        mimetype="application/zip",
+    entries = get_storage().archive_entries(
+        dataset_key(dataset.user_id, dataset.id), f"movie_dataset_{dataset_id}", exclude=(VERSIONS_DIR,)
     )
+    if not entries:
+        abort(404, "Dataset files not found")
+
+    resp = archive_response(entries, f"movie_dataset_{dataset_id}.zip")
+    if resp.status_code == 304:
+        return resp
 
+    user_cookie = request.cookies.get("download_cookie")
+    if not user_cookie:
+        user_cookie = str(uuid.uuid4())
+        resp.set_cookie("download_cookie", user_cookie)
+
+    record_pipeline.record(
+        "dataset_download",
+        target_id=dataset.id,
+        cookie=user_cookie,
+        user_id=current_user.id if current_user.is_authenticated else None,
+    )
     return resp
 
 # POR IMPLEMENTAR: PENDIENTE DE CAMBIOS (IGNORAR DE MOMENTO EN TEST)
@@ -1,6 +1,5 @@
 import os
 import json
-import shutil
 import hashlib
 from datetime import datetime, timezone
 from dotenv import load_dotenv
@@ -12,8 +11,9 @@ from app.modules.dataset.models import DSMetaData, PublicationType, Author
 from app.modules.featuremodel.models import FeatureModel, FMMetaData
 from app.modules.hubfile.models import Hubfile
 from core.seeders.BaseSeeder import BaseSeeder
+from core.storage.backends import dataset_key, get_storage
 
-from app.modules.movie.services import MovieService
+from app.modules.movie.services import MovieService, MovieSimilarityService
 movie_service = MovieService()
 
 
@@ -130,24 +130,18 @@ class MovieSeeder(BaseSeeder):
             (tarantino_dataset, "movies2.json")
         ]
 
+        storage = get_storage()
         hubfiles = []
 
         for dataset, json_filename in datasets_info:
 
-            # Crear carpeta en uploads
-            dest_folder = os.path.join(
-                working_dir, "uploads",
-                f"user_{dataset.user_id}", f"dataset_{dataset.id}"
-            )
-            os.makedirs(dest_folder, exist_ok=True)
-
-            # Copiar archivo JSON
+            # Copiar archivo JSON al almacenamiento
             src_file = os.path.join(src_folder, json_filename)
-            dest_file = os.path.join(dest_folder, json_filename)
-            shutil.copy(src_file, dest_file)
+            with open(src_file, 'rb') as f:
+                storage.save(dataset_key(dataset.user_id, dataset.id, json_filename), f)
 
             # Hash del archivo
-            with open(dest_file, 'rb') as f:
+            with open(src_file, 'rb') as f:
                 file_hash = hashlib.md5(f.read()).hexdigest()
 
             # FeatureModel metadata
@@ -183,7 +177,7 @@ class MovieSeeder(BaseSeeder):
             hubfile = Hubfile(
                 name=json_filename,
                 checksum=file_hash,
-                size=os.path.getsize(dest_file),
+                size=os.path.getsize(src_file),
                 feature_model_id=feature_model.id
             )
             hubfiles.append(hubfile)
@@ -262,4 +256,12 @@ class MovieSeeder(BaseSeeder):
 
         movie_service.create_version(tarantino_dataset)
 
-        print(" Movie datasets and versions seeded successfully!")
\ No newline at end of file
+        print(" Movie datasets and versions seeded successfully!")
+
+
+class MovieIndexSeeder(BaseSeeder):
+
+    priority = 10  # after every seeder that creates movies
+
+    def run(self):
+        MovieSimilarityService().build_index()
@@ -1,11 +1,22 @@
+import io
 import os
+import re
 import shutil
-from flask import abort
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from flask import abort, current_app
 from app import db
 from app.modules.movie.models import MovieDataset, Movie
 import json
 from types import SimpleNamespace
 from app.modules.dataset.base_dataset import Version
+from app.modules.movie.repositories import MovieRepository, MovieVectorRepository
+from core.services.BaseService import BaseService
+from core.storage.backends import dataset_key, get_storage
+from core.vectors.ivf import IVFIndex, assign, current_version, publish, top_k
+from core.vectors.text import HashedTfidfEncoder, tokenize
 from datetime import datetime
 
 class SnapshotDataset:
@@ -96,9 +107,6 @@ class MovieService:
         db.session.add(version)
         db.session.flush()
 
-        version_folder = f"uploads/user_{dataset.user_id}/dataset_{dataset.id}/versions/{version.id}"
-        os.makedirs(version_folder, exist_ok=True)
-
         snapshot = {
             "dataset_id": dataset.id,      
             "metadata": {
@@ -112,11 +120,11 @@ class MovieService:
             "movies": [m.to_dict() for m in dataset.movies]
         }
 
-        snapshot_path = os.path.join(version_folder, "snapshot.json")
-        with open(snapshot_path, "w", encoding="utf-8") as f:
-            json.dump(snapshot, f, indent=4)
+        storage = get_storage()
+        snapshot_key = dataset_key(dataset.user_id, dataset.id, "versions", str(version.id), "snapshot.json")
+        storage.save(snapshot_key, io.BytesIO(json.dumps(snapshot, indent=4).encode("utf-8")))
 
-        version.snapshot_path = snapshot_path
+        version.snapshot_path = storage.location(snapshot_key)
 
         db.session.commit()
         return version
@@ -129,7 +137,7 @@ class MovieService:
         if not version or not version.snapshot_path:
             raise ValueError("Snapshot not found for that version")
 
-        with open(version.snapshot_path, "r", encoding="utf-8") as f:
+        with open(get_storage().fetch(version.snapshot_path), "r", encoding="utf-8") as f:
             snap = json.load(f)
 
         metadata = SimpleNamespace(
@@ -218,3 +226,213 @@ class MovieService:
         v2 = self.load_dataset_from_version(version_id_2)
 
         return self.compare_versions(v1, v2)
+
+
+###################
+# SIMILAR MOVIES
+###################
+
+SIMILARITY_COLUMNS = ["title", "synopsis", "genre", "director"]
+
+# A shared genre or director says more about two movies than a shared synopsis word
+FIELD_WEIGHT = 3.0
+
+_LIST_SEPARATORS = re.compile(r"[,/|;]")
+
+# Extra candidates fetched from the index to make up for ones replaced by newer vectors or deleted since the build
+OVERFETCH = 10
+
+
+def movie_bag(movie) -> Dict[str, float]:
+    """Weighted tokens describing a movie: title and synopsis words, plus one token per genre and director."""
+    bag = Counter(tokenize(movie.synopsis))
+    bag.update(tokenize(movie.title))
+    for field in ("genre", "director"):
+        for value in _LIST_SEPARATORS.split(getattr(movie, field) or ""):
+            name = "-".join(tokenize(value))
+            if name:
+                bag[f"{field}:{name}"] += FIELD_WEIGHT
+    return dict(bag)
+
+
+class LoadedIndex(NamedTuple):
+    version: Optional[str]
+    index: Optional[IVFIndex]
+    encoder: HashedTfidfEncoder
+
+
+_loaded_indexes: Dict[str, LoadedIndex] = {}
+
+
+def load_index(root: str) -> LoadedIndex:
+    """
+    The current similarity index under `root`, memory-mapped once per process and reloaded when a build publishes
+    a new version. Without an index, vectors are still encoded (with every idf at 1) and kept in the delta table.
+    """
+    for _ in range(3):
+        version = current_version(root)
+        cached = _loaded_indexes.get(root)
+        if cached is not None and cached.version == version:
+            return cached
+        if version is None:
+            loaded = LoadedIndex(None, None, HashedTfidfEncoder())
+        else:
+            directory = os.path.join(root, version)
+            try:
+                index = IVFIndex.load(directory)
+                frequencies = np.load(os.path.join(directory, "document_frequencies.npy"), mmap_mode="r")
+            except FileNotFoundError:
+                continue  # replaced by a newer build between reading CURRENT and opening the files
+            encoder = HashedTfidfEncoder(
+                dim=index.meta["dim"],
+                buckets=len(frequencies),
+                document_frequencies=frequencies,
+                documents=index.meta["documents"],
+            )
+            loaded = LoadedIndex(version, index, encoder)
+        _loaded_indexes[root] = loaded
+        return loaded
+    raise RuntimeError(f"Could not load the movie index in {root}")
+
+
+class MovieSimilarityService(BaseService):
+    """
+    Content-based similar movies. A full build encodes every movie into a hashed TF-IDF vector and writes an IVF
+    index under MOVIE_INDEX_DIR; movies added or changed afterwards are encoded against that index and kept in the
+    movie_vector table, which searches merge in until the next build.
+    """
+
+    def __init__(self):
+        super().__init__(MovieRepository())
+        self.vector_repository = MovieVectorRepository()
+
+    @property
+    def root(self) -> str:
+        return current_app.config["MOVIE_INDEX_DIR"]
+
+    def build_index(self, chunk_size: int = 10_000, dim: int = 256) -> int:
+        """Rebuilds the index from every movie, chunk_size movies at a time. Returns the number of movies indexed."""
+        up_to_id = self.repository.max_id()
+        count = self.repository.count_up_to(up_to_id)
+        encoder = HashedTfidfEncoder(dim=dim)
+        for chunk in self.repository.chunks(SIMILARITY_COLUMNS, chunk_size, up_to_id=up_to_id):
+            encoder.count(movie_bag(row) for row in chunk)
+
+        indexed = 0
+
+        def build(directory: str):
+            nonlocal indexed
+            os.makedirs(directory)
+            raw_path = os.path.join(directory, "raw_vectors.npy")
+            raw = np.lib.format.open_memmap(raw_path, mode="w+", dtype=np.float32, shape=(count, dim))
+            ids = np.zeros(count, dtype=np.int64)
+            for chunk in self.repository.chunks(SIMILARITY_COLUMNS, chunk_size, up_to_id=up_to_id):
+                chunk = chunk[: count - indexed]
+                raw[indexed : indexed + len(chunk)] = encoder.encode_many([movie_bag(row) for row in chunk])
+                ids[indexed : indexed + len(chunk)] = [row.id for row in chunk]
+                indexed += len(chunk)
+
+            np.save(os.path.join(directory, "document_frequencies.npy"), encoder.document_frequencies)
+            meta = {"dim": dim, "documents": encoder.documents, "max_movie_id": up_to_id}
+            IVFIndex.build(directory, ids[:indexed], raw[:indexed], meta=meta)
+            del raw
+            os.remove(raw_path)
+
+        version = publish(self.root, build)
+
+        # Vectors of movies created during the build are re-encoded against the new index; the rest are in it now
+        pending = [movie_id for movie_id in self.vector_repository.movie_ids() if movie_id > up_to_id]
+        self.index_movies(pending)
+        session = self.repository.session
+        try:
+            self.vector_repository.delete_stale(version)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return indexed
+
+    def index_movies(self, movie_ids: Iterable[int], chunk_size: int = 1_000) -> int:
+        """
+        Encodes new or changed movies against the current index and stores them in the delta table, so they are
+        searchable right away. Returns the number of movies encoded.
+        """
+        loaded = load_index(self.root)
+        session = self.repository.session
+        movie_ids = sorted(set(movie_ids))
+        encoded = 0
+        for start in range(0, len(movie_ids), chunk_size):
+            movies = self.repository.get_many(movie_ids[start : start + chunk_size])
+            if not movies:
+                continue
+            vectors = loaded.encoder.encode_many([movie_bag(movie) for movie in movies])
+            if loaded.index is not None and len(loaded.index.centroids):
+                clusters = assign(vectors, loaded.index.centroids)
+            else:
+                clusters = np.zeros(len(movies), dtype=np.int32)
+            rows = [
+                {
+                    "movie_id": movie.id,
+                    "index_version": loaded.version or "",
+                    "cluster": int(cluster),
+                    "vector": vector.tobytes(),
+                }
+                for movie, cluster, vector in zip(movies, clusters, vectors)
+            ]
+            try:
+                self.vector_repository.save(rows)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            encoded += len(rows)
+        return encoded
+
+    def index_new_movies(self, chunk_size: int = 10_000) -> int:
+        """Encodes the movies created since the last build that are not in the delta table yet."""
+        loaded = load_index(self.root)
+        after_id = loaded.index.meta.get("max_movie_id", 0) if loaded.index is not None else 0
+        encoded = 0
+        for chunk in self.repository.chunks([], chunk_size, after_id=after_id):
+            ids = [row.id for row in chunk]
+            encoded += self.index_movies(set(ids) - self.vector_repository.ids_among(ids))
+        return encoded
+
+    def similar(self, movie_id: int, k: int = 10) -> List[Tuple[Movie, float]]:
+        """The k movies most similar to the given one with their cosine similarity, best first."""
+        loaded = load_index(self.root)
+        query = self._query_vector(movie_id, loaded)
+        if query is None:
+            return []
+
+        version = loaded.version or ""
+        scores = {}
+        if loaded.index is not None:
+            nprobe = current_app.config["MOVIE_INDEX_NPROBE"]
+            clusters = loaded.index.probe(query, nprobe)
+            candidates = loaded.index.search(query, k + OVERFETCH, nprobe, exclude=[movie_id])
+            replaced = self.vector_repository.ids_among(candidate for candidate, _ in candidates)
+            scores.update((candidate, score) for candidate, score in candidates if candidate not in replaced)
+        else:
+            clusters = [0]
+
+        rows = self.vector_repository.in_clusters(version, clusters)
+        if rows:
+            ids = np.array([row.movie_id for row in rows], dtype=np.int64)
+            vectors = np.vstack([np.frombuffer(row.vector, dtype=np.float32) for row in rows])
+            scores.update(top_k(ids, vectors @ query, k + OVERFETCH, exclude=[movie_id]))
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[: k + OVERFETCH]
+        movies = {movie.id: movie for movie in self.repository.get_many(candidate for candidate, _ in ranked)}
+        return [(movies[candidate], score) for candidate, score in ranked if candidate in movies][:k]
+
+    def _query_vector(self, movie_id: int, loaded: LoadedIndex) -> Optional[np.ndarray]:
+        row = self.vector_repository.get_by_id(movie_id)
+        if row is not None and row.index_version == (loaded.version or ""):
+            return np.frombuffer(row.vector, dtype=np.float32)
+        if row is None and loaded.index is not None:
+            vector = loaded.index.vector(movie_id)
+            if vector is not None:
+                return vector
+        movie = self.repository.get_by_id(movie_id)
+        return None if movie is None else loaded.encoder.encode(movie_bag(movie))
@@ -1,6 +1,7 @@
 import io
 import os
 import tempfile
+import zipfile
 from unittest.mock import patch, MagicMock
 import pytest
 from flask import url_for
@@ -76,8 +77,9 @@ def test_view_dataset(mock_get_dataset, test_client):
 
 
 # ---------- GET /movie/<id> ----------
+@patch("app.modules.movie.routes.movie_similarity_service.similar", return_value=[])
 @patch("app.modules.movie.routes.movie_service.get_movie")
-def test_view_movie(mock_get_movie, test_client):
+def test_view_movie(mock_get_movie, mock_similar, test_client):
     # Crear mock completo de la película
     mock_movie = MagicMock()
     mock_movie.id = 42
@@ -107,23 +109,31 @@ def test_download_dataset_creates_zip(mock_get_dataset, test_client, tmp_path):
     dataset_mock.user_id = 99
     mock_get_dataset.return_value = dataset_mock
 
-    folder = tmp_path / "uploads" / "user_99" / "dataset_5"
-    folder.mkdir(parents=True)
-    (folder / "test.txt").write_text("contenido")
+    file = tmp_path / "test.txt"
+    file.write_text("contenido")
+    storage = MagicMock()
+    storage.archive_entries.return_value = [(str(file), "movie_dataset_5/test.txt")]
 
-    with patch("app.modules.movie.routes.os.path.exists", return_value=True), \
-         patch("app.modules.movie.routes.os.walk") as mockwalk:
-        mockwalk.return_value = [(str(folder), [], ["test.txt"])]
+    with patch("app.modules.movie.routes.get_storage", return_value=storage), \
+         patch("app.modules.movie.routes.record_pipeline.record") as record:
         response = test_client.get("/moviedataset/5/download")
 
     assert response.status_code == 200
     assert response.mimetype == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        assert archive.read("movie_dataset_5/test.txt") == b"contenido"
     mock_get_dataset.assert_called_once_with(5)
+    assert storage.archive_entries.call_args.args == ("user_99/dataset_5", "movie_dataset_5")
+    assert storage.archive_entries.call_args.kwargs == {"exclude": ("versions",)}
+    assert record.call_args.kwargs["target_id"] == 5
 
 
 def test_download_dataset_not_found(test_client):
+    storage = MagicMock()
+    storage.archive_entries.return_value = []
+
     with patch("app.modules.movie.routes.movie_service.get_moviedataset") as mock_get, \
-         patch("app.modules.movie.routes.os.path.exists", return_value=False):
+         patch("app.modules.movie.routes.get_storage", return_value=storage):
         mock_get.return_value = MagicMock(id=1, user_id=1)
         response = test_client.get("/moviedataset/1/download")
         assert response.status_code == 404
@@ -183,3 +193,61 @@ def test_compare_version_ids_detects_changes(mock_load):
 
     # movies_added devuelve DICTS, no objetos
     assert diff["movies_added"][0]["title"] == "Movie Added"
+
+
+# ---------- Similar movies ----------
+def test_movie_bag_weights_genres_and_directors():
+    from types import SimpleNamespace
+
+    from app.modules.movie.services import FIELD_WEIGHT, movie_bag
+
+    movie = SimpleNamespace(
+        title="Blade Runner", synopsis="A blade runner hunts replicants.", genre="Sci-Fi, Thriller",
+        director="Ridley Scott",
+    )
+    bag = movie_bag(movie)
+    assert bag["blade"] == 2 and bag["replicants"] == 1
+    assert bag["genre:sci-fi"] == FIELD_WEIGHT and bag["genre:thriller"] == FIELD_WEIGHT
+    assert bag["director:ridley-scott"] == FIELD_WEIGHT
+
+
+def test_ivf_index_matches_exact_search(tmp_path):
+    import numpy as np
+
+    from core.vectors.ivf import IVFIndex, current_version, publish, top_k
+
+    rng = np.random.default_rng(7)
+    centers = rng.normal(size=(20, 32))
+    vectors = (centers[rng.integers(0, 20, size=2000)] + 0.3 * rng.normal(size=(2000, 32))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = np.arange(1, 2001) * 3
+
+    version = publish(str(tmp_path), lambda directory: IVFIndex.build(directory, ids, vectors, nlist=20))
+    assert current_version(str(tmp_path)) == version
+    index = IVFIndex.load(str(tmp_path / version))
+    assert isinstance(index.vectors, np.memmap)
+
+    hits = 0
+    for position in range(0, 2000, 100):
+        query = vectors[position]
+        exact = top_k(ids, vectors @ query, 10, exclude=[ids[position]])
+        approximate = index.search(query, 10, nprobe=4, exclude=[ids[position]])
+        assert ids[position] not in [item for item, _ in approximate]
+        hits += len({item for item, _ in exact} & {item for item, _ in approximate})
+        np.testing.assert_allclose(index.vector(int(ids[position])), query)
+    assert hits / 200 >= 0.9
+    assert index.vector(2) is None
+
+
+def test_hashed_tfidf_encoder_ranks_shared_rare_tokens_higher():
+    import numpy as np
+
+    from core.vectors.text import HashedTfidfEncoder
+
+    bags = [{"space": 1, "robot": 1}, {"space": 1, "robot": 1}, {"space": 1, "western": 1}, {"space": 1}]
+    encoder = HashedTfidfEncoder(dim=512)
+    encoder.count(bags)
+    vectors = encoder.encode_many(bags)
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1, rtol=1e-5)
+    assert vectors[0] @ vectors[1] > 0.99
+    assert vectors[0] @ vectors[2] < vectors[0] @ vectors[1]
@@ -0,0 +1,3 @@
+from core.blueprints.base_blueprint import BaseBlueprint
+
+recommendation_bp = BaseBlueprint("recommendation", __name__, template_folder="templates")
@@ -0,0 +1,74 @@
+from app import db
+
+
+class DatasetCooccurrence(db.Model):
+    """
+    One cell of the symmetric dataset-by-dataset co-occurrence matrix: how strongly the visitors of one dataset
+    also interacted with the other. Stored in both directions; the diagonal holds each dataset's own popularity.
+    """
+
+    __tablename__ = "dataset_cooccurrence"
+    dataset_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    other_dataset_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    weight = db.Column(db.Double, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f"<DatasetCooccurrence {self.dataset_id}-{self.other_dataset_id} weight={self.weight}>"
+
+
+class DatasetNeighbor(db.Model):
+    """Precomputed top-k related datasets, read in rank order."""
+
+    __tablename__ = "dataset_neighbor"
+    dataset_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    neighbor_id = db.Column(db.Integer, db.ForeignKey("base_dataset.id", ondelete="CASCADE"), nullable=False)
+    score = db.Column(db.Double, nullable=False)
+
+    def __repr__(self):
+        return f"<DatasetNeighbor {self.dataset_id}#{self.rank}={self.neighbor_id}>"
+
+
+class RecommendationWatermark(db.Model):
+    """Highest raw record id already folded into the co-occurrence matrix, per record kind."""
+
+    __tablename__ = "recommendation_watermark"
+    name = db.Column(db.String(64), primary_key=True)
+    last_record_id = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<RecommendationWatermark {self.name}={self.last_record_id}>"
+
+
+class DatasetSignature(db.Model):
+    """MinHash signature of the items (movies or files) of a dataset, as of its latest version."""
+
+    __tablename__ = "dataset_signature"
+    dataset_id = db.Column(
+        db.Integer, db.ForeignKey("base_dataset.id", ondelete="CASCADE"), primary_key=True, autoincrement=False
+    )
+    # Latest Version.id when the signature was computed; a newer version makes the signature stale
+    version_id = db.Column(db.Integer, nullable=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    signature = db.Column(db.LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return f"<DatasetSignature {self.dataset_id} version={self.version_id}>"
+
+
+class DatasetLshBucket(db.Model):
+    """One LSH band key of a dataset's signature; datasets sharing a key are similarity candidates."""
+
+    __tablename__ = "dataset_lsh_bucket"
+    band = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    bucket = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    dataset_id = db.Column(
+        db.Integer,
+        db.ForeignKey("base_dataset.id", ondelete="CASCADE"),
+        primary_key=True,
+        autoincrement=False,
+        index=True,
+    )
+
+    def __repr__(self):
+        return f"<DatasetLshBucket {self.band}:{self.bucket} -> {self.dataset_id}>"
@@ -0,0 +1,219 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, or_, tuple_
+
+from app.modules.dataset.base_dataset import BaseDataset, Version
+from app.modules.dataset.models import DSMetaData
+from app.modules.recommendation.models import (
+    DatasetCooccurrence,
+    DatasetLshBucket,
+    DatasetNeighbor,
+    DatasetSignature,
+    RecommendationWatermark,
+)
+from core.repositories.BaseRepository import BaseRepository
+from core.repositories.upsert import upsert
+
+IN_CLAUSE_CHUNK = 1_000
+
+
+def _chunks(values: list, size: int = IN_CLAUSE_CHUNK):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class DatasetCooccurrenceRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(DatasetCooccurrence)
+
+    def increment(self, rows: List[dict]):
+        """Adds to the given cells. Does not commit."""
+        for chunk in _chunks(rows, 5_000):
+            upsert(self.session, self.model.__table__, chunk, ["dataset_id", "other_dataset_id"], increment=["weight"])
+
+    def rows_for(self, dataset_ids: List[int]) -> List[Tuple[int, int, float]]:
+        return [
+            row
+            for chunk in _chunks(sorted(dataset_ids))
+            for row in self.session.query(self.model.dataset_id, self.model.other_dataset_id, self.model.weight).filter(
+                self.model.dataset_id.in_(chunk)
+            )
+        ]
+
+    def popularity(self, dataset_ids: Iterable[int]) -> Dict[int, float]:
+        """The diagonal of the matrix for the given datasets."""
+        return {
+            dataset_id: weight
+            for chunk in _chunks(sorted(set(dataset_ids)))
+            for dataset_id, weight in self.session.query(self.model.dataset_id, self.model.weight).filter(
+                self.model.dataset_id.in_(chunk), self.model.other_dataset_id == self.model.dataset_id
+            )
+        }
+
+    def delete_all(self):
+        self.session.query(self.model).delete(synchronize_session=False)
+
+
+class DatasetNeighborRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(DatasetNeighbor)
+
+    def replace(self, neighbors: Dict[int, List[Tuple[int, float]]]):
+        """Replaces the neighbor lists of the given datasets. Does not commit."""
+        for chunk in _chunks(sorted(neighbors)):
+            self.session.query(self.model).filter(self.model.dataset_id.in_(chunk)).delete(synchronize_session=False)
+        rows = [
+            {"dataset_id": dataset_id, "rank": rank, "neighbor_id": neighbor_id, "score": score}
+            for dataset_id, ranked in neighbors.items()
+            for rank, (neighbor_id, score) in enumerate(ranked)
+        ]
+        if rows:
+            self.session.execute(self.model.__table__.insert(), rows)
+
+    def related_published(self, dataset_id: int, limit: int) -> List[BaseDataset]:
+        return (
+            BaseDataset.query.join(self.model, self.model.neighbor_id == BaseDataset.id)
+            .join(DSMetaData, BaseDataset.ds_meta_data_id == DSMetaData.id)
+            .filter(self.model.dataset_id == dataset_id, DSMetaData.dataset_doi.isnot(None))
+            .order_by(self.model.rank)
+            .limit(limit)
+            .all()
+        )
+
+    def delete_all(self):
+        self.session.query(self.model).delete(synchronize_session=False)
+
+
+class RecommendationWatermarkRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(RecommendationWatermark)
+
+    def lock(self, names: List[str]) -> Dict[str, RecommendationWatermark]:
+        """
+        Returns the watermarks, creating missing ones, locked for update: a second job run waits here until the
+        first one commits, so no record is counted twice. Does not commit.
+        """
+        upsert(self.session, self.model.__table__, [{"name": name, "last_record_id": 0} for name in names], ["name"])
+        marks = self.session.query(self.model).filter(self.model.name.in_(names)).order_by(self.model.name)
+        return {mark.name: mark for mark in marks.with_for_update()}
+
+    def delete_all(self):
+        self.session.query(self.model).delete(synchronize_session=False)
+
+
+class DatasetSignatureRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(DatasetSignature)
+
+    def save(self, dataset_id: int, version_id: Optional[int], item_count: int, signature: bytes, keys: List[int]):
+        """Replaces the signature of a dataset and its LSH bucket rows. Does not commit."""
+        self.session.query(DatasetLshBucket).filter(DatasetLshBucket.dataset_id == dataset_id).delete(
+            synchronize_session=False
+        )
+        upsert(
+            self.session,
+            self.model.__table__,
+            [{"dataset_id": dataset_id, "version_id": version_id, "item_count": item_count, "signature": signature}],
+            ["dataset_id"],
+            assign=["version_id", "item_count", "signature"],
+        )
+        if keys:
+            self.session.execute(
+                DatasetLshBucket.__table__.insert(),
+                [{"band": band, "bucket": bucket, "dataset_id": dataset_id} for band, bucket in enumerate(keys)],
+            )
+
+    def signature_of(self, dataset_id: int) -> Optional[bytes]:
+        row = self.session.query(self.model.signature).filter(self.model.dataset_id == dataset_id).first()
+        return row[0] if row else None
+
+    def candidates(self, keys: List[int]) -> Dict[int, bytes]:
+        """Signatures of the datasets sharing at least one LSH bucket with the given keys (primary-key lookups)."""
+        if not keys:
+            return {}
+        matching = (
+            self.session.query(DatasetLshBucket.dataset_id)
+            .filter(tuple_(DatasetLshBucket.band, DatasetLshBucket.bucket).in_(list(enumerate(keys))))
+            .distinct()
+            .subquery()
+        )
+        return dict(
+            self.session.query(self.model.dataset_id, self.model.signature).join(
+                matching, matching.c.dataset_id == self.model.dataset_id
+            )
+        )
+
+    def visible(self, dataset_ids: List[int], user_id: Optional[int] = None) -> List[BaseDataset]:
+        """The given datasets that are published or belong to the user."""
+        if not dataset_ids:
+            return []
+        visible = DSMetaData.dataset_doi.isnot(None)
+        if user_id is not None:
+            visible = or_(visible, BaseDataset.user_id == user_id)
+        return (
+            BaseDataset.query.join(DSMetaData, BaseDataset.ds_meta_data_id == DSMetaData.id)
+            .filter(BaseDataset.id.in_(dataset_ids), visible)
+            .all()
+        )
+
+    def stale(self, limit: int) -> List[Tuple[int, Optional[int]]]:
+        """(dataset_id, latest version id) of datasets whose signature is missing or older than their latest version."""
+        latest = (
+            self.session.query(Version.dataset_id, func.max(Version.id).label("version_id"))
+            .group_by(Version.dataset_id)
+            .subquery()
+        )
+        return (
+            self.session.query(BaseDataset.id, latest.c.version_id)
+            .outerjoin(latest, latest.c.dataset_id == BaseDataset.id)
+            .outerjoin(self.model, self.model.dataset_id == BaseDataset.id)
+            .filter(
+                or_(
+                    self.model.dataset_id.is_(None),
+                    ~self.model.version_id.is_not_distinct_from(latest.c.version_id),
+                )
+            )
+            .order_by(BaseDataset.id)
+            .limit(limit)
+            .all()
+        )
+
+    def delete_all(self):
+        self.session.query(DatasetLshBucket).delete(synchronize_session=False)
+        self.session.query(self.model).delete(synchronize_session=False)
+
+
+class InteractionRepository:
+    """Reads (visitor, dataset) interactions from a raw view or download record table."""
+
+    def __init__(self, model, cookie_column: str):
+        self.model = model
+        self.cookie = getattr(model, cookie_column)
+
+    def max_id(self) -> int:
+        return self.model.query.with_entities(func.max(self.model.id)).scalar() or 0
+
+    def between(self, after_id: int, up_to_id: int) -> List[Tuple[int, str, int]]:
+        """(user_id, cookie, dataset_id) of the records with after_id < id <= up_to_id."""
+        return (
+            self.model.query.with_entities(self.model.user_id, self.cookie, self.model.dataset_id)
+            .filter(self.model.id > after_id, self.model.id <= up_to_id)
+            .all()
+        )
+
+    def history(self, user_ids: List[int], cookies: List[str], up_to_id: int) -> List[Tuple[int, str, int]]:
+        """Earlier records (id <= up_to_id) of the given signed-in users and anonymous cookies."""
+        rows = []
+        for chunk in _chunks(sorted(user_ids)):
+            rows += (
+                self.model.query.with_entities(self.model.user_id, self.cookie, self.model.dataset_id)
+                .filter(self.model.id <= up_to_id, self.model.user_id.in_(chunk))
+                .all()
+            )
+        for chunk in _chunks(sorted(cookies)):
+            rows += (
+                self.model.query.with_entities(self.model.user_id, self.cookie, self.model.dataset_id)
+                .filter(self.model.id <= up_to_id, self.model.user_id.is_(None), self.cookie.in_(chunk))
+                .all()
+            )
+        return rows
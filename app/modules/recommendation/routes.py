@@ -0,0 +1,28 @@
+from flask import jsonify, request
+
+from app.modules.recommendation import recommendation_bp
+from app.modules.recommendation.services import DatasetSimilarityService, RecommendationService
+
+recommendation_service = RecommendationService()
+dataset_similarity_service = DatasetSimilarityService()
+
+
+@recommendation_bp.route("/dataset/<int:dataset_id>/related", methods=["GET"])
+def related_datasets(dataset_id):
+    limit = max(1, min(request.args.get("limit", 5, type=int), 50))
+    related = recommendation_service.related_datasets(dataset_id, limit=limit)
+    return jsonify(
+        [{"id": dataset.id, "title": dataset.ds_meta_data.title, "url": dataset.get_doi()} for dataset in related]
+    )
+
+
+@recommendation_bp.route("/dataset/<int:dataset_id>/similar", methods=["GET"])
+def similar_datasets(dataset_id):
+    limit = max(1, min(request.args.get("limit", 5, type=int), 50))
+    similar = dataset_similarity_service.similar_datasets(dataset_id, limit=limit)
+    return jsonify(
+        [
+            {"id": dataset.id, "title": dataset.ds_meta_data.title, "url": dataset.get_doi(), "similarity": similarity}
+            for dataset, similarity in similar
+        ]
+    )
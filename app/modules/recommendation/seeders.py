@@ -0,0 +1,11 @@
+from app.modules.recommendation.services import DatasetSimilarityService, RecommendationService
+from core.seeders.BaseSeeder import BaseSeeder
+
+
+class RecommendationSeeder(BaseSeeder):
+
+    priority = 10  # after every seeder that creates datasets or view/download records
+
+    def run(self):
+        RecommendationService().update(full=True)
+        DatasetSimilarityService().refresh(full=True)
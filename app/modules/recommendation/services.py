@@ -0,0 +1,340 @@
+import logging
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import unidecode
+from flask import current_app
+from scipy import sparse
+
+from app.modules.dataset.base_dataset import BaseDataset
+from app.modules.dataset.models import DSDownloadRecord, DSViewRecord
+from app.modules.recommendation.repositories import (
+    DatasetCooccurrenceRepository,
+    DatasetNeighborRepository,
+    DatasetSignatureRepository,
+    InteractionRepository,
+    RecommendationWatermarkRepository,
+)
+from app.modules.stats.services import visitor_key
+from core.services.BaseService import BaseService
+from core.sketches.minhash import MinHash, band_keys, jaccard
+
+logger = logging.getLogger(__name__)
+
+# A download is a stronger signal of interest than a view; a visitor's strongest interaction with a dataset counts
+INTERACTION_SOURCES = {
+    "dataset_download": (DSDownloadRecord, "download_cookie", 1.0),
+    "dataset_view": (DSViewRecord, "view_cookie", 0.5),
+}
+
+# (visitor, dataset_id, weight)
+Interaction = Tuple[str, int, float]
+
+
+def incidence_matrix(visitors: np.ndarray, datasets: np.ndarray, weights: np.ndarray, shape) -> sparse.csr_matrix:
+    """Visitor-by-dataset matrix holding the strongest interaction of each visitor with each dataset."""
+    keys = visitors.astype(np.int64) * shape[1] + datasets
+    order = np.lexsort((-weights, keys))
+    sorted_keys = keys[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+    picked = order[first]
+    return sparse.csr_matrix((weights[picked], (visitors[picked], datasets[picked])), shape=shape)
+
+
+def cooccurrence_delta(
+    history: Sequence[Interaction], new: Sequence[Interaction]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Change in the co-occurrence matrix C = B^T B caused by new interactions, where B is the visitor-by-dataset
+    incidence matrix. Only the visitors with new interactions can change C, so B is built for them alone: once
+    from their earlier history and once with the new interactions added, and the difference of the two products
+    is returned as (dataset_ids, other_dataset_ids, weights), diagonal (popularity) included.
+    """
+    empty = (np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=float))
+    if not new:
+        return empty
+
+    everything = list(history) + list(new)
+    visitor_ids, visitor_index = np.unique([visitor for visitor, _, _ in everything], return_inverse=True)
+    dataset_ids, dataset_index = np.unique([dataset for _, dataset, _ in everything], return_inverse=True)
+    weights = np.array([weight for _, _, weight in everything], dtype=float)
+    shape = (len(visitor_ids), len(dataset_ids))
+
+    split = len(history)
+    before = incidence_matrix(visitor_index[:split], dataset_index[:split], weights[:split], shape)
+    after = incidence_matrix(visitor_index, dataset_index, weights, shape)
+
+    delta = ((after.T @ after) - (before.T @ before)).tocoo()
+    changed = delta.data > 1e-12
+    if not changed.any():
+        return empty
+    return dataset_ids[delta.row[changed]], dataset_ids[delta.col[changed]], delta.data[changed]
+
+
+def top_k_neighbors(
+    dataset_id: int, others: np.ndarray, weights: np.ndarray, popularity: Dict[int, float], k: int
+) -> List[Tuple[int, float]]:
+    """Ranks co-occurring datasets by cosine similarity, C_ij / sqrt(C_ii * C_jj)."""
+    mask = others != dataset_id
+    others, weights = others[mask], weights[mask]
+    if not len(others):
+        return []
+
+    own = popularity.get(dataset_id, 0.0)
+    norms = np.sqrt(own * np.array([popularity.get(int(other), 0.0) for other in others]))
+    scores = np.divide(weights, norms, out=np.zeros_like(weights), where=norms > 0)
+
+    k = min(k, len(scores))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.lexsort((others[best], -scores[best]))]
+    return [(int(others[i]), float(scores[i])) for i in best if scores[i] > 0]
+
+
+class RecommendationService(BaseService):
+    def __init__(self):
+        super().__init__(DatasetNeighborRepository())
+        self.cooccurrence_repository = DatasetCooccurrenceRepository()
+        self.watermark_repository = RecommendationWatermarkRepository()
+        self.interactions = {
+            name: InteractionRepository(model, cookie_column)
+            for name, (model, cookie_column, _) in INTERACTION_SOURCES.items()
+        }
+        self.similarity_service = DatasetSimilarityService()
+
+    def related_datasets(self, dataset_id: int, limit: int = 5):
+        """
+        Published datasets that the visitors of this one also downloaded or viewed, best first, topped up with
+        datasets sharing most of its movies or files (which also covers datasets nobody has visited yet).
+        """
+        related = self.repository.related_published(dataset_id, limit)
+        if len(related) < limit:
+            seen = {dataset_id} | {dataset.id for dataset in related}
+            similar = self.similarity_service.similar_datasets(dataset_id, limit)
+            related += [dataset for dataset, _ in similar if dataset.id not in seen][:limit - len(related)]
+        return related
+
+    def update(self, full: bool = False, batch_size: Optional[int] = None) -> int:
+        """
+        Folds the records created since the last run into the co-occurrence matrix, batch_size records per kind
+        at a time, then recomputes the neighbor lists of the datasets whose rows changed. With full=True the
+        matrix is rebuilt from scratch. Returns the number of records processed.
+        """
+        batch_size = batch_size or current_app.config["RECOMMENDATION_BATCH_SIZE"]
+        session = self.repository.session
+
+        if full:
+            self.cooccurrence_repository.delete_all()
+            self.repository.delete_all()
+            self.watermark_repository.delete_all()
+            session.commit()
+
+        processed = 0
+        touched = set()
+        while True:
+            try:
+                marks = self.watermark_repository.lock(list(INTERACTION_SOURCES))
+                targets = {
+                    name: min(self.interactions[name].max_id(), marks[name].last_record_id + batch_size)
+                    for name in INTERACTION_SOURCES
+                }
+                if all(targets[name] <= marks[name].last_record_id for name in INTERACTION_SOURCES):
+                    session.rollback()
+                    break
+
+                records = {
+                    name: self.interactions[name].between(marks[name].last_record_id, targets[name])
+                    for name in INTERACTION_SOURCES
+                }
+                user_ids = {user_id for rows in records.values() for user_id, _, _ in rows if user_id is not None}
+                cookies = {cookie for rows in records.values() for user_id, cookie, _ in rows if user_id is None}
+
+                history, new = [], []
+                for name, (_, _, weight) in INTERACTION_SOURCES.items():
+                    earlier = self.interactions[name].history(user_ids, cookies, marks[name].last_record_id)
+                    history += self._as_interactions(earlier, weight)
+                    new += self._as_interactions(records[name], weight)
+
+                dataset_ids, other_ids, weights = cooccurrence_delta(history, new)
+                self.cooccurrence_repository.increment(
+                    [
+                        {"dataset_id": int(dataset_id), "other_dataset_id": int(other_id), "weight": float(weight)}
+                        for dataset_id, other_id, weight in zip(dataset_ids, other_ids, weights)
+                    ]
+                )
+                for name, target in targets.items():
+                    marks[name].last_record_id = target
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+            processed += sum(len(rows) for rows in records.values())
+            touched.update(int(dataset_id) for dataset_id in dataset_ids)
+
+        self.refresh_neighbors(touched)
+        logger.info(f"Recommendations: folded {processed} records, refreshed {len(touched)} datasets")
+        return processed
+
+    @staticmethod
+    def _as_interactions(records, weight: float) -> List[Interaction]:
+        interactions = []
+        for user_id, cookie, dataset_id in records:
+            visitor = visitor_key(user_id, cookie)
+            if visitor is not None and dataset_id is not None:
+                interactions.append((visitor, dataset_id, weight))
+        return interactions
+
+    def refresh_neighbors(self, dataset_ids, chunk_size: int = 500):
+        """Recomputes the top-k neighbor lists of the given datasets from their co-occurrence rows."""
+        k = current_app.config["RECOMMENDATION_TOP_K"]
+        session = self.repository.session
+        dataset_ids = sorted(dataset_ids)
+        for start in range(0, len(dataset_ids), chunk_size):
+            chunk = dataset_ids[start:start + chunk_size]
+            rows = self.cooccurrence_repository.rows_for(chunk)
+            neighbors = {dataset_id: [] for dataset_id in chunk}
+            if rows:
+                owners = np.array([row[0] for row in rows], dtype=np.int64)
+                others = np.array([row[1] for row in rows], dtype=np.int64)
+                weights = np.array([row[2] for row in rows], dtype=float)
+                popularity = self.cooccurrence_repository.popularity(others.tolist())
+
+                order = np.argsort(owners, kind="stable")
+                owners, others, weights = owners[order], others[order], weights[order]
+                unique_owners, starts = np.unique(owners, return_index=True)
+                ends = np.append(starts[1:], len(owners))
+                for owner, begin, end in zip(unique_owners, starts, ends):
+                    neighbors[int(owner)] = top_k_neighbors(
+                        int(owner), others[begin:end], weights[begin:end], popularity, k
+                    )
+            try:
+                self.repository.replace(neighbors)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+
+
+MINHASH = MinHash(num_perm=128)
+
+# 32 bands of 4 rows: datasets become candidates from a Jaccard similarity of about 0.4
+LSH_BANDS = 32
+
+RELATED_MIN_SIMILARITY = 0.3
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def movie_identity(title: Optional[str], year: Optional[int]) -> str:
+    """Case, accent and punctuation-insensitive identity of a movie, e.g. "movie:blade runner:1982"."""
+    words = _WORD.findall(unidecode.unidecode(title or "").lower())
+    return f"movie:{' '.join(words)}:{year or ''}"
+
+
+def dataset_items(dataset) -> Set[str]:
+    """The identities a dataset is compared by: its movies for movie datasets, the checksums of its files otherwise."""
+    movies = getattr(dataset, "movies", None)
+    if movies:
+        return {movie_identity(movie.title, movie.year) for movie in movies}
+    return {f"file:{file.checksum}" for feature_model in dataset.feature_models for file in feature_model.files}
+
+
+class DatasetSimilarityService(BaseService):
+    """
+    Content similarity between datasets. Each dataset's items are summarised in a MinHash signature whose LSH band
+    keys are stored in dataset_lsh_bucket, so finding similar datasets is a primary-key lookup per band followed
+    by comparing a handful of candidate signatures, instead of a comparison with every dataset.
+    """
+
+    def __init__(self):
+        super().__init__(DatasetSignatureRepository())
+
+    def index_dataset(self, dataset, version_id: Optional[int] = None):
+        """Stores the signature of a dataset as of the given version."""
+        try:
+            self._save_signature(dataset, version_id)
+            self.repository.session.commit()
+        except Exception:
+            self.repository.session.rollback()
+            raise
+
+    def _save_signature(self, dataset, version_id: Optional[int]):
+        items = dataset_items(dataset)
+        signature = MINHASH.signature(items)
+        # Empty datasets get no buckets: they would all look identical to each other
+        keys = band_keys(signature, LSH_BANDS) if items else []
+        self.repository.save(dataset.id, version_id, len(items), MINHASH.to_bytes(signature), keys)
+
+    def refresh(self, full: bool = False, chunk_size: int = 500) -> int:
+        """
+        Recomputes the signatures of the datasets that have a new version since their signature was computed (or
+        no signature yet), chunk_size datasets at a time. With full=True every signature is recomputed. Returns
+        the number of datasets processed.
+        """
+        session = self.repository.session
+        if full:
+            self.repository.delete_all()
+            session.commit()
+
+        processed = set()
+        while True:
+            stale = [(dataset_id, version_id) for dataset_id, version_id in self.repository.stale(chunk_size)
+                     if dataset_id not in processed]
+            if not stale:
+                break
+            datasets = {
+                dataset.id: dataset
+                for dataset in BaseDataset.query.filter(BaseDataset.id.in_([dataset_id for dataset_id, _ in stale]))
+            }
+            try:
+                for dataset_id, version_id in stale:
+                    self._save_signature(datasets[dataset_id], version_id)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            processed.update(dataset_id for dataset_id, _ in stale)
+
+        logger.info(f"Dataset signatures: recomputed {len(processed)}")
+        return len(processed)
+
+    def matches(
+        self, signature: np.ndarray, min_similarity: float, limit: int, exclude: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """(dataset_id, estimated Jaccard similarity) of the LSH candidates at least min_similarity similar."""
+        candidates = self.repository.candidates(band_keys(signature, LSH_BANDS))
+        scored = [
+            (dataset_id, jaccard(signature, MINHASH.from_bytes(data)))
+            for dataset_id, data in candidates.items()
+            if dataset_id != exclude
+        ]
+        scored = sorted((item for item in scored if item[1] >= min_similarity), key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
+
+    def similar_datasets(self, dataset_id: int, limit: int = 5) -> List[Tuple[BaseDataset, float]]:
+        """Published datasets with mostly the same movies or files as the given one, most similar first."""
+        data = self.repository.signature_of(dataset_id)
+        if data is None:
+            return []
+        matches = self.matches(MINHASH.from_bytes(data), RELATED_MIN_SIMILARITY, limit * 2, exclude=dataset_id)
+        return self._visible(matches, user_id=None)[:limit]
+
+    def near_duplicates(
+        self, items: Iterable[str], user_id: Optional[int] = None, exclude: Optional[int] = None, limit: int = 5
+    ) -> List[Tuple[BaseDataset, float]]:
+        """
+        Datasets that a dataset with the given items would nearly duplicate. Only published datasets and the
+        user's own are returned.
+        """
+        items = set(items)
+        if not items:
+            return []
+        threshold = current_app.config["NEAR_DUPLICATE_THRESHOLD"]
+        matches = self.matches(MINHASH.signature(items), threshold, limit * 2, exclude=exclude)
+        return self._visible(matches, user_id)[:limit]
+
+    def _visible(self, matches: List[Tuple[int, float]], user_id: Optional[int]) -> List[Tuple[BaseDataset, float]]:
+        datasets = {dataset.id: dataset for dataset in self.repository.visible([i for i, _ in matches], user_id)}
+        return [(datasets[dataset_id], score) for dataset_id, score in matches if dataset_id in datasets]
@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.modules.recommendation.models import DatasetLshBucket, DatasetSignature
+from app.modules.recommendation.services import (
+    DatasetSimilarityService,
+    cooccurrence_delta,
+    dataset_items,
+    movie_identity,
+    top_k_neighbors,
+)
+from core.sketches.minhash import MinHash, jaccard
+
+
+def _matrix(dataset_ids, other_ids, weights):
+    return {(int(a), int(b)): float(w) for a, b, w in zip(dataset_ids, other_ids, weights)}
+
+
+def test_incremental_cooccurrence_matches_full_recomputation():
+    earlier = [("alice", 1, 1.0), ("alice", 2, 0.5), ("bob", 2, 1.0)]
+    later = [("alice", 3, 1.0), ("bob", 1, 1.0), ("bob", 2, 0.5), ("carol", 3, 1.0)]
+
+    full = _matrix(*cooccurrence_delta([], earlier + later))
+    first = _matrix(*cooccurrence_delta([], earlier))
+    second = _matrix(*cooccurrence_delta(earlier, later))
+
+    combined = dict(first)
+    for cell, weight in second.items():
+        combined[cell] = combined.get(cell, 0.0) + weight
+    assert combined == pytest.approx(full)
+
+    # Repeated or weaker interactions with an already counted dataset change nothing
+    assert full[(1, 2)] == full[(2, 1)] == pytest.approx(1.0 * 0.5 + 1.0 * 1.0)
+    assert full[(2, 2)] == pytest.approx(0.5**2 + 1.0**2)
+    assert (2, 3) in full and (1, 3) in full
+
+
+def test_top_k_neighbors_ranks_by_cosine_and_skips_itself():
+    popularity = {1: 4.0, 2: 1.0, 3: 16.0, 4: 1.0}
+    others = np.array([1, 2, 3, 4])
+    weights = np.array([4.0, 1.0, 2.0, 0.0])
+
+    assert top_k_neighbors(1, others, weights, popularity, k=2) == [(2, 0.5), (3, 0.25)]
+    assert top_k_neighbors(1, np.array([1]), np.array([4.0]), popularity, k=2) == []
+
+
+def test_minhash_estimates_jaccard_similarity():
+    minhash = MinHash(num_perm=256)
+    first = minhash.signature(f"movie:{i}" for i in range(200))
+    second = minhash.signature(f"movie:{i}" for i in range(20, 220))
+
+    assert jaccard(first, second) == pytest.approx(180 / 220, abs=0.08)
+    assert jaccard(first, minhash.signature(f"movie:{i}" for i in range(200, 400))) < 0.05
+    np.testing.assert_array_equal(minhash.from_bytes(minhash.to_bytes(first)), first)
+
+
+def test_movie_identities_ignore_case_accents_and_punctuation():
+    assert movie_identity("Amélie", 2001) == movie_identity("  AMELIE!", 2001) == "movie:amelie:2001"
+    assert movie_identity("Alien 3", 1992) != movie_identity("Alien", 1992)
+
+    dataset = SimpleNamespace(movies=[SimpleNamespace(title="Heat", year=1995)], feature_models=[])
+    assert dataset_items(dataset) == {"movie:heat:1995"}
+
+
+def _dataset(dataset_id, titles):
+    movies = [SimpleNamespace(title=title, year=2000) for title in titles]
+    return SimpleNamespace(id=dataset_id, movies=movies, feature_models=[])
+
+
+def test_near_duplicates_are_found_through_lsh_buckets(test_app):
+    engine = create_engine("sqlite://")
+    DatasetSignature.__table__.create(engine)
+    DatasetLshBucket.__table__.create(engine)
+    session = Session(engine)
+    service = DatasetSimilarityService()
+    service.repository.session = session
+
+    titles = [f"Movie {i}" for i in range(50)]
+    service.index_dataset(_dataset(1, titles), version_id=7)
+    service.index_dataset(_dataset(2, titles[:48] + ["Other 1", "Other 2"]), version_id=8)
+    service.index_dataset(_dataset(3, [f"Unrelated {i}" for i in range(50)]), version_id=9)
+    service.index_dataset(_dataset(4, []), version_id=10)
+
+    assert session.query(DatasetLshBucket).filter_by(dataset_id=4).count() == 0
+    with test_app.app_context():
+        visible = lambda ids, user_id: [SimpleNamespace(id=dataset_id) for dataset_id in ids]  # noqa: E731
+        with patch.object(service.repository, "visible", side_effect=visible):
+            duplicates = service.near_duplicates({f"movie:movie {i}:2000" for i in range(50)})
+            assert [dataset.id for dataset, _ in duplicates] == [1, 2]
+            assert duplicates[0][1] == 1.0
+
+            similar = service.similar_datasets(2)
+            assert [dataset.id for dataset, _ in similar] == [1]
+            assert service.near_duplicates(set()) == []
+    session.close()
@@ -0,0 +1,3 @@
+from core.blueprints.base_blueprint import BaseBlueprint
+
+stats_bp = BaseBlueprint("stats", __name__)
@@ -0,0 +1,89 @@
+from app import db
+
+
+class StatsRollup(db.Model):
+    """View/download count of a dataset or file over one hour or one day (bucket_start is naive UTC)."""
+
+    __tablename__ = "stats_rollup"
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(16), nullable=False)  # "dataset" or "file"
+    subject_id = db.Column(db.Integer, nullable=False)
+    metric = db.Column(db.String(16), nullable=False)  # "view" or "download"
+    granularity = db.Column(db.String(8), nullable=False)  # "hour" or "day"
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "subject", "subject_id", "metric", "granularity", "bucket_start", name="uq_stats_rollup_bucket"
+        ),
+    )
+
+    def __repr__(self):
+        return (
+            f"<StatsRollup {self.subject}={self.subject_id} {self.metric} "
+            f"{self.granularity}={self.bucket_start} count={self.count}>"
+        )
+
+
+class StatsCounter(db.Model):
+    """Site-wide counter shown on the homepage."""
+
+    __tablename__ = "stats_counter"
+    name = db.Column(db.String(64), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<StatsCounter {self.name}={self.value}>"
+
+
+class StatsSketch(db.Model):
+    """
+    HyperLogLog sketch of the distinct visitors who viewed or downloaded a dataset or file, for one day or for all
+    time (granularity "all", bucket_start 1970-01-01).
+    """
+
+    __tablename__ = "stats_sketch"
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(16), nullable=False)
+    subject_id = db.Column(db.Integer, nullable=False)
+    metric = db.Column(db.String(16), nullable=False)
+    granularity = db.Column(db.String(8), nullable=False)  # "day" or "all"
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    registers = db.Column(db.LargeBinary, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "subject", "subject_id", "metric", "granularity", "bucket_start", name="uq_stats_sketch_bucket"
+        ),
+    )
+
+    def __repr__(self):
+        return f"<StatsSketch {self.subject}={self.subject_id} {self.metric} {self.granularity}={self.bucket_start}>"
+
+
+class StatsTrending(db.Model):
+    """
+    Time-decayed popularity of a dataset, stored as a log-space score relative to a fixed epoch (see
+    core.sketches.decay) so the ranking never has to be recomputed as time passes. Indexed for top-k reads.
+    """
+
+    __tablename__ = "stats_trending"
+    dataset_id = db.Column(db.Integer, db.ForeignKey("base_dataset.id", ondelete="CASCADE"), primary_key=True)
+    score = db.Column(db.Double, nullable=True, index=True)
+
+    def __repr__(self):
+        return f"<StatsTrending dataset={self.dataset_id} score={self.score}>"
+
+
+class StatsPublishedDataset(db.Model):
+    """
+    A published (DOI-bearing) dataset, kept by the catalogue listener so the homepage lists the latest ones by
+    reading the tail of this primary key instead of filtering every dataset by its metadata.
+    """
+
+    __tablename__ = "stats_published_dataset"
+    dataset_id = db.Column(db.Integer, db.ForeignKey("base_dataset.id", ondelete="CASCADE"), primary_key=True)
+
+    def __repr__(self):
+        return f"<StatsPublishedDataset dataset={self.dataset_id}>"
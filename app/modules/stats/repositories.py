@@ -0,0 +1,250 @@
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+from sqlalchemy import func, tuple_
+
+from app.modules.dataset.base_dataset import BaseDataset
+from app.modules.dataset.models import DataSet, DSMetaData
+from app.modules.featuremodel.models import FeatureModel
+from app.modules.hubfile.models import Hubfile
+from app.modules.stats.models import (
+    StatsCounter,
+    StatsPublishedDataset,
+    StatsRollup,
+    StatsSketch,
+    StatsTrending,
+)
+from core.repositories.BaseRepository import BaseRepository
+from core.repositories.upsert import upsert
+
+ROLLUP_KEY = ("subject", "subject_id", "metric", "granularity", "bucket_start")
+SKETCH_KEY = ROLLUP_KEY
+
+
+class StatsRollupRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(StatsRollup)
+
+    def increment(self, rows: List[dict]):
+        """Adds each row's count to its bucket. Does not commit."""
+        upsert(self.session, self.model.__table__, rows, ROLLUP_KEY, increment=["count"])
+
+    def series(self, subject: str, subject_ids: List[int], granularity: str, since: datetime) -> List[StatsRollup]:
+        return (
+            self.session.query(self.model)
+            .filter(
+                self.model.subject == subject,
+                self.model.subject_id.in_(subject_ids),
+                self.model.granularity == granularity,
+                self.model.bucket_start >= since,
+            )
+            .order_by(self.model.bucket_start)
+            .all()
+        )
+
+    def totals(self, subject: str, subject_ids: List[int]) -> Dict[tuple, int]:
+        """Returns {(subject_id, metric): count} summed over the daily buckets."""
+        if not subject_ids:
+            return {}
+        rows = (
+            self.session.query(self.model.subject_id, self.model.metric, func.sum(self.model.count))
+            .filter(
+                self.model.subject == subject,
+                self.model.subject_id.in_(subject_ids),
+                self.model.granularity == "day",
+            )
+            .group_by(self.model.subject_id, self.model.metric)
+            .all()
+        )
+        return {(subject_id, metric): int(total) for subject_id, metric, total in rows}
+
+    def delete_all(self):
+        self.session.query(self.model).delete(synchronize_session=False)
+
+
+class StatsCounterRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(StatsCounter)
+
+    def increment(self, deltas: Dict[str, int]):
+        """Adds to the named counters. Does not commit."""
+        rows = [{"name": name, "value": value} for name, value in deltas.items() if value]
+        upsert(self.session, self.model.__table__, rows, ["name"], increment=["value"])
+
+    def assign(self, values: Dict[str, int]):
+        """Overwrites the named counters. Does not commit."""
+        rows = [{"name": name, "value": value} for name, value in values.items()]
+        upsert(self.session, self.model.__table__, rows, ["name"], assign=["value"])
+
+    def as_dict(self) -> Dict[str, int]:
+        return {name: int(value) for name, value in self.session.query(self.model.name, self.model.value)}
+
+    def count_feature_models(self) -> int:
+        return self.session.query(func.count(FeatureModel.id)).scalar()
+
+
+class StatsSketchRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(StatsSketch)
+
+    def lock(
+        self, subject: str, metric: str, keys: List[Tuple[int, str, datetime]], empty: bytes
+    ) -> Dict[tuple, StatsSketch]:
+        """
+        Returns the sketches for (subject_id, granularity, bucket_start) keys, creating missing ones, locked with
+        SELECT ... FOR UPDATE so concurrent writers merge into them one at a time. Does not commit.
+        """
+        keys = sorted(set(keys))
+        if not keys:
+            return {}
+        rows = [
+            {
+                "subject": subject,
+                "subject_id": subject_id,
+                "metric": metric,
+                "granularity": granularity,
+                "bucket_start": start,
+                "registers": empty,
+            }
+            for subject_id, granularity, start in keys
+        ]
+        upsert(self.session, self.model.__table__, rows, SKETCH_KEY)
+
+        sketches = (
+            self.session.query(self.model)
+            .filter(
+                self.model.subject == subject,
+                self.model.metric == metric,
+                tuple_(self.model.subject_id, self.model.granularity, self.model.bucket_start).in_(keys),
+            )
+            .order_by(self.model.id)
+            .with_for_update()
+            .all()
+        )
+        return {(sketch.subject_id, sketch.granularity, sketch.bucket_start): sketch for sketch in sketches}
+
+    def registers(self, subject: str, subject_ids: List[int], metric: str, granularity: str,
+                  since: datetime = None) -> List[Tuple[int, bytes]]:
+        if not subject_ids:
+            return []
+        query = self.session.query(self.model.subject_id, self.model.registers).filter(
+            self.model.subject == subject,
+            self.model.subject_id.in_(subject_ids),
+            self.model.metric == metric,
+            self.model.granularity == granularity,
+        )
+        if since is not None:
+            query = query.filter(self.model.bucket_start >= since)
+        return query.all()
+
+    def delete_all(self):
+        self.session.query(self.model).delete(synchronize_session=False)
+
+
+class StatsTrendingRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(StatsTrending)
+
+    def lock(self, dataset_ids: List[int]) -> Dict[int, StatsTrending]:
+        """Returns the trending rows of the datasets, creating missing ones, locked for update. Does not commit."""
+        dataset_ids = sorted(set(dataset_ids))
+        if not dataset_ids:
+            return {}
+        rows = [{"dataset_id": dataset_id, "score": None} for dataset_id in dataset_ids]
+        upsert(self.session, self.model.__table__, rows, ["dataset_id"])
+        trending = (
+            self.session.query(self.model)
+            .filter(self.model.dataset_id.in_(dataset_ids))
+            .order_by(self.model.dataset_id)
+            .with_for_update()
+            .all()
+        )
+        return {row.dataset_id: row for row in trending}
+
+    def assign(self, scores: Dict[int, float]):
+        rows = [{"dataset_id": dataset_id, "score": score} for dataset_id, score in scores.items()]
+        upsert(self.session, self.model.__table__, rows, ["dataset_id"], assign=["score"])
+
+    def top_published(self, limit: int) -> List[BaseDataset]:
+        """Highest-scoring published datasets, read in score order from the score index."""
+        return (
+            BaseDataset.query.join(self.model, self.model.dataset_id == BaseDataset.id)
+            .join(DSMetaData, BaseDataset.ds_meta_data_id == DSMetaData.id)
+            .filter(self.model.score.isnot(None), DSMetaData.dataset_doi.isnot(None))
+            .order_by(self.model.score.desc())
+            .limit(limit)
+            .all()
+        )
+
+    def delete_all(self):
+        self.session.query(self.model).delete(synchronize_session=False)
+
+
+class StatsPublishedRepository(BaseRepository):
+    def __init__(self):
+        super().__init__(StatsPublishedDataset)
+
+    def add(self, dataset_ids: List[int]):
+        """Does not commit."""
+        rows = [{"dataset_id": dataset_id} for dataset_id in dataset_ids]
+        upsert(self.session, self.model.__table__, rows, ["dataset_id"])
+
+    def remove(self, dataset_ids: List[int]):
+        """Does not commit."""
+        if dataset_ids:
+            self.session.query(self.model).filter(self.model.dataset_id.in_(dataset_ids)).delete(
+                synchronize_session=False
+            )
+
+    def latest(self, limit: int) -> List[BaseDataset]:
+        """Most recently created published datasets, read backwards from the primary key."""
+        return (
+            self.session.query(BaseDataset)
+            .join(self.model, self.model.dataset_id == BaseDataset.id)
+            .order_by(self.model.dataset_id.desc())
+            .limit(limit)
+            .all()
+        )
+
+    def replace_all(self) -> int:
+        """Relists every published dataset from the dataset tables. Returns how many there are. Does not commit."""
+        self.session.query(self.model).delete(synchronize_session=False)
+        published = self.session.query(DataSet.id).join(DSMetaData).filter(DSMetaData.dataset_doi.isnot(None))
+        dataset_ids = [dataset_id for dataset_id, in published]
+        self.add(dataset_ids)
+        return len(dataset_ids)
+
+
+class StatsSubjectRepository:
+    """Read-only lookups of the datasets, files and raw records that statistics are computed from."""
+
+    def record_chunks(self, model, columns: List[str], chunk_size: int) -> Iterator[list]:
+        """
+        Yields the given columns of every record of `model` in primary-key order, chunk_size rows at a time.
+        Keyset pagination keeps memory bounded without holding a streaming cursor open, so the caller can write
+        between chunks.
+        """
+        last_id = 0
+        while True:
+            chunk = (
+                model.query.with_entities(model.id, *(getattr(model, column) for column in columns))
+                .filter(model.id > last_id)
+                .order_by(model.id)
+                .limit(chunk_size)
+                .all()
+            )
+            if not chunk:
+                return
+            last_id = chunk[-1][0]
+            yield [tuple(row[1:]) for row in chunk]
+
+    def dataset_exists(self, dataset_id: int) -> bool:
+        return BaseDataset.query.with_entities(BaseDataset.id).filter_by(id=dataset_id).first() is not None
+
+    def file_ids_of_dataset(self, dataset_id: int) -> List[int]:
+        return [
+            file_id
+            for (file_id,) in Hubfile.query.with_entities(Hubfile.id)
+            .join(FeatureModel, Hubfile.feature_model_id == FeatureModel.id)
+            .filter(FeatureModel.data_set_id == dataset_id)
+        ]
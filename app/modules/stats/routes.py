@@ -0,0 +1,19 @@
+from flask import abort, jsonify, request
+
+from app.modules.stats import stats_bp
+from app.modules.stats.services import GRANULARITIES, StatsService
+
+stats_service = StatsService()
+
+
+@stats_bp.route("/dataset/<int:dataset_id>/stats", methods=["GET"])
+def dataset_stats(dataset_id):
+    granularity = request.args.get("granularity", "day")
+    if granularity not in GRANULARITIES:
+        return jsonify({"error": f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+
+    if not stats_service.dataset_exists(dataset_id):
+        abort(404)
+
+    days = request.args.get("days", 30, type=int)
+    return jsonify(stats_service.dataset_statistics(dataset_id, granularity=granularity, days=days))
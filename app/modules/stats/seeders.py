@@ -0,0 +1,10 @@
+from app.modules.stats.services import StatsService
+from core.seeders.BaseSeeder import BaseSeeder
+
+
+class StatsSeeder(BaseSeeder):
+
+    priority = 10  # after every seeder that creates datasets or view/download records
+
+    def run(self):
+        StatsService().rebuild()
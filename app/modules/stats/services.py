@@ -0,0 +1,446 @@
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import event, inspect
+
+from app import db
+from app.modules.dataset.models import DataSet, DSDownloadRecord, DSMetaData, DSViewRecord
+from app.modules.featuremodel.models import FeatureModel
+from app.modules.hubfile.models import HubfileDownloadRecord, HubfileViewRecord
+from app.modules.stats.repositories import (
+    StatsCounterRepository,
+    StatsPublishedRepository,
+    StatsRollupRepository,
+    StatsSketchRepository,
+    StatsSubjectRepository,
+    StatsTrendingRepository,
+)
+from core.ingestion.pipeline import record_pipeline
+from core.services.BaseService import BaseService
+from core.sketches.decay import decay_rate, log_weight, logaddexp
+from core.sketches.hyperloglog import HyperLogLog
+
+GRANULARITIES = ("hour", "day")
+MAX_DAYS = {"hour": 14, "day": 366}
+REBUILD_CHUNK_SIZE = 5_000
+
+# Distinct-visitor sketches: 4 KiB each, ~1.6% standard error (see HyperLogLog)
+SKETCH_PRECISION = 12
+ALL_TIME = datetime(1970, 1, 1)
+
+# A download says more about a dataset's popularity than a view
+TRENDING_WEIGHTS = {"view": 1.0, "download": 3.0}
+
+HOMEPAGE_COUNTERS = (
+    "datasets_counter",
+    "feature_models_counter",
+    "total_dataset_views",
+    "total_dataset_downloads",
+    "total_feature_model_views",
+    "total_feature_model_downloads",
+)
+
+
+@dataclass(frozen=True)
+class CatalogChanges:
+    published: List[int]
+    unpublished: List[int]
+    feature_models: int
+
+    def __bool__(self):
+        return bool(self.published or self.unpublished or self.feature_models)
+
+
+@dataclass(frozen=True)
+class RollupSource:
+    subject: str
+    metric: str
+    model: type
+    target_column: str
+    date_column: str
+    cookie_column: str
+    counter: str
+
+
+# Keyed by the record kinds registered with the ingestion pipeline
+ROLLUP_SOURCES = {
+    "dataset_view": RollupSource(
+        "dataset", "view", DSViewRecord, "dataset_id", "view_date", "view_cookie", "total_dataset_views"
+    ),
+    "dataset_download": RollupSource(
+        "dataset",
+        "download",
+        DSDownloadRecord,
+        "dataset_id",
+        "download_date",
+        "download_cookie",
+        "total_dataset_downloads",
+    ),
+    "file_view": RollupSource(
+        "file", "view", HubfileViewRecord, "file_id", "view_date", "view_cookie", "total_feature_model_views"
+    ),
+    "file_download": RollupSource(
+        "file",
+        "download",
+        HubfileDownloadRecord,
+        "file_id",
+        "download_date",
+        "download_cookie",
+        "total_feature_model_downloads",
+    ),
+}
+
+
+def utc_naive(moment: datetime) -> datetime:
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    moment = utc_naive(moment).replace(minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def rollup_rows(source: RollupSource, events: Iterable[Tuple[int, datetime]]) -> List[dict]:
+    """Aggregates (subject_id, occurred_at) pairs into one row per hourly and daily bucket."""
+    counts = Counter()
+    for subject_id, occurred_at in events:
+        if subject_id is None or occurred_at is None:
+            continue
+        for granularity in GRANULARITIES:
+            counts[(subject_id, granularity, bucket_start(occurred_at, granularity))] += 1
+
+    return [
+        {
+            "subject": source.subject,
+            "subject_id": subject_id,
+            "metric": source.metric,
+            "granularity": granularity,
+            "bucket_start": start,
+            "count": count,
+        }
+        for (subject_id, granularity, start), count in counts.items()
+    ]
+
+
+def visitor_key(user_id: Optional[int], cookie: Optional[str]) -> Optional[str]:
+    """Signed-in users count once across devices; anonymous visitors are identified by their cookie."""
+    if user_id is not None:
+        return f"user:{user_id}"
+    return f"cookie:{cookie}" if cookie else None
+
+
+def catalog_changes(session) -> CatalogChanges:
+    """
+    Datasets published or unpublished (created or deleted with a DOI, or whose DOI was set or cleared) and the
+    change in the number of feature models, from the objects a flush is writing. Reads no table.
+    """
+    published, unpublished, feature_models = [], [], 0
+    for instance in session.new:
+        if isinstance(instance, FeatureModel):
+            feature_models += 1
+        elif isinstance(instance, DataSet) and instance.ds_meta_data and instance.ds_meta_data.dataset_doi:
+            published.append(instance.id)
+    for instance in session.deleted:
+        if isinstance(instance, FeatureModel):
+            feature_models -= 1
+        elif isinstance(instance, DataSet) and instance.ds_meta_data and _doi_before_flush(instance.ds_meta_data):
+            unpublished.append(instance.id)
+    for instance in session.dirty:
+        if not isinstance(instance, DSMetaData):
+            continue
+        history = inspect(instance).attrs.dataset_doi.history
+        if not history.has_changes():
+            continue
+        dataset = instance.dataset
+        if not isinstance(dataset, DataSet) or dataset in session.new or dataset in session.deleted:
+            continue
+        if instance.dataset_doi and not _doi_before_flush(instance):
+            published.append(dataset.id)
+        elif _doi_before_flush(instance) and not instance.dataset_doi:
+            unpublished.append(dataset.id)
+    return CatalogChanges(published, unpublished, feature_models)
+
+
+def _doi_before_flush(metadata: DSMetaData) -> Optional[str]:
+    history = inspect(metadata).attrs.dataset_doi.history
+    if not history.has_changes():
+        return metadata.dataset_doi
+    return history.deleted[0] if history.deleted else None
+
+
+def sketch_buckets(events: Iterable[Tuple[int, datetime, Optional[str]]]) -> Dict[tuple, HyperLogLog]:
+    """Builds a daily and an all-time sketch per subject from (subject_id, occurred_at, visitor) triples."""
+    sketches = {}
+    for subject_id, occurred_at, visitor in events:
+        if subject_id is None or occurred_at is None or visitor is None:
+            continue
+        for key in ((subject_id, "day", bucket_start(occurred_at, "day")), (subject_id, "all", ALL_TIME)):
+            sketch = sketches.get(key)
+            if sketch is None:
+                sketch = sketches[key] = HyperLogLog(SKETCH_PRECISION)
+            sketch.add(visitor)
+    return sketches
+
+
+class StatsService(BaseService):
+    def __init__(self):
+        super().__init__(StatsRollupRepository())
+        self.counter_repository = StatsCounterRepository()
+        self.sketch_repository = StatsSketchRepository()
+        self.subject_repository = StatsSubjectRepository()
+        self.trending_repository = StatsTrendingRepository()
+        self.published_repository = StatsPublishedRepository()
+
+    def on_records_flushed(self, kind: str, rows: List[dict]):
+        """Folds a batch of new raw records into the rollups. Runs inside the pipeline's transaction."""
+        source = ROLLUP_SOURCES.get(kind)
+        if source is None:
+            return
+        self.repository.increment(
+            rollup_rows(source, ((row[source.target_column], row[source.date_column]) for row in rows))
+        )
+        self.counter_repository.increment({source.counter: len(rows)})
+        self._merge_sketches(
+            source,
+            sketch_buckets(
+                (
+                    row[source.target_column],
+                    row[source.date_column],
+                    visitor_key(row.get("user_id"), row.get(source.cookie_column)),
+                )
+                for row in rows
+            ),
+        )
+        if source.subject == "dataset":
+            self._bump_trending(
+                self._trending_scores(source, ((row[source.target_column], row[source.date_column]) for row in rows))
+            )
+
+    def _trending_scores(
+        self, source: RollupSource, events: Iterable[Tuple[int, datetime]], scores: Optional[dict] = None
+    ) -> Dict[int, float]:
+        rate = decay_rate(current_app.config["TRENDING_HALF_LIFE_HOURS"] * 3600)
+        weight = TRENDING_WEIGHTS[source.metric]
+        scores = {} if scores is None else scores
+        for dataset_id, occurred_at in events:
+            if dataset_id is None or occurred_at is None:
+                continue
+            scores[dataset_id] = logaddexp(scores.get(dataset_id), log_weight(weight, occurred_at, rate))
+        return scores
+
+    def _bump_trending(self, scores: Dict[int, float]):
+        stored = self.trending_repository.lock(list(scores))
+        for dataset_id, score in scores.items():
+            stored[dataset_id].score = logaddexp(stored[dataset_id].score, score)
+        self.trending_repository.session.flush()
+
+    def _merge_sketches(self, source: RollupSource, sketches: Dict[tuple, HyperLogLog]):
+        stored = self.sketch_repository.lock(
+            source.subject, source.metric, list(sketches), HyperLogLog(SKETCH_PRECISION).to_bytes()
+        )
+        for key, sketch in sketches.items():
+            row = stored[key]
+            row.registers = HyperLogLog.from_bytes(row.registers).merge(sketch).to_bytes()
+        self.sketch_repository.session.flush()
+
+    def homepage_counters(self) -> dict:
+        values = self.counter_repository.as_dict()
+        return {name: values.get(name, 0) for name in HOMEPAGE_COUNTERS}
+
+    def latest_published(self, limit: int = 5):
+        return self.published_repository.latest(limit)
+
+    def on_catalog_changed(self, changes: CatalogChanges):
+        """
+        Applies a flush's catalogue changes to the counters and the list of published datasets with single-row
+        writes. Runs inside the flushing transaction (see _follow_catalog).
+        """
+        self.counter_repository.increment(
+            {
+                "datasets_counter": len(changes.published) - len(changes.unpublished),
+                "feature_models_counter": changes.feature_models,
+            }
+        )
+        self.published_repository.add(changes.published)
+        self.published_repository.remove(changes.unpublished)
+
+    def rebuild_catalog(self):
+        """Recounts published datasets and feature models and relists the published datasets."""
+        session = self.counter_repository.session
+        try:
+            self.counter_repository.assign(
+                {
+                    "datasets_counter": self.published_repository.replace_all(),
+                    "feature_models_counter": self.counter_repository.count_feature_models(),
+                }
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+    def rebuild(self):
+        """Recomputes every rollup and counter from the raw record tables."""
+        session = self.repository.session
+        try:
+            self.repository.delete_all()
+            totals = {}
+            for source in ROLLUP_SOURCES.values():
+                target = getattr(source.model, source.target_column)
+                occurred_at = getattr(source.model, source.date_column)
+                rows = rollup_rows(source, session.query(target, occurred_at).yield_per(REBUILD_CHUNK_SIZE))
+                for start in range(0, len(rows), REBUILD_CHUNK_SIZE):
+                    self.repository.increment(rows[start:start + REBUILD_CHUNK_SIZE])
+                totals[source.counter] = sum(row["count"] for row in rows if row["granularity"] == "day")
+
+            self.counter_repository.assign(totals)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        self.rebuild_catalog()
+        self.rebuild_sketches()
+        self.rebuild_trending()
+
+    def rebuild_sketches(self):
+        """Recomputes the distinct-visitor sketches from the raw record tables, one chunk of records at a time."""
+        session = self.sketch_repository.session
+        try:
+            self.sketch_repository.delete_all()
+            session.commit()
+            for source in ROLLUP_SOURCES.values():
+                columns = [source.target_column, source.date_column, "user_id", source.cookie_column]
+                for chunk in self.subject_repository.record_chunks(source.model, columns, REBUILD_CHUNK_SIZE):
+                    self._merge_sketches(
+                        source,
+                        sketch_buckets(
+                            (subject_id, occurred_at, visitor_key(user_id, cookie))
+                            for subject_id, occurred_at, user_id, cookie in chunk
+                        ),
+                    )
+                    session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+    def rebuild_trending(self):
+        """Rescores every dataset from the raw records, e.g. after changing TRENDING_HALF_LIFE_HOURS."""
+        session = self.trending_repository.session
+        try:
+            scores = {}
+            for source in ROLLUP_SOURCES.values():
+                if source.subject != "dataset":
+                    continue
+                columns = [source.target_column, source.date_column]
+                for chunk in self.subject_repository.record_chunks(source.model, columns, REBUILD_CHUNK_SIZE):
+                    self._trending_scores(source, chunk, scores)
+            self.trending_repository.delete_all()
+            self.trending_repository.assign(scores)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+    def trending_datasets(self, limit: int = 5):
+        return self.trending_repository.top_published(limit)
+
+    def unique_visitors(self, subject: str, subject_ids: List[int], metric: str = "view",
+                        since: Optional[datetime] = None) -> Dict[int, int]:
+        """
+        Estimated number of distinct visitors per subject, all time or since a day. Each estimate reads one
+        sketch per subject and day (one per subject for all time) and is within ~1.6% (one standard error).
+        """
+        if since is None:
+            stored = self.sketch_repository.registers(subject, subject_ids, metric, "all")
+        else:
+            stored = self.sketch_repository.registers(subject, subject_ids, metric, "day", bucket_start(since, "day"))
+
+        merged = {}
+        for subject_id, registers in stored:
+            sketch = HyperLogLog.from_bytes(registers)
+            if subject_id in merged:
+                merged[subject_id].merge(sketch)
+            else:
+                merged[subject_id] = sketch
+        return {subject_id: merged[subject_id].count() if subject_id in merged else 0 for subject_id in subject_ids}
+
+    def dataset_exists(self, dataset_id: int) -> bool:
+        return self.subject_repository.dataset_exists(dataset_id)
+
+    def dataset_statistics(self, dataset_id: int, granularity: str = "day", days: int = 30,
+                           now: Optional[datetime] = None) -> dict:
+        """Totals and a per-bucket series of views and downloads for a dataset and its files."""
+        now = utc_naive(now or datetime.now(timezone.utc))
+        days = max(1, min(days, MAX_DAYS[granularity]))
+        since = bucket_start(now - timedelta(days=days), granularity)
+
+        series = {}
+        for rollup in self.repository.series("dataset", [dataset_id], granularity, since):
+            bucket = series.setdefault(rollup.bucket_start, {"views": 0, "downloads": 0})
+            bucket[f"{rollup.metric}s"] += rollup.count
+
+        dataset_totals = self.repository.totals("dataset", [dataset_id])
+        file_ids = self.subject_repository.file_ids_of_dataset(dataset_id)
+        file_totals = self.repository.totals("file", file_ids)
+        file_visitors = self.unique_visitors("file", file_ids, "view")
+        file_downloaders = self.unique_visitors("file", file_ids, "download")
+
+        return {
+            "dataset_id": dataset_id,
+            "granularity": granularity,
+            "since": since.isoformat(),
+            "totals": {
+                "views": dataset_totals.get((dataset_id, "view"), 0),
+                "downloads": dataset_totals.get((dataset_id, "download"), 0),
+            },
+            "unique": {
+                "visitors": self.unique_visitors("dataset", [dataset_id], "view")[dataset_id],
+                "downloaders": self.unique_visitors("dataset", [dataset_id], "download")[dataset_id],
+                "visitors_since": self.unique_visitors("dataset", [dataset_id], "view", since)[dataset_id],
+                "downloaders_since": self.unique_visitors("dataset", [dataset_id], "download", since)[dataset_id],
+            },
+            "series": [
+                {"bucket_start": start.isoformat(), **counts} for start, counts in sorted(series.items())
+            ],
+            "files": [
+                {
+                    "file_id": file_id,
+                    "views": file_totals.get((file_id, "view"), 0),
+                    "downloads": file_totals.get((file_id, "download"), 0),
+                    "unique_visitors": file_visitors[file_id],
+                    "unique_downloaders": file_downloaders[file_id],
+                }
+                for file_id in file_ids
+            ],
+        }
+
+
+def _update_rollups(kind: str, rows: List[dict]):
+    StatsService().on_records_flushed(kind, rows)
+
+
+def _follow_catalog(session, flush_context):
+    # Applied within the flushing transaction, whichever path added, deleted or published a dataset or model
+    changes = catalog_changes(session)
+    if changes:
+        service = StatsService()
+        service.counter_repository.session = session
+        service.published_repository.session = session
+        service.on_catalog_changed(changes)
+
+
+def _previous_doi(target, value, oldvalue, initiator):
+    pass
+
+
+record_pipeline.add_flush_listener(_update_rollups)
+event.listen(db.session, "after_flush", _follow_catalog)
+# Loads the DOI being replaced when it was expired, so catalog_changes can tell a publication from an edit
+event.listen(DSMetaData.dataset_doi, "set", _previous_doi, active_history=True)
@@ -0,0 +1,213 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.modules.stats.models import StatsCounter, StatsRollup, StatsSketch, StatsTrending
+from app.modules.stats.services import StatsService
+from core.sketches.decay import current_value, decay_rate, log_weight, logsumexp
+from core.sketches.hyperloglog import HyperLogLog
+
+
+@pytest.fixture
+def stats_service(test_app):
+    """A StatsService whose stats tables live in an in-memory SQLite database."""
+    engine = create_engine("sqlite://")
+    StatsRollup.__table__.create(engine)
+    StatsCounter.__table__.create(engine)
+    StatsSketch.__table__.create(engine)
+    StatsTrending.__table__.create(engine)
+    session = Session(engine)
+
+    service = StatsService()
+    service.repository.session = session
+    service.counter_repository.session = session
+    service.sketch_repository.session = session
+    service.trending_repository.session = session
+    yield service
+    session.close()
+
+
+def _views(dataset_id, *moments, cookie="c"):
+    return [
+        {"user_id": None, "dataset_id": dataset_id, "view_date": moment, "view_cookie": cookie} for moment in moments
+    ]
+
+
+def test_flushed_records_are_folded_into_hourly_and_daily_buckets(stats_service):
+    morning = datetime(2026, 3, 1, 9, 15, tzinfo=timezone.utc)
+    later = datetime(2026, 3, 1, 9, 45, tzinfo=timezone.utc)
+    evening = datetime(2026, 3, 1, 20, 5, tzinfo=timezone.utc)
+
+    stats_service.on_records_flushed("dataset_view", _views(1, morning, later))
+    stats_service.on_records_flushed("dataset_view", _views(1, evening) + _views(2, evening))
+    stats_service.on_records_flushed("unknown_kind", _views(1, evening))
+
+    buckets = {
+        (rollup.subject_id, rollup.granularity, rollup.bucket_start): rollup.count
+        for rollup in stats_service.repository.session.query(StatsRollup)
+    }
+    assert buckets == {
+        (1, "hour", datetime(2026, 3, 1, 9)): 2,
+        (1, "hour", datetime(2026, 3, 1, 20)): 1,
+        (1, "day", datetime(2026, 3, 1)): 3,
+        (2, "hour", datetime(2026, 3, 1, 20)): 1,
+        (2, "day", datetime(2026, 3, 1)): 1,
+    }
+
+    counters = stats_service.homepage_counters()
+    assert counters["total_dataset_views"] == 4
+    assert counters["total_dataset_downloads"] == 0
+
+
+def test_dataset_statistics_reads_series_and_file_totals(stats_service):
+    stats_service.on_records_flushed(
+        "dataset_download",
+        [
+            {"user_id": None, "dataset_id": 1, "download_date": datetime(2026, 3, day, 12), "download_cookie": cookie}
+            for day, cookie in ((1, "a"), (2, "a"), (2, "b"))
+        ],
+    )
+    stats_service.on_records_flushed(
+        "file_view", [{"user_id": None, "file_id": 7, "view_date": datetime(2026, 3, 2), "view_cookie": "c"}]
+    )
+    stats_service.on_records_flushed(
+        "file_view", [{"user_id": 3, "file_id": 7, "view_date": datetime(2026, 3, 2), "view_cookie": "d"}]
+    )
+
+    with patch.object(stats_service.subject_repository, "file_ids_of_dataset", return_value=[7, 8]):
+        stats = stats_service.dataset_statistics(1, days=1, now=datetime(2026, 3, 2, 18))
+
+    assert stats["totals"] == {"views": 0, "downloads": 3}
+    assert stats["series"] == [
+        {"bucket_start": "2026-03-01T00:00:00", "views": 0, "downloads": 1},
+        {"bucket_start": "2026-03-02T00:00:00", "views": 0, "downloads": 2},
+    ]
+    assert stats["unique"] == {"visitors": 0, "downloaders": 2, "visitors_since": 0, "downloaders_since": 2}
+    assert stats["files"] == [
+        {"file_id": 7, "views": 2, "downloads": 0, "unique_visitors": 2, "unique_downloaders": 0},
+        {"file_id": 8, "views": 0, "downloads": 0, "unique_visitors": 0, "unique_downloaders": 0},
+    ]
+
+
+def test_hyperloglog_error_bound_and_lossless_merge():
+    first = HyperLogLog().update(f"visitor-{i}" for i in range(20_000))
+    second = HyperLogLog().update(f"visitor-{i}" for i in range(10_000, 50_000))
+
+    assert abs(first.count() - 20_000) / 20_000 < 0.05
+    assert HyperLogLog().update(["a", "b", "a"]).count() == 2
+
+    union = HyperLogLog.from_bytes(first.to_bytes()).merge(second)
+    assert abs(union.count() - 50_000) / 50_000 < 0.05
+    assert union.to_bytes() == HyperLogLog().update(f"visitor-{i}" for i in range(50_000)).to_bytes()
+
+
+def test_distinct_visitors_merge_across_days_and_batches(stats_service):
+    monday = datetime(2026, 3, 2, 10)
+    tuesday = datetime(2026, 3, 3, 10)
+    for cookie in ("a", "b", "c"):
+        stats_service.on_records_flushed("dataset_view", _views(1, monday, cookie=cookie))
+    stats_service.on_records_flushed("dataset_view", _views(1, tuesday, cookie="a") + _views(1, tuesday, cookie="d"))
+
+    assert stats_service.unique_visitors("dataset", [1, 2]) == {1: 4, 2: 0}
+    assert stats_service.unique_visitors("dataset", [1], since=tuesday) == {1: 2}
+
+
+def test_decayed_score_halves_every_half_life():
+    rate = decay_rate(3600)
+    now = datetime(2026, 3, 2, 12, tzinfo=timezone.utc)
+    score = logsumexp([log_weight(1.0, now - timedelta(hours=1), rate), log_weight(3.0, now, rate)])
+
+    assert current_value(score, now, rate) == pytest.approx(3.5)
+    assert current_value(score, now + timedelta(hours=2), rate) == pytest.approx(3.5 / 4)
+
+
+def test_trending_prefers_recent_activity_and_is_incremental(stats_service, test_app):
+    now = datetime(2026, 3, 20, 12)
+    old_views = _views(1, *(now - timedelta(days=10, minutes=i) for i in range(3)))
+    stats_service.on_records_flushed("dataset_view", old_views)
+    stats_service.on_records_flushed("dataset_view", _views(2, now))
+    stats_service.on_records_flushed(
+        "dataset_download", [{"user_id": None, "dataset_id": 3, "download_date": now, "download_cookie": "c"}]
+    )
+
+    session = stats_service.trending_repository.session
+    ranking = [row.dataset_id for row in session.query(StatsTrending).order_by(StatsTrending.score.desc())]
+    assert ranking == [3, 2, 1]
+
+    # Folding the same events in one batch or several gives the same score
+    incremental = session.get(StatsTrending, 1).score
+    session.query(StatsTrending).delete()
+    stats_service.on_records_flushed("dataset_view", old_views[:1])
+    stats_service.on_records_flushed("dataset_view", old_views[1:])
+    assert session.get(StatsTrending, 1).score == pytest.approx(incremental)
+
+
+def test_catalog_counters_follow_every_write_to_the_catalogue(test_app):
+    from sqlalchemy import event
+
+    from app import db
+    from app.modules.dataset.models import DataSet, DSMetaData, PublicationType
+    from app.modules.featuremodel.models import FeatureModel
+    from app.modules.stats.services import _follow_catalog
+
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine)
+    session = Session(engine)
+    event.listen(session, "after_flush", _follow_catalog)
+    service = StatsService()
+    service.counter_repository.session = session
+    service.published_repository.session = session
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    def counters():
+        return dict(session.query(StatsCounter.name, StatsCounter.value))
+
+    with test_app.app_context():
+        metadata = DSMetaData(title="t", description="d", publication_type=PublicationType.NONE)
+        dataset = DataSet(user_id=1, ds_meta_data=metadata, feature_models=[FeatureModel(), FeatureModel()])
+        session.add(dataset)
+        session.commit()
+        assert counters() == {"feature_models_counter": 2}
+        assert service.latest_published() == []
+
+        metadata.dataset_doi = "10.1234/dataset1"
+        session.commit()
+        assert counters() == {"datasets_counter": 1, "feature_models_counter": 2}
+        assert service.latest_published() == [dataset]
+
+        # A new DOI for a published dataset changes nothing
+        metadata.dataset_doi = "10.1234/dataset1.v2"
+        session.commit()
+        assert counters() == {"datasets_counter": 1, "feature_models_counter": 2}
+
+        # Kept with single-row updates on the write path, never by recounting the catalogue
+        assert not any("count(" in statement.lower() for statement in statements)
+
+        # Deleting bypasses every service, the counters and the list still follow
+        session.delete(dataset)
+        session.commit()
+        assert counters() == {"datasets_counter": 0, "feature_models_counter": 0}
+        assert service.latest_published() == []
+
+        published = DataSet(
+            user_id=1,
+            ds_meta_data=DSMetaData(
+                title="p", description="d", publication_type=PublicationType.NONE, dataset_doi="10.1234/dataset2"
+            ),
+            feature_models=[FeatureModel()],
+        )
+        session.add(published)
+        session.commit()
+        assert counters() == {"datasets_counter": 1, "feature_models_counter": 1}
+
+        # Rebuilding recounts from the catalogue and agrees
+        session.query(StatsCounter).delete()
+        service.rebuild_catalog()
+        assert counters() == {"datasets_counter": 1, "feature_models_counter": 1}
+        assert service.latest_published() == [published]
+    session.close()
@@ -1,4 +1,5 @@
 import subprocess
+import threading
 from datetime import datetime, timezone
 
 from flask import abort
@@ -7,7 +8,18 @@ import docker
 from app.modules.webhook.repositories import WebhookRepository
 from core.services.BaseService import BaseService
 
-client = docker.from_env()
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_docker_client() -> docker.DockerClient:
+    """The Docker client, connected on first use so the app can start where no Docker daemon is reachable."""
+    global _client
+
+    with _client_lock:
+        if _client is None:
+            _client = docker.from_env()
+        return _client
 
 
 class WebhookService(BaseService):
@@ -16,7 +28,7 @@ class WebhookService(BaseService):
 
     def get_web_container(self):
         try:
-            return client.containers.get("web_app_container")
+            return get_docker_client().containers.get("web_app_container")
         except docker.errors.NotFound:
             abort(404, description="Web container not found.")
 
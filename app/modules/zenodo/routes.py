@@ -1,7 +1,8 @@
-from flask import render_template
+from flask import jsonify, render_template
+from flask_login import login_required
 
 from app.modules.zenodo import zenodo_bp
-from app.modules.zenodo.services import ZenodoService
+from app.modules.zenodo.services import ZenodoService, get_zenodo_client
 
 
 @zenodo_bp.route("/zenodo", methods=["GET"])
@@ -13,3 +14,10 @@ def index():
 def zenodo_test() -> dict:
     service = ZenodoService()
     return service.test_full_connection()
+
+
+@zenodo_bp.route("/zenodo/metrics", methods=["GET"])
+@login_required
+def zenodo_metrics():
+    """Connection pool and circuit breaker state of this worker's Zenodo client."""
+    return jsonify(get_zenodo_client().metrics())
@@ -1,22 +1,112 @@
 import logging
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import BinaryIO, Callable, Dict, Optional
+from urllib.parse import quote
 
 import requests
+import urllib3
 from dotenv import load_dotenv
-from flask import Response, jsonify
+from flask import Response, current_app, jsonify
 from flask_login import current_user
 
 from app.modules.dataset.models import DataSet
 from app.modules.featuremodel.models import FeatureModel
 from app.modules.zenodo.repositories import ZenodoRepository
-from core.configuration.configuration import uploads_folder_name
+from core.http.client import RETRY_STATUSES, CircuitOpenError, HttpClient, get_http_client
 from core.services.BaseService import BaseService
+from core.storage.backends import dataset_key, get_storage
 
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
 
+def get_zenodo_client() -> HttpClient:
+    """The Zenodo client of this worker process, shared by every ZenodoService."""
+    config = current_app.config
+    return get_http_client(
+        "zenodo",
+        pool_maxsize=config["ZENODO_POOL_MAXSIZE"],
+        connect_timeout=config["ZENODO_CONNECT_TIMEOUT"],
+        read_timeout=config["ZENODO_READ_TIMEOUT"],
+        retries=config["ZENODO_RETRIES"],
+        failure_threshold=config["ZENODO_BREAKER_THRESHOLD"],
+        reset_timeout=config["ZENODO_BREAKER_RESET"],
+    )
+
+
+class UploadProgress:
+    """Progress of the files of a deposition upload, updated by the upload threads and readable at any time."""
+
+    def __init__(self, sizes: Dict[str, int], listener: Optional[Callable[[dict], None]] = None):
+        self.files = {
+            name: {"size": size, "sent": 0, "status": "pending", "attempts": 0, "error": None}
+            for name, size in sizes.items()
+        }
+        self.listener = listener
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def update(self, name: str, **changes):
+        with self._lock:
+            self.files[name].update(changes)
+        if self.listener is not None and "status" in changes:
+            self.listener(self.snapshot())
+
+    def add_sent(self, name: str, count: int):
+        with self._lock:
+            self.files[name]["sent"] += count
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            files = {name: dict(state) for name, state in self.files.items()}
+        return {
+            "files_total": len(files),
+            "files_done": sum(state["status"] == "done" for state in files.values()),
+            "files_failed": sum(state["status"] == "failed" for state in files.values()),
+            "bytes_total": sum(state["size"] for state in files.values()),
+            "bytes_sent": sum(state["sent"] for state in files.values()),
+            "seconds": round(time.monotonic() - self.started_at, 3),
+            "files": files,
+        }
+
+
+class _ProgressReader:
+    """
+    Streams a file to requests, counting the bytes read. Seeking is passed through when the file supports it,
+    so urllib3 can rewind the body to retry a request.
+    """
+
+    def __init__(self, stream: BinaryIO, size: int, on_read: Callable[[int], None]):
+        self.stream = stream
+        self.size = size
+        self.on_read = on_read
+        self.position = 0
+
+    def __len__(self):
+        return self.size - self.position
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.position += len(data)
+        self.on_read(len(data))
+        return data
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, position: int, whence: int = os.SEEK_SET) -> int:
+        if whence != os.SEEK_SET:
+            raise OSError("Only absolute seeks are supported")
+        self.stream.seek(position)
+        self.on_read(position - self.position)
+        self.position = position
+        return position
+
+
 class ZenodoService(BaseService):
 
     def get_zenodo_url(self):
@@ -43,6 +133,15 @@ class ZenodoService(BaseService):
         self.headers = {"Content-Type": "application/json"}
         self.params = {"access_token": self.ZENODO_ACCESS_TOKEN}
 
+    @property
+    def client(self) -> HttpClient:
+        return get_zenodo_client()
+
+    def _timeout(self, read_timeout_key: str) -> tuple:
+        """(connect, read) timeout of operations slower than the default, such as uploads."""
+        config = current_app.config
+        return config["ZENODO_CONNECT_TIMEOUT"], config[read_timeout_key]
+
     def test_connection(self) -> bool:
         """
         Test the connection with Zenodo.
@@ -50,7 +149,10 @@ class ZenodoService(BaseService):
         Returns:
             bool: True if the connection is successful, False otherwise.
         """
-        response = requests.get(self.ZENODO_API_URL, params=self.params, headers=self.headers)
+        try:
+            response = self.client.get(self.ZENODO_API_URL, params=self.params, headers=self.headers)
+        except requests.exceptions.RequestException:
+            return False
         return response.status_code == 200
 
     def test_full_connection(self) -> Response:
@@ -82,7 +184,7 @@ class ZenodoService(BaseService):
             }
         }
 
-        response = requests.post(self.ZENODO_API_URL, json=data, params=self.params, headers=self.headers)
+        response = self.client.post(self.ZENODO_API_URL, json=data, params=self.params, headers=self.headers)
 
         if response.status_code != 201:
             return jsonify(
@@ -98,7 +200,9 @@ class ZenodoService(BaseService):
         data = {"name": "test_file.txt"}
         files = {"file": open(file_path, "rb")}
         publish_url = f"{self.ZENODO_API_URL}/{deposition_id}/files"
-        response = requests.post(publish_url, params=self.params, data=data, files=files)
+        response = self.client.post(
+            publish_url, params=self.params, data=data, files=files, timeout=self._timeout("ZENODO_UPLOAD_TIMEOUT")
+        )
         files["file"].close()  # Close the file after uploading
 
         logger.info(f"Publish URL: {publish_url}")
@@ -113,7 +217,7 @@ class ZenodoService(BaseService):
             success = False
 
         # Step 3: Delete the deposition
-        response = requests.delete(f"{self.ZENODO_API_URL}/{deposition_id}", params=self.params)
+        response = self.client.delete(f"{self.ZENODO_API_URL}/{deposition_id}", params=self.params)
 
         if os.path.exists(file_path):
             os.remove(file_path)
@@ -127,7 +231,7 @@ class ZenodoService(BaseService):
         Returns:
             dict: The response in JSON format with the depositions.
         """
-        response = requests.get(self.ZENODO_API_URL, params=self.params, headers=self.headers)
+        response = self.client.get(self.ZENODO_API_URL, params=self.params, headers=self.headers)
         if response.status_code != 200:
             raise Exception("Failed to get depositions")
         return response.json()
@@ -172,7 +276,7 @@ class ZenodoService(BaseService):
 
         data = {"metadata": metadata}
 
-        response = requests.post(self.ZENODO_API_URL, params=self.params, json=data, headers=self.headers)
+        response = self.client.post(self.ZENODO_API_URL, params=self.params, json=data, headers=self.headers)
         if response.status_code != 201:
             error_message = f"Failed to create deposition. Error details: {response.json()}"
             raise Exception(error_message)
@@ -193,16 +297,131 @@ class ZenodoService(BaseService):
         filename = feature_model.fm_meta_data.filename
         data = {"name": filename}
         user_id = current_user.id if user is None else user.id
-        file_path = os.path.join(uploads_folder_name(), f"user_{str(user_id)}", f"dataset_{dataset.id}/", filename)
-        files = {"file": open(file_path, "rb")}
-
         publish_url = f"{self.ZENODO_API_URL}/{deposition_id}/files"
-        response = requests.post(publish_url, params=self.params, data=data, files=files)
+        with get_storage().open(dataset_key(user_id, dataset.id, filename)) as stream:
+            files = {"file": (filename, stream)}
+            response = self.client.post(
+                publish_url, params=self.params, data=data, files=files, timeout=self._timeout("ZENODO_UPLOAD_TIMEOUT")
+            )
         if response.status_code != 201:
             error_message = f"Failed to upload files. Error details: {response.json()}"
             raise Exception(error_message)
         return response.json()
 
+    def upload_files(
+        self,
+        dataset: DataSet,
+        deposition: dict,
+        feature_models,
+        user=None,
+        listener: Optional[Callable[[dict], None]] = None,
+    ) -> UploadProgress:
+        """
+        Upload the files of several feature models to a deposition concurrently.
+
+        Files are streamed from storage with PUT requests to the deposition's bucket
+        (deposition["links"]["bucket"]), ZENODO_UPLOAD_WORKERS at a time. Depositions without a bucket link fall
+        back to the multipart files endpoint. Every file gets up to ZENODO_UPLOAD_ATTEMPTS attempts, reopened
+        from storage each time. Network errors and 429/5xx responses are retried; other errors are not.
+
+        Args:
+            dataset (DataSet): The DataSet the feature models belong to.
+            deposition (dict): The deposition in Zenodo, as returned by create_new_deposition.
+            feature_models (list): The FeatureModel objects whose files are uploaded.
+            user (User): The User object representing the files owner.
+            listener (callable): Called with UploadProgress.snapshot() whenever a file changes status.
+
+        Returns:
+            UploadProgress: The final progress of every file.
+        """
+        config = current_app.config
+        user_id = current_user.id if user is None else user.id
+        storage = get_storage()
+        keys = {
+            fm.fm_meta_data.filename: dataset_key(user_id, dataset.id, fm.fm_meta_data.filename)
+            for fm in feature_models
+        }
+        sizes = {}
+        for name, key in keys.items():
+            stored = storage.stat(key)
+            if stored is None:
+                raise Exception(f"Failed to upload files. {name} is missing from storage")
+            sizes[name] = stored.size
+        progress = UploadProgress(sizes, listener)
+
+        # Everything the threads need is resolved here: they run outside the application context
+        upload = {
+            "client": self.client,
+            "storage": storage,
+            "bucket": (deposition.get("links") or {}).get("bucket"),
+            "files_url": f"{self.ZENODO_API_URL}/{deposition['id']}/files",
+            "timeout": self._timeout("ZENODO_UPLOAD_TIMEOUT"),
+            "attempts": config["ZENODO_UPLOAD_ATTEMPTS"],
+            "backoff": config["ZENODO_UPLOAD_BACKOFF"],
+            "progress": progress,
+        }
+
+        errors = []
+        workers = max(1, min(config["ZENODO_UPLOAD_WORKERS"], len(keys)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="zenodo-upload") as executor:
+            futures = [
+                executor.submit(self._upload_one, name, key, sizes[name], **upload) for name, key in keys.items()
+            ]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as exc:
+                    errors.append(str(exc))
+
+        snapshot = progress.snapshot()
+        logger.info(
+            f"Uploaded {snapshot['files_done']}/{snapshot['files_total']} files ({snapshot['bytes_sent']} bytes) "
+            f"to deposition {deposition['id']} in {snapshot['seconds']}s"
+        )
+        if errors:
+            raise Exception(f"Failed to upload files. Error details: {'; '.join(sorted(errors))}")
+        return progress
+
+    def _upload_one(
+        self, name, key, size, client, storage, bucket, files_url, timeout, attempts, backoff, progress
+    ) -> dict:
+        error = None
+        for attempt in range(1, attempts + 1):
+            progress.update(name, status="uploading", attempts=attempt, sent=0)
+            try:
+                with storage.open(key) as stream:
+                    body = _ProgressReader(stream, size, lambda count: progress.add_sent(name, count))
+                    if bucket:
+                        response = client.put(
+                            f"{bucket}/{quote(name)}",
+                            data=body,
+                            params=self.params,
+                            headers={"Content-Type": "application/octet-stream"},
+                            timeout=timeout,
+                        )
+                    else:
+                        response = client.post(
+                            files_url, params=self.params, data={"name": name}, files={"file": (name, body)},
+                            timeout=timeout,
+                        )
+                if response.status_code in (200, 201):
+                    progress.update(name, status="done", error=None)
+                    return response.json()
+                error = f"{name}: HTTP {response.status_code}"
+                retryable = response.status_code in RETRY_STATUSES or response.status_code >= 500
+            except CircuitOpenError as exc:
+                error, retryable = f"{name}: {exc}", False
+            except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as exc:
+                # urllib3 errors surface when a body that cannot be rewound needed a retry
+                error, retryable = f"{name}: {exc}", True
+
+            if not retryable or attempt == attempts:
+                break
+            time.sleep(min(backoff * 2 ** (attempt - 1), 30))
+
+        progress.update(name, status="failed", error=error)
+        raise Exception(error)
+
     def publish_deposition(self, deposition_id: int) -> dict:
         """
         Publish a deposition in Zenodo.
@@ -214,7 +433,9 @@ class ZenodoService(BaseService):
             dict: The response in JSON format with the details of the published deposition.
         """
         publish_url = f"{self.ZENODO_API_URL}/{deposition_id}/actions/publish"
-        response = requests.post(publish_url, params=self.params, headers=self.headers)
+        response = self.client.post(
+            publish_url, params=self.params, headers=self.headers, timeout=self._timeout("ZENODO_PUBLISH_TIMEOUT")
+        )
         if response.status_code != 202:
             raise Exception("Failed to publish deposition")
         return response.json()
@@ -230,7 +451,7 @@ class ZenodoService(BaseService):
             dict: The response in JSON format with the details of the deposition.
         """
         deposition_url = f"{self.ZENODO_API_URL}/{deposition_id}"
-        response = requests.get(deposition_url, params=self.params, headers=self.headers)
+        response = self.client.get(deposition_url, params=self.params, headers=self.headers)
         if response.status_code != 200:
             raise Exception("Failed to get deposition")
         return response.json()
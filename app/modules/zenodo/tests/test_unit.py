@@ -0,0 +1,144 @@
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+import requests
+
+
+class _ZenodoStandIn(BaseHTTPRequestHandler):
+    """
+    Answers with the statuses queued for the request path in server.paths, or else in server.script (200 once
+    they are empty), after server.delay seconds. Request bodies are kept in server.bodies.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        path = self.path.split("?")[0]
+        self.server.bodies[path] = self.rfile.read(length) if length else b""
+        self.server.calls.append((self.command, self.path))
+        time.sleep(self.server.delay)
+        script = self.server.paths.get(path) or self.server.script
+        status = script.pop(0) if script else 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def zenodo_stand_in():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ZenodoStandIn)
+    server.script, server.calls, server.delay = [], [], 0
+    server.paths, server.bodies = {}, {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server, path="/api/deposit/depositions"):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+def test_http_client_reuses_connections_and_retries_idempotent_calls(zenodo_stand_in):
+    from core.http.client import HttpClient
+
+    client = HttpClient("zenodo", backoff_factor=0)
+    zenodo_stand_in.script = [503, 502]
+    assert client.get(_url(zenodo_stand_in)).status_code == 200
+    assert len(zenodo_stand_in.calls) == 3
+
+    zenodo_stand_in.script = [503]
+    assert client.post(_url(zenodo_stand_in)).status_code == 503  # not idempotent: never resent
+    assert len(zenodo_stand_in.calls) == 4
+
+    metrics = client.metrics()
+    assert metrics["pools"][0]["connections_opened"] == 1
+    assert metrics["pools"][0]["requests_sent"] == 4
+    assert metrics["circuit_breaker"]["state"] == "closed"
+
+
+def test_http_client_times_out_and_breaker_fails_fast(zenodo_stand_in):
+    from core.http.client import CircuitOpenError, HttpClient
+
+    client = HttpClient("zenodo", read_timeout=0.2, retries=0, failure_threshold=2, reset_timeout=0.5)
+    zenodo_stand_in.delay = 1
+    for _ in range(2):
+        started = time.monotonic()
+        with pytest.raises(requests.exceptions.RequestException):
+            client.get(_url(zenodo_stand_in))
+        assert time.monotonic() - started < 0.9
+
+    calls = len(zenodo_stand_in.calls)
+    with pytest.raises(CircuitOpenError):
+        client.get(_url(zenodo_stand_in))
+    assert len(zenodo_stand_in.calls) == calls
+    assert client.metrics()["circuit_breaker"]["state"] == "open"
+    assert client.metrics()["circuit_breaker"]["rejected_calls"] == 1
+
+    # After reset_timeout a single trial goes through, and its success closes the breaker
+    zenodo_stand_in.delay = 0
+    time.sleep(0.6)
+    assert client.get(_url(zenodo_stand_in)).status_code == 200
+    assert client.metrics()["circuit_breaker"]["state"] == "closed"
+
+
+def test_deposition_files_upload_concurrently_with_retries(test_app, zenodo_stand_in):
+    from app.modules.zenodo.services import ZenodoService
+    from core.http.client import HttpClient
+    from core.storage.backends import dataset_key, get_storage
+
+    user, dataset = SimpleNamespace(id=9001), SimpleNamespace(id=9002)
+    names = [f"model {i}.uvl" for i in range(8)]
+    bucket = _url(zenodo_stand_in, "/api/files/bucket-1")
+    zenodo_stand_in.delay = 0.3
+    zenodo_stand_in.paths["/api/files/bucket-1/model%200.uvl"] = [503]  # retried by the client
+    zenodo_stand_in.paths["/api/files/bucket-1/model%207.uvl"] = [500] * 20  # fails every attempt
+
+    snapshots = []
+    with test_app.app_context():
+        test_app.config.update(ZENODO_UPLOAD_WORKERS=8, ZENODO_UPLOAD_BACKOFF=0)
+        for name in names:
+            get_storage().save(dataset_key(user.id, dataset.id, name), io.BytesIO(name.encode() * 1000))
+        feature_models = [SimpleNamespace(fm_meta_data=SimpleNamespace(filename=name)) for name in names]
+        client = HttpClient("zenodo-test", backoff_factor=0, retries=1, failure_threshold=100)
+
+        started = time.monotonic()
+        try:
+            with patch("app.modules.zenodo.services.get_zenodo_client", return_value=client):
+                with pytest.raises(Exception, match="model 7.uvl: HTTP 500"):
+                    ZenodoService().upload_files(
+                        dataset, {"id": 1, "links": {"bucket": bucket}}, feature_models, user, snapshots.append
+                    )
+            elapsed = time.monotonic() - started
+        finally:
+            for name in names:
+                get_storage().delete(dataset_key(user.id, dataset.id, name))
+
+    # 8 files of 0.3s each (plus retries) took about as long as the slowest file, not their sum
+    assert elapsed < 2.4
+    for name in names[:7]:
+        assert zenodo_stand_in.bodies[f"/api/files/bucket-1/{name.replace(' ', '%20')}"] == name.encode() * 1000
+    progress = snapshots[-1]
+    assert progress["files_done"] == 7 and progress["files_failed"] == 1
+    assert progress["files"]["model 7.uvl"]["attempts"] == 3
+    assert progress["files"]["model 0.uvl"]["sent"] == len(names[0]) * 1000
+
+
+def test_client_metrics_require_login(test_app):
+    response = test_app.test_client().get("/zenodo/metrics")
+    assert response.status_code == 302 and "/login" in response.location
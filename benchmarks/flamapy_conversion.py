@@ -0,0 +1,96 @@
+"""
+Per-conversion latency of feature-model exports: through a temporary file (the old path) vs in memory.
+
+Usage:
+    python -m benchmarks.flamapy_conversion --features 2000 --runs 50
+
+The model is parsed once; each run only measures rendering a format and getting its bytes, which is the part
+the two paths differ in. A synthetic UVL model with the given number of features is used unless --uvl is passed.
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from flamapy.metamodels.fm_metamodel.transformations import GlencoeWriter, SPLOTWriter
+from flamapy.metamodels.pysat_metamodel.transformations import DimacsWriter, FmToPysat
+
+from core.conversions.feature_models import FORMATS, parse, render
+
+# format -> (temporary file suffix, writer): the old path, which had flamapy write to a file and read it back
+FILE_WRITERS = {
+    "glencoe": (".json", lambda path, fm: GlencoeWriter(path, fm).transform()),
+    "splot": (".splx", lambda path, fm: SPLOTWriter(path, fm).transform()),
+    "cnf": (".cnf", lambda path, fm: DimacsWriter(path, FmToPysat(fm).transform()).transform()),
+}
+
+
+def make_model(path, features):
+    """Writes a UVL model with `features` features: groups of 10 optional/alternative children under the root."""
+    lines = ["features", "    Root", "        optional"]
+    for group in range(features // 10):
+        lines.append(f"            G{group}")
+        lines.append("                alternative" if group % 2 else "                optional")
+        lines.extend(f"                    F{group}_{i}" for i in range(9))
+    lines.append("constraints")
+    lines.extend(f"    F{group}_0 => F{group + 1}_1" for group in range(0, features // 10 - 1, 3))
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def render_tempfile(fm, output_format):
+    suffix, write = FILE_WRITERS[output_format]
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    try:
+        write(path, fm)
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return statistics.median(timings), timings[max(0, int(len(timings) * 0.95) - 1)]
+
+
+def measure(fm, output_format, runs):
+    """Alternates both paths run by run, so that drifts in machine load affect them alike."""
+    timings = {render_tempfile: [], render: []}
+    for _ in range(runs):
+        for func, results in timings.items():
+            start = time.perf_counter()
+            func(fm, output_format)
+            results.append((time.perf_counter() - start) * 1000)
+    return summarize(timings[render_tempfile]), summarize(timings[render])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--features", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--uvl", help="benchmark this UVL file instead of a synthetic model")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="flamapy_bench_") as work_dir:
+        path = args.uvl
+        if not path:
+            path = os.path.join(work_dir, "model.uvl")
+            make_model(path, args.features)
+        fm = parse(path)
+
+    print(f"{len(fm.get_features())} features, {args.runs} runs per format (milliseconds)")
+    for output_format in FORMATS:
+        assert render_tempfile(fm, output_format) == render(fm, output_format)
+        (old_median, old_p95), (new_median, new_p95) = measure(fm, output_format, args.runs)
+        print(
+            f"{output_format:<8} tempfile median={old_median:8.3f} p95={old_p95:8.3f}   "
+            f"memory median={new_median:8.3f} p95={new_p95:8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
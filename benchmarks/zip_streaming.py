@@ -0,0 +1,103 @@
+"""
+Time-to-first-byte and peak RSS of dataset zip downloads: temp-file zip vs streaming zip.
+
+Usage:
+    python -m benchmarks.zip_streaming --size-gb 2 --files 8
+
+Each mode runs in its own subprocess so that peak RSS (ru_maxrss) is measured independently. The dataset is made
+of incompressible files (like posters or archives) plus UVL-like text, and the archive bytes are discarded.
+"""
+
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from zipfile import ZipFile
+
+from core.archives.zipstream import collect_entries, stream_zip
+
+
+def make_dataset(path, size_gb, files):
+    os.makedirs(path, exist_ok=True)
+    file_size = int(size_gb * 1024**3 / files)
+    block = 8 * 1024 * 1024
+    for i in range(files):
+        extension = ".zip" if i % 2 == 0 else ".uvl"
+        with open(os.path.join(path, f"file{i}{extension}"), "wb") as f:
+            written = 0
+            while written < file_size:
+                n = min(block, file_size - written)
+                f.write(os.urandom(n) if extension == ".zip" else (b"features\n    Root\n" * (n // 18 + 1))[:n])
+                written += n
+
+
+def run_tempfile(dataset_dir):
+    start = time.perf_counter()
+    temp_dir = tempfile.mkdtemp()
+    zip_path = os.path.join(temp_dir, "dataset.zip")
+    with ZipFile(zip_path, "w") as zipf:
+        for full_path, arcname in collect_entries(dataset_dir, "dataset"):
+            zipf.write(full_path, arcname=arcname)
+    first_byte = None
+    total = 0
+    with open(zip_path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            total += len(chunk)
+    shutil.rmtree(temp_dir)
+    return first_byte, time.perf_counter() - start, total
+
+
+def run_streaming(dataset_dir):
+    start = time.perf_counter()
+    first_byte = None
+    total = 0
+    for chunk in stream_zip(collect_entries(dataset_dir, "dataset")):
+        if first_byte is None:
+            first_byte = time.perf_counter() - start
+        total += len(chunk)
+    return first_byte, time.perf_counter() - start, total
+
+
+def run_mode(mode, dataset_dir):
+    runner = run_streaming if mode == "streaming" else run_tempfile
+    first_byte, elapsed, total = runner(dataset_dir)
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(
+        f"{mode:<10} ttfb={first_byte:8.3f}s total={elapsed:8.2f}s size={total / 1024**2:10.1f}MB "
+        f"peak_rss={peak_rss_mb:8.1f}MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-gb", type=float, default=2.0)
+    parser.add_argument("--files", type=int, default=8)
+    parser.add_argument("--mode", choices=["tempfile", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--dataset-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.dataset_dir)
+        return
+
+    work_dir = tempfile.mkdtemp(prefix="zip_bench_")
+    try:
+        dataset_dir = os.path.join(work_dir, "dataset")
+        make_dataset(dataset_dir, args.size_gb, args.files)
+        for mode in ("tempfile", "streaming"):
+            subprocess.run(
+                [sys.executable, "-m", "benchmarks.zip_streaming", "--mode", mode, "--dataset-dir", dataset_dir],
+                check=True,
+            )
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+from flask import Response, current_app
+
+from core.archives.zipstream import CHUNK_SIZE, source_info, stream_zip, streaming_zip_response
+from core.http.conditional import not_modified, set_validators
+from core.http.downloads import send_download
+from core.workers.pools import get_thread_pool
+
+logger = logging.getLogger(__name__)
+
+# How often clients following a build look for more data
+FOLLOW_INTERVAL = 0.05
+
+
+class ArchiveBuildFailed(RuntimeError):
+    """The archive a client was reading while it was being built will not be complete."""
+
+
+class ArchiveCache:
+    """
+    Prebuilt dataset zips, keyed by a hash of the dataset's file manifest.
+
+    Archives are built in the background at full speed, whoever asked for them, into <key>.zip.part, which is
+    atomically renamed to <key>.zip once complete. Each key is built once: within a process through a single
+    in-flight future, across gunicorn workers through a lock file. Clients that miss an archive read the partial
+    file as it grows (see follow()), so they neither wait for the build nor slow it down. The least recently
+    served archives are evicted once the cache exceeds its disk budget.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    @staticmethod
+    def key_for(entries: List[Tuple[object, str]], checksums: Optional[Dict[str, str]] = None) -> str:
+        """
+        Hashes the manifest: the stored checksum of each file, by name inside the archive, or its size and mtime
+        for files without one.
+        """
+        checksums = checksums or {}
+        digest = hashlib.sha256()
+        for source, arcname in sorted(entries, key=lambda entry: entry[1]):
+            checksum = checksums.get(arcname)
+            if checksum is None:
+                size, mtime, _ = source_info(source)
+                checksum = f"{size}\0{mtime!r}"
+            digest.update(f"{arcname}\0{checksum}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.zip")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path_for(key)
+        try:
+            # Touch on every hit: mtime is the LRU clock used by evict()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def build_async(self, key: str, entries: List[Tuple[object, str]]) -> Future:
+        """
+        Builds the archive in the background. The future's result is its path, or None when another process is
+        building it.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = get_thread_pool().submit(self._build, key, entries)
+                self._inflight[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+            return future
+
+    def _forget(self, key: str):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _acquire(path: str):
+        """Locks the build of the archive at path. Returns the locked file, or None if another build holds it."""
+        lock_path = f"{path}.lock"
+        while True:
+            lock_file = open(lock_path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return None
+            try:
+                current = os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                return lock_file
+            # The previous holder unlinked the file we locked: lock the one at the path now
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    @staticmethod
+    def _release(lock_file):
+        # Unlinked while still locked, so whoever locks the path next gets a file nobody else holds
+        try:
+            os.remove(lock_file.name)
+        except FileNotFoundError:
+            pass
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+    def _build(self, key: str, entries: List[Tuple[object, str]]) -> Optional[str]:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path_for(key)
+
+        lock_file = self._acquire(path)
+        if lock_file is None:
+            return None
+        try:
+            if os.path.exists(path):
+                return path
+            part = f"{path}.part"
+            try:
+                # Left behind by a build that died: its readers see it unlinked and give up
+                os.remove(part)
+            except FileNotFoundError:
+                pass
+            try:
+                with open(part, "xb") as f:
+                    for chunk in stream_zip(entries):
+                        f.write(chunk)
+                        f.flush()  # visible to followers right away
+                os.replace(part, path)
+            except BaseException:
+                os.remove(part)
+                raise
+        finally:
+            self._release(lock_file)
+
+        logger.info(f"Archive {key} built ({os.path.getsize(path)} bytes)")
+        self.evict()
+        return path
+
+    def follow(self, key: str, timeout: float) -> Optional[Iterator[bytes]]:
+        """
+        Reads the archive of key while it is being built, in this process or another: the returned chunks keep
+        coming as the build appends them, until it completes. Returns None if the build has not started within
+        timeout seconds. Iterating raises ArchiveBuildFailed if the build fails or makes no progress for timeout
+        seconds.
+        """
+        path = self.path_for(key)
+        deadline = time.monotonic() + timeout
+        while True:
+            for candidate in (path, f"{path}.part"):
+                try:
+                    return self._tail(open(candidate, "rb"), path, timeout)
+                except FileNotFoundError:
+                    continue
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(FOLLOW_INTERVAL)
+
+    @staticmethod
+    def _tail(f: BinaryIO, path: str, timeout: float) -> Iterator[bytes]:
+        with f:
+            progressed = time.monotonic()
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+                    progressed = time.monotonic()
+                    continue
+                stat = os.fstat(f.fileno())
+                try:
+                    complete = os.stat(path).st_ino == stat.st_ino
+                except FileNotFoundError:
+                    complete = False
+                if complete:
+                    # Renamed into place once fully written: what is left to read is all there is
+                    yield from iter(lambda: f.read(CHUNK_SIZE), b"")
+                    return
+                if stat.st_nlink == 0:
+                    raise ArchiveBuildFailed(f"The build of {path} failed")
+                if time.monotonic() - progressed > timeout:
+                    raise ArchiveBuildFailed(f"The build of {path} made no progress for {timeout:g} seconds")
+                time.sleep(FOLLOW_INTERVAL)
+
+    def evict(self):
+        archives = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".zip"):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                archives.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in archives)
+        for _, size, name in sorted(archives):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+                total -= size
+                logger.info(f"Archive {name} evicted from cache")
+            except FileNotFoundError:
+                pass
+
+
+_archive_cache = None
+_archive_cache_lock = threading.Lock()
+
+
+def get_archive_cache() -> ArchiveCache:
+    global _archive_cache
+
+    with _archive_cache_lock:
+        if _archive_cache is None:
+            _archive_cache = ArchiveCache(
+                current_app.config["ARCHIVE_CACHE_DIR"], current_app.config["ARCHIVE_CACHE_MAX_BYTES"]
+            )
+        return _archive_cache
+
+
+def archive_response(
+    entries: List[Tuple[object, str]], download_name: str, checksums: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    Serves a dataset archive with ETag/If-None-Match support (see ArchiveCache.key_for() for checksums).
+
+    Cached archives are sent straight from disk. On a miss the archive is built in the background and this
+    client reads it as it is written, like any other client that arrives during the build. If the build does not
+    start within ARCHIVE_FOLLOW_TIMEOUT (e.g. all pool threads are busy), the archive is streamed uncached.
+    """
+    cache = get_archive_cache()
+    key = cache.key_for(entries, checksums)
+
+    cached = not_modified(key)
+    if cached:
+        return cached
+
+    path = cache.get(key)
+    if path:
+        response = send_download(path, download_name, mimetype="application/zip", etag=key)
+    else:
+        cache.build_async(key, entries)
+        chunks = cache.follow(key, current_app.config["ARCHIVE_FOLLOW_TIMEOUT"])
+        if chunks is None:
+            logger.warning(f"Archive {key} is not being built yet, streaming it uncached")
+        response = streaming_zip_response(entries, download_name, chunks)
+
+    return set_validators(response, key)
@@ -0,0 +1,151 @@
+import io
+import os
+import time
+import zipfile
+from datetime import datetime
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from flask import Response
+
+CHUNK_SIZE = 1024 * 1024
+
+# Formats that are already compressed: deflating them again only burns CPU.
+STORED_EXTENSIONS = {
+    ".7z",
+    ".avi",
+    ".bz2",
+    ".gif",
+    ".gz",
+    ".jpeg",
+    ".jpg",
+    ".mkv",
+    ".mov",
+    ".mp3",
+    ".mp4",
+    ".png",
+    ".rar",
+    ".tgz",
+    ".webp",
+    ".xz",
+    ".zip",
+    ".zst",
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable buffer that ZipFile writes into and the generator drains after every chunk."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class BytesSource(NamedTuple):
+    """Archive entry source built in memory, such as a conversion."""
+
+    data: bytes
+    modified: datetime
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def open(self) -> BinaryIO:
+        return io.BytesIO(self.data)
+
+
+def collect_entries(base_dir: str, arc_root: str, exclude: Tuple[str, ...] = ()) -> List[Tuple[str, str]]:
+    """
+    Lists (path on disk, name inside the archive) for every file under base_dir, in a stable order, skipping the
+    top-level folders named in exclude.
+    """
+    entries = []
+    for subdir, dirs, files in os.walk(base_dir):
+        if subdir == base_dir:
+            dirs[:] = [name for name in dirs if name not in exclude]
+        dirs.sort()
+        for file in sorted(files):
+            full_path = os.path.join(subdir, file)
+            relative_path = os.path.relpath(full_path, base_dir)
+            entries.append((full_path, os.path.join(arc_root, relative_path)))
+    return entries
+
+
+def source_info(source) -> Tuple[int, float, int]:
+    """
+    Size, mtime and mode of an archive entry's source: a path on disk, or a stored file (anything with `size`,
+    `modified` and `open()`, such as core.storage.backends.StoredFile) whose content is streamed from storage.
+    """
+    if isinstance(source, str):
+        stat = os.stat(source)
+        return stat.st_size, stat.st_mtime, stat.st_mode
+    return source.size, source.modified.timestamp(), 0o100644
+
+
+def open_source(source) -> BinaryIO:
+    return open(source, "rb") if isinstance(source, str) else source.open()
+
+
+def stream_zip(entries: Iterable[Tuple[object, str]], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yields a zip archive of the given (source, arcname) entries as it is being built (see source_info()).
+
+    Files are read in fixed-size chunks, so memory use stays constant whatever their size and nothing is written
+    to disk. Already compressed formats are stored instead of deflated, and ZIP64 is used when a file needs it.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as zf:
+        for source, arcname in entries:
+            size, mtime, mode = source_info(source)
+            zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime(mtime)[:6])
+            zinfo.file_size = size
+            zinfo.external_attr = (mode & 0xFFFF) << 16
+            extension = os.path.splitext(arcname)[1].lower()
+            zinfo.compress_type = zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+            with open_source(source) as reader, zf.open(zinfo, "w") as dest:
+                while True:
+                    chunk = reader.read(chunk_size)
+                    if not chunk:
+                        break
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+
+            data = sink.drain()
+            if data:
+                yield data
+
+    # Central directory, written when the ZipFile is closed
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def streaming_zip_response(
+    entries: Iterable[Tuple[object, str]], download_name: str, chunks: Optional[Iterable[bytes]] = None
+) -> Response:
+    """
+    Builds a download response that sends the archive while it is being compressed, from chunks when given
+    (e.g. a build being written to a cache).
+    """
+    chunks = stream_zip(entries) if chunks is None else chunks
+    response = Response(chunks, mimetype="application/zip", direct_passthrough=True)
+    response.headers.set("Content-Disposition", "attachment", filename=download_name)
+    response.headers["Cache-Control"] = "no-store"
+    # Tell nginx not to buffer the whole archive before relaying it to the client
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class PickleCache:
+    """
+    Two-level cache of expensive-to-build Python objects: a bounded in-memory LRU in front of a directory of
+    pickles.
+
+    Every value is also written to disk, so it survives the memory LRU evicting it and is shared by all the
+    workers using the same directory; the least recently used files are deleted once the directory exceeds its
+    disk budget. Keys should identify the content they were built from (e.g. a checksum), so entries never need
+    invalidating: changed content gets a new key, and the old entry ages out. Values that cannot be pickled are
+    only cached in memory.
+    """
+
+    def __init__(self, cache_dir: str, max_items: int = 128, max_bytes: int = 512 * 1024**2):
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".pickle")
+
+    def _remember(self, key: str, value: Any):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            value = self._memory.get(key, _MISSING)
+            if value is not _MISSING:
+                self._memory.move_to_end(key)
+                return value
+
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            # Touch on every disk hit: mtime is the LRU clock used by evict()
+            os.utime(path)
+        except FileNotFoundError:
+            return default
+        except Exception as exc:
+            logger.warning(f"Discarding unreadable cache entry {path}: {exc}")
+            self._discard(path)
+            return default
+
+        self._remember(key, value)
+        return value
+
+    def put(self, key: str, value: Any):
+        self._remember(key, value)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self.path_for(key))
+        except Exception as exc:
+            logger.warning(f"Cache entry {key} kept in memory only: {exc}")
+            self._discard(temp_path)
+            return
+        self.evict()
+
+    def get_or_build(self, key: str, build: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = build()
+            self.put(key, value)
+        return value
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    @staticmethod
+    def _discard(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".pickle"):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._discard(os.path.join(self.cache_dir, name))
+            total -= size
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_pickle_cache(name: str, cache_dir: str, max_items: int, max_bytes: int) -> PickleCache:
+    """The process-wide cache called `name`, created with these settings on first use."""
+    with _caches_lock:
+        cache: Optional[PickleCache] = _caches.get(name)
+        if cache is None:
+            cache = _caches[name] = PickleCache(cache_dir, max_items, max_bytes)
+        return cache
@@ -0,0 +1,83 @@
+import json
+from typing import Optional
+
+from flamapy.metamodels.bdd_metamodel.operations import BDDConfigurationsNumber
+from flamapy.metamodels.bdd_metamodel.transformations import FmToBDD
+from flamapy.metamodels.fm_metamodel.models import FeatureModel
+from flamapy.metamodels.fm_metamodel.operations import FMCountLeafs, FMMaxDepthTree
+from flamapy.metamodels.fm_metamodel.transformations import GlencoeWriter, SPLOTWriter, UVLReader
+from flamapy.metamodels.pysat_metamodel.operations import PySATCoreFeatures, PySATDeadFeatures, PySATSatisfiable
+from flamapy.metamodels.pysat_metamodel.transformations import DimacsWriter, FmToPysat
+
+from core.caches.pickle_cache import PickleCache
+
+
+def _glencoe(fm: FeatureModel) -> str:
+    return GlencoeWriter(None, fm).transform()
+
+
+def _splot(fm: FeatureModel) -> str:
+    return SPLOTWriter(None, fm).transform()
+
+
+def _cnf(fm: FeatureModel) -> str:
+    return DimacsWriter(None, FmToPysat(fm).transform()).transform()
+
+
+# format -> writer returning the converted model as text (flamapy writers skip the file when given no path)
+FORMATS = {
+    "glencoe": _glencoe,
+    "splot": _splot,
+    "cnf": _cnf,
+}
+
+
+def parse(path: str) -> FeatureModel:
+    return UVLReader(path).transform()
+
+
+def render(fm: FeatureModel, output_format: str) -> bytes:
+    """Converts a parsed model in memory: no temporary file is written."""
+    return FORMATS[output_format](fm).encode("utf-8")
+
+
+def _load(path: str, model_cache_dir: Optional[str], model_key: Optional[str]) -> FeatureModel:
+    if model_cache_dir and model_key:
+        return PickleCache(model_cache_dir).get_or_build(model_key, lambda: parse(path))
+    return parse(path)
+
+
+def convert(path: str, output_format: str, model_cache_dir: Optional[str] = None, model_key: str = None) -> bytes:
+    """
+    Converts a UVL file to one of FORMATS. Runs in job processes, so it does not use the Flask application: the
+    parsed model is shared with the web workers through the cache directory, when one is given.
+    """
+    return render(_load(path, model_cache_dir, model_key), output_format)
+
+
+def analyse(path: str, model_cache_dir: Optional[str] = None, model_key: str = None) -> bytes:
+    """
+    Runs the usual flamapy analyses of a UVL file and returns them as JSON: structural metrics that only walk
+    the feature tree ("not_solver") and those that need the SAT or BDD solvers ("solver"). Runs in job
+    processes, like convert().
+    """
+    fm = _load(path, model_cache_dir, model_key)
+    sat = FmToPysat(fm).transform()
+    satisfiable = PySATSatisfiable().execute(sat).get_result()
+    analysis = {
+        "not_solver": {
+            "features": len(fm.get_features()),
+            "constraints": len(fm.get_constraints()),
+            "leaf_features": FMCountLeafs().execute(fm).get_result(),
+            "max_depth": FMMaxDepthTree().execute(fm).get_result(),
+        },
+        "solver": {
+            "satisfiable": satisfiable,
+            "core_features": sorted(str(feature) for feature in PySATCoreFeatures().execute(sat).get_result()),
+            "dead_features": sorted(str(feature) for feature in PySATDeadFeatures().execute(sat).get_result()),
+            "configurations": (
+                BDDConfigurationsNumber().execute(FmToBDD(fm).transform()).get_result() if satisfiable else 0
+            ),
+        },
+    }
+    return json.dumps(analysis).encode("utf-8")
@@ -0,0 +1,32 @@
+import difflib
+import os
+from typing import Optional
+
+
+def html_text_diff(
+    old_path: str, new_path: str, fromdesc: str = "", todesc: str = "", max_bytes: int = 512 * 1024
+) -> Optional[str]:
+    """
+    Builds an HTML side-by-side diff (changed hunks only) between two text files.
+
+    Runs inside the process pool, so it only receives paths and reads the files itself. Returns None if any
+    of the files is larger than max_bytes, leaving the caller to decide what to show instead.
+    """
+    old_size = os.path.getsize(old_path) if old_path and os.path.exists(old_path) else 0
+    new_size = os.path.getsize(new_path) if new_path and os.path.exists(new_path) else 0
+    if old_size > max_bytes or new_size > max_bytes:
+        return None
+
+    old_lines = _read_lines(old_path)
+    new_lines = _read_lines(new_path)
+
+    return difflib.HtmlDiff(wrapcolumn=100).make_table(
+        old_lines, new_lines, fromdesc=fromdesc, todesc=todesc, context=True, numlines=3
+    )
+
+
+def _read_lines(path: Optional[str]) -> list:
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return f.read().splitlines()
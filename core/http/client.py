@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+from typing import Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+Timeout = Union[float, Tuple[float, float]]
+
+# Responses that count as the remote service being degraded, and that idempotent calls retry
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request while the circuit breaker of a client is open."""
+
+
+class CircuitBreaker:
+    """
+    Fails fast while a remote service is down.
+
+    After `failure_threshold` consecutive failures (connection errors, timeouts or RETRY_STATUSES responses) the
+    breaker opens and rejects every call for `reset_timeout` seconds. It then lets a single trial call through
+    (half-open): a success closes it again, a failure reopens it for another `reset_timeout`.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self._trial_in_flight):
+                self._trial_in_flight = self.state == self.HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """Ends a call that neither succeeded nor failed remotely (e.g. an invalid request), freeing the trial."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 3)
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+                "rejected_calls": self.rejected,
+                "retry_in": retry_in,
+            }
+
+
+class HttpClient:
+    """
+    HTTP client for a remote API: one requests.Session whose keep-alive connections are pooled and reused.
+
+    Every call gets a (connect, read) timeout, unless it passes its own. Idempotent methods (GET, PUT, DELETE,
+    ...) are retried with bounded exponential backoff on connection errors and RETRY_STATUSES, honouring
+    Retry-After. Other methods are only retried when the connection could not be established, which is safe
+    because nothing was sent. All calls go through a CircuitBreaker. Share one client per worker process (see
+    get_http_client()).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pool_connections: int = 4,
+        pool_maxsize: int = 16,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 30.0,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        backoff_max: float = 10.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_maxsize = pool_maxsize
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.requests = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            backoff_max=backoff_max,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+    def request(self, method: str, url: str, timeout: Optional[Timeout] = None, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open), not calling {method} {url}")
+
+        with self._lock:
+            self.requests += 1
+        try:
+            response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            self._failed()
+            raise
+        except Exception:
+            self.breaker.release()
+            raise
+
+        if response.status_code in RETRY_STATUSES:
+            self._failed()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def _failed(self):
+        with self._lock:
+            self.failures += 1
+        self.breaker.record_failure()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+    def metrics(self) -> dict:
+        """Connection pool and circuit breaker state, for monitoring."""
+        pools = []
+        # urllib3 keeps one pool per (scheme, host, port); the pool manager's container is an LRU of them
+        for key in list(self.adapter.poolmanager.pools.keys()):
+            pool = self.adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            pools.append(
+                {
+                    "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                    "maxsize": self.pool_maxsize,
+                    "idle_connections": pool.pool.qsize() if pool.pool else 0,
+                    "connections_opened": pool.num_connections,
+                    "requests_sent": pool.num_requests,
+                }
+            )
+        with self._lock:
+            calls = {"requests": self.requests, "failures": self.failures}
+        return {"name": self.name, **calls, "pools": pools, "circuit_breaker": self.breaker.snapshot()}
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_client(name: str, **options) -> HttpClient:
+    """
+    The client called `name` of this process, created with these options on first use. Clients are not shared
+    with forked children: their pooled sockets belong to the parent.
+    """
+    with _clients_lock:
+        client, owner_pid = _clients.get(name, (None, None))
+        if client is None or owner_pid != os.getpid():
+            client = HttpClient(name, **options)
+            _clients[name] = (client, os.getpid())
+        return client
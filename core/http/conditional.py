@@ -0,0 +1,38 @@
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from flask import Response, request
+
+
+def set_validators(response: Response, etag: str, last_modified: Optional[datetime] = None) -> Response:
+    """Adds a strong ETag (and Last-Modified) and asks caches to revalidate before reusing the response."""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """
+    Returns a 304 response if the client's copy is still current, or None if the full response must be sent.
+
+    If-None-Match takes precedence over If-Modified-Since (RFC 9110, 13.2.2). Call it before doing any file I/O
+    or writing view/download records.
+    """
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified:
+        fresh = last_modified.replace(microsecond=0) <= request.if_modified_since
+    else:
+        fresh = False
+
+    if not fresh:
+        return None
+    return set_validators(Response(status=304), etag, last_modified)
+
+
+def file_last_modified(path: str) -> datetime:
+    """Returns the mtime of path as an aware datetime. Raises FileNotFoundError if it does not exist."""
+    return datetime.fromtimestamp(int(os.stat(path).st_mtime), tz=timezone.utc)
@@ -0,0 +1,58 @@
+import mimetypes
+import os
+from typing import Optional
+from urllib.parse import quote
+
+from flask import Response, abort, current_app, send_file
+
+from core.configuration.configuration import uploads_folder_name
+
+
+def uploads_root() -> str:
+    return os.path.realpath(os.path.join(os.getenv("WORKING_DIR", ""), uploads_folder_name()))
+
+
+def accel_redirect_uri(path: str) -> Optional[str]:
+    """Maps a file under the uploads folder to nginx's internal location, or None if it lives elsewhere."""
+    root = uploads_root()
+    real_path = os.path.realpath(path)
+    if os.path.commonpath([root, real_path]) != root:
+        return None
+    prefix = current_app.config.get("ACCEL_REDIRECT_PREFIX", "/protected-uploads/")
+    return prefix.rstrip("/") + "/" + quote(os.path.relpath(real_path, root))
+
+
+def send_download(
+    path: str, download_name: str, mimetype: str = None, etag: str = None, as_attachment: bool = True
+) -> Response:
+    """
+    Sends a file once Flask has done authorization and accounting.
+
+    With DOWNLOAD_MODE=accel the response is empty and nginx serves the bytes from its internal location, so no
+    gunicorn worker is held by slow clients. Otherwise the file is sent by Flask as a conditional response, which
+    answers Range/If-Range requests with 206 so interrupted downloads can resume.
+    """
+    if not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetype or mimetypes.guess_type(download_name)[0] or "application/octet-stream"
+
+    if current_app.config.get("DOWNLOAD_MODE") == "accel":
+        internal_uri = accel_redirect_uri(path)
+        if internal_uri:
+            response = Response(mimetype=mimetype)
+            response.headers["X-Accel-Redirect"] = internal_uri
+            if as_attachment:
+                response.headers.set("Content-Disposition", "attachment", filename=download_name)
+            if etag:
+                response.set_etag(etag)
+            return response
+
+    return send_file(
+        os.path.abspath(path),
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        etag=etag if etag else True,
+        conditional=True,
+    )
@@ -0,0 +1,265 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import insert, tuple_
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class RecordEvent:
+    kind: str
+    target_id: int
+    cookie: str
+    user_id: Optional[int] = None
+    occurred_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    @property
+    def identity(self):
+        return self.kind, self.user_id, self.target_id, self.cookie
+
+
+@dataclass(frozen=True)
+class RecordKind:
+    model: type
+    target_column: str
+    date_column: str
+    cookie_column: str
+
+
+class RecordPipeline:
+    """
+    Takes view and download records off the request path.
+
+    Requests call record(), which de-duplicates against the queued events and a bounded set of recently written
+    (kind, user, target, cookie) identities, and enqueues the event. A background thread drains the queue and
+    writes each batch with one SELECT (to skip records already stored by another worker or before a restart) and
+    one bulk INSERT per kind. The queue is bounded: when it is full, record() waits up to EVENT_QUEUE_PUT_TIMEOUT
+    seconds and then writes the event inline, so a slow database slows producers down instead of growing memory
+    or losing data. Pending events are flushed when the process exits.
+
+    If a batch fails, its events are written one by one, each retried up to EVENT_WRITE_ATTEMPTS times, so a bad
+    event (e.g. of a deleted dataset) only loses itself; dropped events are counted in `dropped`. Identities are
+    only remembered once their event is stored, so dropped events may be recorded again.
+
+    Flush listeners receive (kind, rows) for every batch inside the same transaction, which lets derived data
+    (rollups, sketches, rankings) be maintained incrementally.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._kinds: Dict[str, RecordKind] = {}
+        self._listeners: List[Callable] = []
+        self._recent = OrderedDict()
+        self._pending = set()
+        self.dropped = 0
+        self._recent_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._worker_lock = threading.Lock()
+        self._queue = None
+        self._worker = None
+        self._worker_pid = None
+        self._stopping = threading.Event()
+        self._atexit_registered = False
+
+    def init_app(self, app):
+        self.app = app
+        self.sync = app.config.get("EVENT_INGESTION_SYNC", False)
+        self.batch_size = app.config.get("EVENT_BATCH_SIZE", 500)
+        self.flush_interval = app.config.get("EVENT_FLUSH_INTERVAL", 1.0)
+        self.put_timeout = app.config.get("EVENT_QUEUE_PUT_TIMEOUT", 0.05)
+        self.dedup_size = app.config.get("EVENT_DEDUP_SIZE", 100_000)
+        self.write_attempts = app.config.get("EVENT_WRITE_ATTEMPTS", 3)
+        self._queue = queue.Queue(maxsize=app.config.get("EVENT_QUEUE_MAXSIZE", 10_000))
+        # Once per process, however many applications are created (as tests and commands do)
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+
+    def register_kind(self, kind: str, model, target_column: str, date_column: str, cookie_column: str):
+        self._kinds[kind] = RecordKind(model, target_column, date_column, cookie_column)
+
+    def add_flush_listener(self, listener: Callable):
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def record(self, kind: str, target_id: int, cookie: str, user_id: Optional[int] = None) -> bool:
+        """Queues a view/download record. Returns False if it was a recent duplicate."""
+        event = RecordEvent(kind=kind, target_id=target_id, cookie=cookie, user_id=user_id)
+        if not self._claim(event.identity):
+            return False
+
+        if self.sync:
+            self.write([event])
+            return True
+
+        self._ensure_worker()
+        try:
+            self._queue.put(event, timeout=self.put_timeout)
+        except queue.Full:
+            logger.warning("Record queue is full, writing event inline")
+            self.write([event])
+        return True
+
+    def _claim(self, identity) -> bool:
+        """Marks an identity as queued, unless it is queued already or was recently written."""
+        with self._recent_lock:
+            if identity in self._recent:
+                self._recent.move_to_end(identity)
+                return False
+            if identity in self._pending:
+                return False
+            self._pending.add(identity)
+            return True
+
+    def _settle(self, events: List[RecordEvent], written: bool):
+        """Events are no longer queued: written ones are remembered, dropped ones may be recorded again."""
+        with self._recent_lock:
+            for event in events:
+                self._pending.discard(event.identity)
+                if written:
+                    self._recent[event.identity] = None
+                    self._recent.move_to_end(event.identity)
+            while len(self._recent) > self.dedup_size:
+                self._recent.popitem(last=False)
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._worker_pid = os.getpid()
+                self._worker = threading.Thread(target=self._run, name="record-pipeline", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if batch:
+                self.write(batch)
+
+    def _next_batch(self) -> List[RecordEvent]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and time.monotonic() < deadline:
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def flush(self):
+        """Writes every queued event now."""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self.write(batch)
+
+    def shutdown(self):
+        self._stopping.set()
+        if self._worker is not None and self._worker_pid == os.getpid():
+            self._worker.join(timeout=self.flush_interval * 2)
+        if self._queue is not None:
+            self.flush()
+
+    def write(self, events: List[RecordEvent]):
+        from app import db
+
+        with self._write_lock, self.app.app_context():
+            try:
+                try:
+                    self._insert(db.session, events)
+                    self._settle(events, written=True)
+                    return
+                except Exception:
+                    db.session.rollback()
+                    logger.warning(
+                        f"Failed to write {len(events)} view/download records at once, writing them one by one",
+                        exc_info=True,
+                    )
+                for event in events:
+                    self._write_one(db.session, event)
+            finally:
+                db.session.remove()
+
+    def _write_one(self, session, event: RecordEvent):
+        error = None
+        for attempt in range(1, self.write_attempts + 1):
+            try:
+                self._insert(session, [event])
+                self._settle([event], written=True)
+                return
+            except Exception as exc:
+                session.rollback()
+                error = exc
+                if attempt < self.write_attempts:
+                    time.sleep(min(0.05 * 2 ** (attempt - 1), 1.0))
+        self.dropped += 1
+        self._settle([event], written=False)
+        logger.error(
+            f"Dropped {event.kind} record of {event.target_id} after {self.write_attempts} attempts "
+            f"({self.dropped} dropped so far): {error}"
+        )
+
+    def _insert(self, session, events: List[RecordEvent]):
+        """Inserts the events not stored yet, and commits."""
+        by_kind = defaultdict(list)
+        for event in events:
+            by_kind[event.kind].append(event)
+
+        for kind, kind_events in by_kind.items():
+            rows = self._new_rows(session, self._kinds[kind], kind_events)
+            if not rows:
+                continue
+            session.execute(insert(self._kinds[kind].model), rows)
+            for listener in self._listeners:
+                listener(kind, rows)
+        session.commit()
+
+    def _new_rows(self, session, spec: RecordKind, events: List[RecordEvent]) -> List[dict]:
+        model = spec.model
+        target = getattr(model, spec.target_column)
+        cookie = getattr(model, spec.cookie_column)
+
+        existing = {
+            (user_id, target_id, cookie_value)
+            for user_id, target_id, cookie_value in session.query(model.user_id, target, cookie).filter(
+                tuple_(target, cookie).in_({(event.target_id, event.cookie) for event in events})
+            )
+        }
+
+        rows = []
+        for event in events:
+            key = (event.user_id, event.target_id, event.cookie)
+            if key in existing:
+                continue
+            existing.add(key)
+            rows.append(
+                {
+                    "user_id": event.user_id,
+                    spec.target_column: event.target_id,
+                    spec.date_column: event.occurred_at,
+                    spec.cookie_column: event.cookie,
+                }
+            )
+        return rows
+
+
+record_pipeline = RecordPipeline()
@@ -0,0 +1,288 @@
+import contextlib
+import fcntl
+import json
+import logging
+import multiprocessing
+import os
+import re
+import resource
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, FINISHED, FAILED = "queued", "running", "finished", "failed"
+# Extra time given to a running job before another worker declares it lost
+STALE_GRACE = 30
+INTERRUPTED = "Job was interrupted"
+
+_JOB_ID = re.compile(r"^[A-Za-z0-9_-]{1,100}$")
+
+
+def _run_job(func: Callable, args: tuple, result_path: str, error_path: str, memory_limit: Optional[int]):
+    """Entry point of job processes: applies the memory limit, runs the job and writes its result or error."""
+    if memory_limit:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+    try:
+        result = func(*args)
+        temporary = f"{result_path}.part"
+        with open(temporary, "wb") as f:
+            f.write(result)
+        os.replace(temporary, result_path)
+    except BaseException as exc:
+        message = "Out of memory" if isinstance(exc, MemoryError) else f"{type(exc).__name__}: {exc}"
+        with open(error_path, "w") as f:
+            f.write(message)
+        sys.exit(1)
+
+
+class JobRunner:
+    """
+    Runs CPU-heavy work (functions returning bytes) in child processes, away from the web workers.
+
+    Every job gets its own 'spawn' process, with an address-space limit (RLIMIT_AS) and killed once it exceeds its
+    timeout, so a pathological input can neither hold a web worker nor take one down. Jobs wait in a queue of
+    `max_workers` slots per web process. Their state and result are files under jobs_dir, so any gunicorn worker
+    can answer status polls and serve results. Job ids are derived from the job's input (e.g. checksum and
+    format): submitting an id that is queued, running or finished returns that job instead of starting another.
+    Job functions must be importable from modules that do not import the Flask application.
+    """
+
+    def __init__(self, jobs_dir: str, max_workers: int = 2, result_ttl: int = 24 * 3600):
+        self.jobs_dir = jobs_dir
+        self.max_workers = max_workers
+        self.result_ttl = result_ttl
+        self._executor = None
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def state_path(self, job_id: str) -> str:
+        if not _JOB_ID.match(job_id or ""):
+            raise ValueError(f"Invalid job id: {job_id!r}")
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def result_path(self, job_id: str) -> str:
+        return self.state_path(job_id)[: -len(".json")] + ".result"
+
+    def _error_path(self, job_id: str) -> str:
+        return self.state_path(job_id)[: -len(".json")] + ".error"
+
+    @contextlib.contextmanager
+    def _locked(self, job_id: str):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        with open(os.path.join(self.jobs_dir, f"{job_id}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write(self, state: dict) -> dict:
+        path = self.state_path(state["id"])
+        temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(temporary, "w") as f:
+            json.dump(state, f)
+        os.replace(temporary, path)
+        return state
+
+    def _update(self, job_id: str, **changes) -> dict:
+        with self._locked(job_id):
+            state = self._read(job_id) or {"id": job_id}
+            state.update(changes)
+            return self._write(state)
+
+    def _read(self, job_id: str) -> Optional[dict]:
+        try:
+            with open(self.state_path(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _is_lost(self, state: dict) -> bool:
+        """Whether a queued or running job can no longer finish: its web process died, or it overran its timeout."""
+        host, _, pid = state.get("owner", "").rpartition(":")
+        if host == socket.gethostname() and pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                pass
+        started_at = state.get("started_at")
+        return bool(started_at) and time.time() > started_at + state["timeout"] + STALE_GRACE
+
+    def _refresh(self, state: Optional[dict]) -> Optional[dict]:
+        """Marks lost jobs as failed. Must be called holding the job's lock."""
+        if state and state["status"] in (QUEUED, RUNNING) and self._is_lost(state):
+            state = self._write({**state, "status": FAILED, "error": INTERRUPTED, "finished_at": time.time()})
+        return state
+
+    def status(self, job_id: str) -> Optional[dict]:
+        if not os.path.exists(self.state_path(job_id)):
+            return None
+        with self._locked(job_id):
+            return self._refresh(self._read(job_id))
+
+    def submit(
+        self,
+        job_id: str,
+        func: Callable,
+        args: tuple = (),
+        timeout: float = 120,
+        memory_limit: Optional[int] = None,
+        meta: Optional[dict] = None,
+        on_done: Optional[Callable[[dict], None]] = None,
+    ) -> dict:
+        """
+        Queues func(*args) as job_id, unless that job is already queued, running or finished. on_done is called
+        with the final state of the job, in a thread of this process.
+        """
+        self._cleanup_if_due()
+        with self._locked(job_id):
+            state = self._refresh(self._read(job_id))
+            if state and state["status"] != FAILED:
+                return state
+            state = self._write(
+                {
+                    "id": job_id,
+                    "status": QUEUED,
+                    "owner": self._owner,
+                    "timeout": timeout,
+                    "submitted_at": time.time(),
+                    **(meta or {}),
+                }
+            )
+
+        future = self._get_executor().submit(self._supervise, job_id, func, args, timeout, memory_limit, on_done)
+        with self._lock:
+            self._futures[job_id] = future
+        future.add_done_callback(lambda _: self._forget(job_id))
+        return state
+
+    def complete(self, job_id: str, result: bytes, meta: Optional[dict] = None) -> dict:
+        """Records an already available result (e.g. from a cache) as a finished job."""
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        temporary = f"{self.result_path(job_id)}.{os.getpid()}.part"
+        with open(temporary, "wb") as f:
+            f.write(result)
+        os.replace(temporary, self.result_path(job_id))
+        now = time.time()
+        return self._update(
+            job_id, status=FINISHED, submitted_at=now, finished_at=now, size=len(result), **(meta or {})
+        )
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[dict]:
+        """Blocks until a job submitted by this process is done. Meant for commands and tests, not requests."""
+        with self._lock:
+            future: Optional[Future] = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
+        return self.status(job_id)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job-supervisor")
+            return self._executor
+
+    def _forget(self, job_id: str):
+        with self._lock:
+            self._futures.pop(job_id, None)
+
+    def _supervise(
+        self,
+        job_id: str,
+        func: Callable,
+        args: tuple,
+        timeout: float,
+        memory_limit: Optional[int],
+        on_done: Optional[Callable[[dict], None]] = None,
+    ):
+        result_path, error_path = self.result_path(job_id), self._error_path(job_id)
+        for path in (result_path, error_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+        process = multiprocessing.get_context("spawn").Process(
+            target=_run_job, args=(func, args, result_path, error_path, memory_limit), daemon=True
+        )
+        self._update(job_id, status=RUNNING, started_at=time.time())
+        try:
+            process.start()
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join(5)
+                if process.is_alive():
+                    process.kill()
+                    process.join()
+                error = f"Timed out after {timeout:g} seconds"
+            elif process.exitcode == 0 and os.path.exists(result_path):
+                error = None
+            elif os.path.exists(error_path):
+                with open(error_path) as f:
+                    error = f.read()
+            else:
+                error = f"Job process exited with code {process.exitcode}"
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+
+        if error:
+            logger.warning(f"Job {job_id} failed: {error}")
+            state = self._update(job_id, status=FAILED, error=error, finished_at=time.time())
+        else:
+            state = self._update(job_id, status=FINISHED, finished_at=time.time(), size=os.path.getsize(result_path))
+
+        if on_done is not None:
+            try:
+                on_done(state)
+            except Exception:
+                logger.exception(f"Completion callback of job {job_id} failed")
+
+    def _cleanup_if_due(self):
+        now = time.time()
+        if now - self._last_cleanup < 600:
+            return
+        self._last_cleanup = now
+        self.cleanup(self.result_ttl)
+
+    def cleanup(self, max_age: float) -> int:
+        """Deletes the files of jobs that finished or failed more than max_age seconds ago."""
+        if not os.path.isdir(self.jobs_dir):
+            return 0
+        deleted = 0
+        cutoff = time.time() - max_age
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            job_id = name[: -len(".json")]
+            state = self._read(job_id)
+            if state and state["status"] in (FINISHED, FAILED) and state.get("finished_at", 0) < cutoff:
+                lock_path = os.path.join(self.jobs_dir, f"{job_id}.lock")
+                for path in (self.result_path(job_id), self._error_path(job_id), self.state_path(job_id), lock_path):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+                deleted += 1
+        return deleted
+
+
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    global _job_runner
+
+    with _job_runner_lock:
+        if _job_runner is None:
+            config = current_app.config
+            _job_runner = JobRunner(config["JOBS_DIR"], config["JOB_WORKERS"], config["JOB_RESULT_TTL"])
+        return _job_runner
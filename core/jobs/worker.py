@@ -0,0 +1,165 @@
+import atexit
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseWorker:
+    """
+    Runs jobs persisted in the database in background threads of the web processes, so no request waits for them.
+
+    Each process runs a daemon thread that, every poll_interval seconds (or when woken up), renews the lease of the
+    jobs it is running and claims due jobs, up to `workers` at a time, which then run in a thread pool inside an
+    application context. Claims must be atomic (e.g. a conditional UPDATE) so that a job runs in one process only;
+    the jobs of a process that died are claimed again by another one once their lease expires. What is due, how it
+    is claimed and how it runs is registered by the module that owns the jobs (register()).
+
+    Configured by <PREFIX>_WORKERS, <PREFIX>_POLL_INTERVAL and <PREFIX>_AUTOSTART. With autostart, the thread of a
+    process starts with the first request it serves, which also resumes the jobs interrupted by a restart.
+    """
+
+    def __init__(self, config_prefix: str):
+        self.config_prefix = config_prefix
+        self.app = None
+        self.workers = 2
+        self.poll_interval = 5.0
+        self.autostart = True
+        self._claim: Optional[Callable[[int, str], List[int]]] = None
+        self._run_job: Optional[Callable[[int, str], None]] = None
+        self._heartbeat: Optional[Callable[[List[int], str], None]] = None
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._worker_lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._executor = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._atexit_registered = False
+
+    def register(
+        self,
+        claim: Callable[[int, str], List[int]],
+        run: Callable[[int, str], None],
+        heartbeat: Callable[[List[int], str], None],
+    ):
+        """
+        claim(limit, owner) claims up to limit due jobs for owner and returns their ids; run(job_id, owner) runs a
+        claimed job; heartbeat(job_ids, owner) renews the lease of the jobs owner is running.
+        """
+        self._claim, self._run_job, self._heartbeat = claim, run, heartbeat
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get(f"{self.config_prefix}_WORKERS", 2)
+        self.poll_interval = app.config.get(f"{self.config_prefix}_POLL_INTERVAL", 5.0)
+        self.autostart = app.config.get(f"{self.config_prefix}_AUTOSTART", True)
+        if self.autostart:
+            app.before_request(self.ensure_running)
+        # Once per process, however many applications are created (as tests and commands do)
+        if not self._atexit_registered:
+            atexit.register(self.shutdown)
+            self._atexit_registered = True
+
+    @property
+    def owner(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def ensure_running(self):
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._worker_pid = os.getpid()
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix=f"{self.config_prefix.lower()}-job"
+                )
+                with self._running_lock:
+                    self._running = set()
+                self._worker = threading.Thread(
+                    target=self._loop, name=f"{self.config_prefix.lower()}-worker", daemon=True
+                )
+                self._worker.start()
+
+    def wake(self):
+        """Looks for due jobs now instead of at the next poll, e.g. right after one was submitted."""
+        if self.autostart:
+            self.ensure_running()
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            self.tick()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def tick(self):
+        """Renews the leases of the running jobs and starts the due ones there are free workers for."""
+        from app import db
+
+        owner = self.owner
+        with self.app.app_context():
+            try:
+                with self._running_lock:
+                    running = sorted(self._running)
+                if running:
+                    self._heartbeat(running, owner)
+                free = self.workers - len(running)
+                for job_id in self._claim(free, owner) if free > 0 else []:
+                    with self._running_lock:
+                        self._running.add(job_id)
+                    self._executor.submit(self._execute, job_id, owner)
+            except Exception:
+                logger.exception(f"{self.config_prefix.capitalize()} worker failed to poll for jobs")
+            finally:
+                db.session.remove()
+
+    def _execute(self, job_id: int, owner: str):
+        try:
+            self.run(job_id, owner)
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
+            self._wake.set()
+
+    def run(self, job_id: int, owner: str):
+        from app import db
+
+        with self.app.app_context():
+            try:
+                self._run_job(job_id, owner)
+            except Exception:
+                logger.exception(f"{self.config_prefix.capitalize()} job {job_id} failed")
+            finally:
+                db.session.remove()
+
+    def run_due(self) -> int:
+        """Claims and runs the due jobs one by one in this thread, until none is left. Meant for commands."""
+        from app import db
+
+        done = 0
+        while True:
+            with self.app.app_context():
+                try:
+                    claimed = self._claim(1, self.owner)
+                finally:
+                    db.session.remove()
+            if not claimed:
+                return done
+            self.run(claimed[0], self.owner)
+            done += 1
+
+    def shutdown(self):
+        self._stopping.set()
+        self._wake.set()
+        if self._executor is not None and self._worker_pid == os.getpid():
+            # Running jobs are not waited for: they are resumed elsewhere once their lease expires
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+publication_worker = LeaseWorker("PUBLICATION")
@@ -1,5 +1,6 @@
 import os
 import secrets
+import tempfile
 
 
 class ConfigManager:
@@ -33,6 +34,73 @@ class Config:
     TIMEZONE = "Europe/Madrid"
     TEMPLATES_AUTO_RELOAD = True
     UPLOAD_FOLDER = "uploads"
+    VERSION_DIFF_MAX_BYTES = int(os.getenv("VERSION_DIFF_MAX_BYTES", 512 * 1024))
+    VERSION_DIFF_TIMEOUT = int(os.getenv("VERSION_DIFF_TIMEOUT", 20))
+    VERSION_DIFF_MEMORY_LIMIT = int(os.getenv("VERSION_DIFF_MEMORY_LIMIT", 1024**3))
+    ARCHIVE_CACHE_DIR = os.path.join(os.getenv("WORKING_DIR", ""), "uploads", "archives")
+    ARCHIVE_CACHE_MAX_BYTES = int(os.getenv("ARCHIVE_CACHE_MAX_BYTES", 5 * 1024**3))
+    # Seconds a download waits for an archive build to start, or to make progress, before giving up on it
+    ARCHIVE_FOLLOW_TIMEOUT = float(os.getenv("ARCHIVE_FOLLOW_TIMEOUT", 10))
+    # "direct": Flask sends files (with Range support); "accel": nginx sends them via X-Accel-Redirect
+    DOWNLOAD_MODE = os.getenv("DOWNLOAD_MODE", "direct")
+    ACCEL_REDIRECT_PREFIX = os.getenv("ACCEL_REDIRECT_PREFIX", "/protected-uploads/")
+    # "local": dataset files under the uploads folder; "s3": a bucket of an S3-compatible store (AWS S3, MinIO...)
+    STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+    S3_BUCKET = os.getenv("S3_BUCKET", "uvlhub")
+    S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None
+    S3_PUBLIC_ENDPOINT_URL = os.getenv("S3_PUBLIC_ENDPOINT_URL") or None
+    S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID")
+    S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY")
+    S3_REGION = os.getenv("S3_REGION", "us-east-1")
+    S3_PRESIGN_EXPIRY = int(os.getenv("S3_PRESIGN_EXPIRY", 300))
+    S3_MULTIPART_CHUNK_SIZE = int(os.getenv("S3_MULTIPART_CHUNK_SIZE", 8 * 1024**2))
+    EVENT_INGESTION_SYNC = os.getenv("EVENT_INGESTION_SYNC", "False").lower() == "true"
+    EVENT_QUEUE_MAXSIZE = int(os.getenv("EVENT_QUEUE_MAXSIZE", 10000))
+    EVENT_QUEUE_PUT_TIMEOUT = float(os.getenv("EVENT_QUEUE_PUT_TIMEOUT", 0.05))
+    EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", 500))
+    EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", 1.0))
+    EVENT_DEDUP_SIZE = int(os.getenv("EVENT_DEDUP_SIZE", 100000))
+    EVENT_WRITE_ATTEMPTS = int(os.getenv("EVENT_WRITE_ATTEMPTS", 3))
+    # Changing the half-life requires `rosemary stats:rebuild` to rescore existing datasets
+    TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", 72))
+    RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", 10))
+    RECOMMENDATION_BATCH_SIZE = int(os.getenv("RECOMMENDATION_BATCH_SIZE", 20000))
+    # Estimated share of movies (or files) in common above which an upload is flagged as a near-duplicate
+    NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", 0.8))
+    MOVIE_INDEX_DIR = os.path.join(os.getenv("WORKING_DIR", ""), "uploads", "movie_index")
+    MOVIE_INDEX_NPROBE = int(os.getenv("MOVIE_INDEX_NPROBE", 8))
+    # Parsed UVL models and their Glencoe/SPLOT/CNF conversions, keyed by file checksum
+    FLAMAPY_CACHE_DIR = os.path.join(os.getenv("WORKING_DIR", ""), "uploads", "flamapy_cache")
+    FLAMAPY_CACHE_MAX_ITEMS = int(os.getenv("FLAMAPY_CACHE_MAX_ITEMS", 256))
+    FLAMAPY_CACHE_MAX_BYTES = int(os.getenv("FLAMAPY_CACHE_MAX_BYTES", 512 * 1024**2))
+    UVL_VALIDATION_TIMEOUT = float(os.getenv("UVL_VALIDATION_TIMEOUT", 20))
+    # Zenodo HTTP client: pooled keep-alive connections, per-operation timeouts, retries and a circuit breaker
+    ZENODO_CONNECT_TIMEOUT = float(os.getenv("ZENODO_CONNECT_TIMEOUT", 3.05))
+    ZENODO_READ_TIMEOUT = float(os.getenv("ZENODO_READ_TIMEOUT", 30))
+    ZENODO_UPLOAD_TIMEOUT = float(os.getenv("ZENODO_UPLOAD_TIMEOUT", 300))
+    ZENODO_PUBLISH_TIMEOUT = float(os.getenv("ZENODO_PUBLISH_TIMEOUT", 120))
+    ZENODO_RETRIES = int(os.getenv("ZENODO_RETRIES", 3))
+    ZENODO_UPLOAD_WORKERS = int(os.getenv("ZENODO_UPLOAD_WORKERS", 4))
+    ZENODO_UPLOAD_ATTEMPTS = int(os.getenv("ZENODO_UPLOAD_ATTEMPTS", 3))
+    ZENODO_UPLOAD_BACKOFF = float(os.getenv("ZENODO_UPLOAD_BACKOFF", 1))
+    ZENODO_POOL_MAXSIZE = int(os.getenv("ZENODO_POOL_MAXSIZE", 16))
+    ZENODO_BREAKER_THRESHOLD = int(os.getenv("ZENODO_BREAKER_THRESHOLD", 5))
+    ZENODO_BREAKER_RESET = float(os.getenv("ZENODO_BREAKER_RESET", 30))
+    # Background jobs (flamapy conversions): one process each, killed past the timeout, capped in address space
+    JOBS_DIR = os.path.join(os.getenv("WORKING_DIR", ""), "uploads", "jobs")
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+    JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", 120))
+    JOB_MEMORY_LIMIT = int(os.getenv("JOB_MEMORY_LIMIT", 2 * 1024**3))
+    JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", 24 * 3600))
+    # Analyses (BDD configuration counting in particular) may take much longer than conversions
+    ANALYSIS_TIMEOUT = float(os.getenv("ANALYSIS_TIMEOUT", 300))
+    # Zenodo publications run in background threads of the web processes, resumed elsewhere once a lease expires
+    PUBLICATION_WORKERS = int(os.getenv("PUBLICATION_WORKERS", 2))
+    PUBLICATION_POLL_INTERVAL = float(os.getenv("PUBLICATION_POLL_INTERVAL", 5))
+    PUBLICATION_LEASE = float(os.getenv("PUBLICATION_LEASE", 120))
+    PUBLICATION_MAX_ATTEMPTS = int(os.getenv("PUBLICATION_MAX_ATTEMPTS", 5))
+    PUBLICATION_BACKOFF = float(os.getenv("PUBLICATION_BACKOFF", 30))
+    PUBLICATION_AUTOSTART = os.getenv("PUBLICATION_AUTOSTART", "True").lower() == "true"
 
 
 class DevelopmentConfig(Config):
@@ -49,6 +117,12 @@ class TestingConfig(Config):
         f"{os.getenv('MARIADB_TEST_DATABASE', 'default_db')}"
     )
     WTF_CSRF_ENABLED = False
+    ARCHIVE_CACHE_DIR = os.path.join(tempfile.gettempdir(), "test_archive_cache")
+    EVENT_INGESTION_SYNC = True
+    MOVIE_INDEX_DIR = os.path.join(tempfile.gettempdir(), "test_movie_index")
+    FLAMAPY_CACHE_DIR = os.path.join(tempfile.gettempdir(), "test_flamapy_cache")
+    JOBS_DIR = os.path.join(tempfile.gettempdir(), "test_jobs")
+    PUBLICATION_AUTOSTART = False
 
 
 class ProductionConfig(Config):
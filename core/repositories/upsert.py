@@ -0,0 +1,49 @@
+from typing import Iterable, List, Optional
+
+
+def upsert(
+    session,
+    table,
+    rows: List[dict],
+    key_columns: Iterable[str],
+    increment: Iterable[str] = (),
+    assign: Optional[Iterable[str]] = None,
+):
+    """
+    Inserts rows, or updates the existing row with the same key.
+
+    Columns in `increment` are added to the stored value and columns in `assign` overwrite it, which lets
+    counters be maintained with a single statement per batch instead of a read-modify-write per row. With
+    neither, existing rows are left untouched (insert-if-missing). Uses
+    ON DUPLICATE KEY UPDATE on MySQL/MariaDB and ON CONFLICT on SQLite/PostgreSQL; `key_columns` must match a
+    unique constraint of the table.
+    """
+    if not rows:
+        return
+
+    increment = list(increment)
+    assign = list(assign or ())
+    dialect = session.get_bind().dialect.name
+
+    if dialect in ("mysql", "mariadb"):
+        from sqlalchemy.dialects.mysql import insert
+
+        statement = insert(table)
+        values = {column: table.c[column] + statement.inserted[column] for column in increment}
+        values.update({column: statement.inserted[column] for column in assign})
+        statement = statement.on_duplicate_key_update(values) if values else statement.prefix_with("IGNORE")
+    else:
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        statement = insert(table)
+        values = {column: table.c[column] + statement.excluded[column] for column in increment}
+        values.update({column: statement.excluded[column] for column in assign})
+        if values:
+            statement = statement.on_conflict_do_update(index_elements=list(key_columns), set_=values)
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=list(key_columns))
+
+    session.execute(statement, rows)
@@ -0,0 +1,52 @@
+import math
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+
+# Scores are stored relative to a fixed epoch so that they never need to be decayed in place
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+
+
+def decay_rate(half_life_seconds: float) -> float:
+    return math.log(2) / half_life_seconds
+
+
+def _seconds_since_epoch(moment: datetime) -> float:
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - EPOCH).total_seconds()
+
+
+def log_weight(weight: float, occurred_at: datetime, rate: float) -> float:
+    """
+    Log-space contribution of one event to an exponentially decayed score.
+
+    A decayed score at time t is sum(w_i * exp(-rate * (t - t_i))). The common factor exp(-rate * t) is the same
+    for every item, so ranking by log(sum(w_i * exp(rate * t_i))) gives the same order at any t. That value only
+    grows as events arrive, never has to be recomputed as time passes, and stays in floating-point range because
+    it is kept as a logarithm.
+    """
+    return math.log(weight) + rate * _seconds_since_epoch(occurred_at)
+
+
+def logaddexp(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    """log(exp(a) + exp(b)) without overflow; None stands for an empty score (log 0)."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log1p(math.exp(low - high))
+
+
+def logsumexp(values: Iterable[float]) -> Optional[float]:
+    total = None
+    for value in values:
+        total = logaddexp(total, value)
+    return total
+
+
+def current_value(log_score: Optional[float], now: datetime, rate: float) -> float:
+    """The decayed score as of `now`, e.g. for display."""
+    if log_score is None:
+        return 0.0
+    return math.exp(log_score - rate * _seconds_since_epoch(now))
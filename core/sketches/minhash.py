@@ -0,0 +1,60 @@
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+from core.sketches.hyperloglog import hash64
+
+# Universal hashing h(x) = (a * x + b) mod p over 31-bit values, so a * x never overflows 64 bits
+PRIME = (1 << 31) - 1
+
+
+@lru_cache(maxsize=8)
+def _permutations(num_perm: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, PRIME, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+class MinHash:
+    """
+    MinHash signatures of sets of strings.
+
+    The fraction of positions at which two signatures agree is an unbiased estimate of the Jaccard similarity of
+    the two sets, with a standard error of about 1 / sqrt(num_perm). Signatures are fixed-size whatever the size of
+    the set, and banding them (see `band_keys`) turns "find sets similar to this one" into a few exact lookups.
+    """
+
+    def __init__(self, num_perm: int = 128, seed: int = 1):
+        self.num_perm = num_perm
+        self.seed = seed
+
+    def signature(self, items: Iterable[str]) -> np.ndarray:
+        hashes = np.fromiter((hash64(item) % PRIME for item in set(items)), dtype=np.uint64)
+        if not len(hashes):
+            return np.full(self.num_perm, PRIME, dtype=np.uint32)
+        a, b = _permutations(self.num_perm, self.seed)
+        return ((np.outer(a, hashes) + b[:, None]) % PRIME).min(axis=1).astype(np.uint32)
+
+    def to_bytes(self, signature: np.ndarray) -> bytes:
+        return signature.astype("<u4").tobytes()
+
+    def from_bytes(self, data: bytes) -> np.ndarray:
+        return np.frombuffer(data, dtype="<u4")
+
+
+def jaccard(signature: np.ndarray, other: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the sets behind two signatures."""
+    return float(np.mean(signature == other))
+
+
+def band_keys(signature: np.ndarray, bands: int) -> List[int]:
+    """
+    Locality-sensitive hashing keys: one 63-bit hash per band of `len(signature) // bands` rows. Two sets with
+    Jaccard similarity s share at least one key with probability 1 - (1 - s^rows)^bands, which rises steeply
+    around s = (1 / bands)^(1 / rows).
+    """
+    rows = len(signature) // bands
+    data = signature.astype("<u4")
+    return [hash64(f"{band}:{data[band * rows:(band + 1) * rows].tobytes().hex()}") >> 1 for band in range(bands)]
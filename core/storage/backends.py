@@ -0,0 +1,373 @@
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import BinaryIO, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+from flask import Response, current_app, redirect
+
+from core.archives.zipstream import collect_entries
+from core.http.downloads import send_download, uploads_root
+from core.storage.blobs import BlobStore, get_blob_store
+
+CHUNK_SIZE = 1024 * 1024
+MULTIPART_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+# Folder of a dataset holding the file snapshots of its versions, which are not part of its archive
+VERSIONS_DIR = "versions"
+
+
+def dataset_key(user_id: int, dataset_id: int, *names: str) -> str:
+    """Storage key of a dataset's folder, or of a file inside it: user_<id>/dataset_<id>[/name...]."""
+    return "/".join([f"user_{user_id}", f"dataset_{dataset_id}", *names])
+
+
+class StoredFile(NamedTuple):
+    storage: "StorageBackend"
+    key: str
+    size: int
+    modified: datetime
+
+    def open(self) -> BinaryIO:
+        return self.storage.open(self.key)
+
+
+class StorageBackend:
+    """
+    Where dataset files live, addressed by slash-separated keys such as user_1/dataset_2/model.uvl.
+
+    Reads and writes are streams, so no file is ever held in memory whole. Files are replaced, never modified in
+    place. Use get_storage() to get the backend selected by STORAGE_BACKEND.
+    """
+
+    def location(self, key: str) -> str:
+        """A string naming the key's file that can be stored in the database and passed to fetch() later."""
+        raise NotImplementedError
+
+    def open(self, key: str) -> BinaryIO:
+        """Opens the file for streaming reads. Raises FileNotFoundError if it does not exist."""
+        raise NotImplementedError
+
+    def save(self, key: str, stream: BinaryIO):
+        """Writes the stream to key, replacing any previous file."""
+        raise NotImplementedError
+
+    def put_file(self, key: str, source: str, checksum: Optional[str] = None):
+        """Moves a file on local disk (an upload) to key. The source file is consumed."""
+        raise NotImplementedError
+
+    def copy(self, key: str, target: str, checksum: Optional[str] = None) -> bool:
+        """Copies the file at key to target. Returns False, doing nothing, when there is no such file."""
+        raise NotImplementedError
+
+    def stat(self, key: str) -> Optional[StoredFile]:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    def list(self, prefix: str) -> List[StoredFile]:
+        """Every file under the prefix "folder", ordered by key."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> str:
+        """Path of a file on local disk holding the key's content, for libraries that only read paths."""
+        raise NotImplementedError
+
+    def fetch(self, location: str) -> str:
+        """Local path to read a location (see location()) from. Plain paths are returned as they are."""
+        return location
+
+    def download_response(self, key: str, download_name: str, etag: Optional[str] = None) -> Response:
+        raise NotImplementedError
+
+    def archive_entries(self, prefix: str, arc_root: str, exclude: Tuple[str, ...] = ()) -> List[Tuple[object, str]]:
+        """
+        (source, name inside the archive) for every file under the prefix, as expected by stream_zip(), skipping
+        the top-level folders named in exclude.
+        """
+        prefix = prefix.rstrip("/") + "/"
+        entries = []
+        for file in self.list(prefix):
+            name = file.key[len(prefix) :]
+            folder, _, rest = name.partition("/")
+            if rest and folder in exclude:
+                continue
+            entries.append((file, f"{arc_root}/{name}"))
+        return entries
+
+
+class LocalStorage(StorageBackend):
+    """
+    Files under a folder on local disk (the uploads folder), keys being paths relative to it.
+
+    With a blob store, files whose checksum is known are stored once and linked from every dataset and version
+    that has them (see BlobStore). Downloads go through send_download(), so Range requests and nginx offloading
+    (DOWNLOAD_MODE=accel) keep working.
+    """
+
+    def __init__(self, root: str, blob_store: Optional[BlobStore] = None):
+        self.root = os.path.realpath(root)
+        self.blob_store = blob_store
+
+    def path(self, key: str) -> str:
+        path = os.path.realpath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Invalid storage key: {key!r}")
+        return path
+
+    def location(self, key: str) -> str:
+        return self.path(key)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def save(self, key: str, stream: BinaryIO):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temporary, "wb") as f:
+                shutil.copyfileobj(stream, f, CHUNK_SIZE)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+    def put_file(self, key: str, source: str, checksum: Optional[str] = None):
+        path = self.path(key)
+        if checksum and self.blob_store:
+            # Content that is already stored (in this or any other dataset) is linked instead of written again
+            self.blob_store.store(source, path, checksum)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.move(source, path)
+
+    def copy(self, key: str, target: str, checksum: Optional[str] = None) -> bool:
+        source, target_path = self.path(key), self.path(target)
+        if not os.path.exists(source):
+            return False
+        if checksum and self.blob_store and self.blob_store.link(checksum, target_path, source):
+            return True
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        shutil.copy2(source, target_path)
+        return True
+
+    def stat(self, key: str) -> Optional[StoredFile]:
+        try:
+            stat = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        return StoredFile(self, key, stat.st_size, datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc))
+
+    def list(self, prefix: str) -> List[StoredFile]:
+        base = self.path(prefix)
+        files = []
+        for path, _ in collect_entries(base, ""):
+            key = os.path.relpath(path, self.root).replace(os.sep, "/")
+            stored = self.stat(key)
+            if stored:
+                files.append(stored)
+        return sorted(files, key=lambda file: file.key)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def local_path(self, key: str) -> str:
+        return self.path(key)
+
+    def download_response(self, key: str, download_name: str, etag: Optional[str] = None) -> Response:
+        return send_download(self.path(key), download_name, etag=etag)
+
+    def archive_entries(self, prefix: str, arc_root: str, exclude: Tuple[str, ...] = ()) -> List[Tuple[object, str]]:
+        # Plain paths: stream_zip and the archive cache stat and read them directly
+        return collect_entries(self.path(prefix), arc_root, exclude)
+
+
+class S3Storage(StorageBackend):
+    """
+    Files in a bucket of an S3-compatible object store (AWS S3, MinIO, Ceph...), keys being object keys.
+
+    Large writes are sent as multipart uploads of `multipart_chunksize` parts, and downloads are redirects to a
+    short-lived presigned URL, so file bytes never go through the application. `public_endpoint_url` is the
+    address browsers reach the store at, when it differs from the one the application uses (e.g. inside Docker).
+    Libraries that need a path read a copy cached under `cache_dir`.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        endpoint_url: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        region: Optional[str] = None,
+        public_endpoint_url: Optional[str] = None,
+        presign_expiry: int = 300,
+        multipart_chunksize: int = MULTIPART_CHUNK_SIZE,
+        cache_dir: Optional[str] = None,
+    ):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError as exc:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)") from exc
+
+        config = Config(
+            signature_version="s3v4",
+            # Path-style URLs and plain checksums, which every S3-compatible server understands
+            s3={"addressing_style": "path" if endpoint_url else "auto"},
+            request_checksum_calculation="when_required",
+            response_checksum_validation="when_required",
+            retries={"max_attempts": 3, "mode": "standard"},
+        )
+        credentials = {"aws_access_key_id": access_key, "aws_secret_access_key": secret_key, "region_name": region}
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, config=config, **credentials)
+        self.presign_client = (
+            boto3.client("s3", endpoint_url=public_endpoint_url, config=config, **credentials)
+            if public_endpoint_url
+            else self.client
+        )
+        self.bucket = bucket
+        self.presign_expiry = presign_expiry
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_chunksize, multipart_chunksize=multipart_chunksize
+        )
+        self.cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "s3_cache", bucket)
+
+    @staticmethod
+    def _is_missing(exc: Exception) -> bool:
+        error = getattr(exc, "response", {}).get("Error", {})
+        return error.get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def location(self, key: str) -> str:
+        return f"s3://{self.bucket}/{key}"
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+        except self.client.exceptions.ClientError as exc:
+            if self._is_missing(exc):
+                raise FileNotFoundError(key) from exc
+            raise
+
+    def save(self, key: str, stream: BinaryIO):
+        self.client.upload_fileobj(stream, self.bucket, key, Config=self.transfer_config)
+
+    def put_file(self, key: str, source: str, checksum: Optional[str] = None):
+        self.client.upload_file(source, self.bucket, key, Config=self.transfer_config)
+        os.remove(source)
+
+    def copy(self, key: str, target: str, checksum: Optional[str] = None) -> bool:
+        # Server-side copy: the bytes never leave the object store
+        try:
+            self.client.copy({"Bucket": self.bucket, "Key": key}, self.bucket, target, Config=self.transfer_config)
+        except self.client.exceptions.ClientError as exc:
+            if self._is_missing(exc):
+                return False
+            raise
+        return True
+
+    def stat(self, key: str) -> Optional[StoredFile]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=key)
+        except self.client.exceptions.ClientError as exc:
+            if self._is_missing(exc):
+                return None
+            raise
+        return StoredFile(self, key, head["ContentLength"], head["LastModified"])
+
+    def list(self, prefix: str) -> List[StoredFile]:
+        files = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix.rstrip("/") + "/"):
+            for item in page.get("Contents", []):
+                files.append(StoredFile(self, item["Key"], item["Size"], item["LastModified"]))
+        return sorted(files, key=lambda file: file.key)
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def local_path(self, key: str) -> str:
+        stored = self.stat(key)
+        if stored is None:
+            raise FileNotFoundError(key)
+
+        path = os.path.join(self.cache_dir, *key.split("/"))
+        modified = stored.modified.timestamp()
+        try:
+            stat = os.stat(path)
+            if stat.st_size == stored.size and stat.st_mtime == modified:
+                return path
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            self.client.download_file(self.bucket, key, temporary, Config=self.transfer_config)
+            os.utime(temporary, (modified, modified))
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        return path
+
+    def fetch(self, location: str) -> str:
+        prefix = f"s3://{self.bucket}/"
+        return self.local_path(location[len(prefix) :]) if location.startswith(prefix) else location
+
+    def presigned_url(self, key: str, download_name: str) -> str:
+        return self.presign_client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": key,
+                "ResponseContentDisposition": f"attachment; filename*=UTF-8''{quote(download_name)}",
+            },
+            ExpiresIn=self.presign_expiry,
+        )
+
+    def download_response(self, key: str, download_name: str, etag: Optional[str] = None) -> Response:
+        response = redirect(self.presigned_url(key, download_name))
+        # The signed URL expires, so the redirect itself must not be cached
+        response.headers["Cache-Control"] = "no-store"
+        return response
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    global _storage
+
+    with _storage_lock:
+        if _storage is None:
+            config = current_app.config
+            if config["STORAGE_BACKEND"] == "s3":
+                _storage = S3Storage(
+                    config["S3_BUCKET"],
+                    endpoint_url=config["S3_ENDPOINT_URL"],
+                    access_key=config["S3_ACCESS_KEY_ID"],
+                    secret_key=config["S3_SECRET_ACCESS_KEY"],
+                    region=config["S3_REGION"],
+                    public_endpoint_url=config["S3_PUBLIC_ENDPOINT_URL"],
+                    presign_expiry=config["S3_PRESIGN_EXPIRY"],
+                    multipart_chunksize=config["S3_MULTIPART_CHUNK_SIZE"],
+                )
+            else:
+                _storage = LocalStorage(uploads_root(), get_blob_store())
+        return _storage
@@ -0,0 +1,176 @@
+import errno
+import filecmp
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import Optional
+
+from core.configuration.configuration import uploads_folder_name
+
+logger = logging.getLogger(__name__)
+
+_CHECKSUM = re.compile(r"^[0-9a-f]{32,128}$")
+
+
+class BlobStore:
+    """
+    Content-addressed file store: the content with checksum abcd... lives once at <root>/ab/cd/abcd....
+
+    Dataset and version directories keep their usual layout, but their files are hard links to blobs, so a file
+    uploaded to several datasets or versions takes the space of one. The link count of a blob minus one is its
+    number of references; gc() deletes blobs nothing links to any more. Where hard links are not possible (another
+    filesystem) files are copied instead: the dataset copy stays valid on its own and the blob is only a
+    deduplication aid, which is why resolve() always takes the dataset path as a fallback. Because links share
+    their content, stored files must be replaced (write a new file, then rename), never modified in place.
+
+    Checksums only locate candidate blobs: a file is linked to a blob after their bytes compare equal, so two
+    contents with the same checksum (an MD5 collision) are both kept, the second one without deduplication.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path_for(self, checksum: str) -> str:
+        if not _CHECKSUM.match(checksum or ""):
+            raise ValueError(f"Invalid checksum: {checksum!r}")
+        return os.path.join(self.root, checksum[:2], checksum[2:4], checksum)
+
+    def exists(self, checksum: str) -> bool:
+        return os.path.exists(self.path_for(checksum))
+
+    def references(self, checksum: str) -> int:
+        """Number of dataset or version files sharing the blob."""
+        try:
+            return os.stat(self.path_for(checksum)).st_nlink - 1
+        except FileNotFoundError:
+            return 0
+
+    def resolve(self, checksum: Optional[str], fallback: Optional[str]) -> Optional[str]:
+        """Path to read a file from: its blob when stored, otherwise `fallback`."""
+        try:
+            blob = self.path_for(checksum)
+        except ValueError:
+            return fallback
+        return blob if os.path.exists(blob) else fallback
+
+    @staticmethod
+    def _same_content(blob: str, path: str) -> bool:
+        if os.path.samefile(blob, path):
+            return True
+        if filecmp.cmp(blob, path, shallow=False):
+            return True
+        logger.warning(f"Blob store: {path} has the checksum of {blob} but another content, not deduplicated")
+        return False
+
+    @staticmethod
+    def _link(source: str, destination: str):
+        """Points destination at source's content, replacing any existing file atomically."""
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        temporary = f"{destination}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.link(source, temporary)
+        except OSError as exc:
+            if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                raise
+            shutil.copyfile(source, temporary)
+        os.replace(temporary, destination)
+
+    def store(self, source: str, destination: str, checksum: str) -> bool:
+        """
+        Moves a freshly uploaded file to `destination` through the store and returns whether its content was new.
+        When the content is already stored, the upload is discarded and destination becomes a link to the
+        existing blob, so no file data is written. An upload whose checksum matches a blob with other content is
+        moved into place as is.
+        """
+        blob = self.path_for(checksum)
+        created = False
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                os.link(source, blob)
+                created = True
+            except FileExistsError:
+                pass  # stored concurrently by another upload
+            except OSError as exc:
+                if exc.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+                    raise
+                # Different filesystem: copy into the store, then move the upload itself into place
+                self._link(source, blob)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                os.replace(source, destination)
+                return True
+
+        if not created and not self._same_content(blob, source):
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            os.replace(source, destination)
+            return True
+
+        self._link(blob, destination)
+        if os.path.abspath(source) != os.path.abspath(destination):
+            os.remove(source)
+        return created
+
+    def link(self, checksum: str, destination: str, source: str) -> bool:
+        """
+        Makes destination, a copy of source, a link to the stored blob of the same content. Returns False, doing
+        nothing, when no such blob is stored.
+        """
+        blob = self.resolve(checksum, None)
+        if blob is None or not self._same_content(blob, source):
+            return False
+        self._link(blob, destination)
+        return True
+
+    def adopt(self, path: str, checksum: str) -> bool:
+        """
+        Brings an existing file into the store: it becomes the blob if its content is new, or is replaced by a link
+        to the existing blob. Returns True when the file's own copy of the data was freed.
+        """
+        blob = self.path_for(checksum)
+        if not os.path.exists(blob):
+            self.store(path, path, checksum)
+            return False
+        if os.path.samefile(blob, path) or not self._same_content(blob, path):
+            return False
+        self._link(blob, path)
+        return True
+
+    def gc(self, min_age: float = 3600) -> int:
+        """
+        Deletes blobs that no dataset or version file links to any more, and leftover temporary files. Blobs
+        younger than min_age seconds are kept, since an upload may be about to link them. Returns the number of
+        files deleted.
+        """
+        deleted = 0
+        cutoff = time.time() - min_age
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if stat.st_ctime >= cutoff:  # ctime changes whenever a link is added or removed
+                    continue
+                if name.endswith(".tmp") or stat.st_nlink <= 1:
+                    os.remove(path)
+                    deleted += 1
+        logger.info(f"Blob store: deleted {deleted} unreferenced files")
+        return deleted
+
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    global _blob_store
+
+    with _blob_store_lock:
+        if _blob_store is None:
+            _blob_store = BlobStore(os.path.join(os.getenv("WORKING_DIR", ""), uploads_folder_name(), "blobs"))
+        return _blob_store
@@ -0,0 +1,86 @@
+import hashlib
+import os
+from typing import BinaryIO, List, Sequence, Tuple
+
+from core.workers.pools import get_thread_pool
+
+CHUNK_SIZE = 1024 * 1024
+
+# (hex digest, size in bytes)
+Checksum = Tuple[str, int]
+
+
+def _sidecar_path(path: str, algorithm: str) -> str:
+    return f"{path}.{algorithm}"
+
+
+def _remember(path: str, algorithm: str, checksum: Checksum):
+    """
+    Stores a checksum next to the file together with the file's size and mtime, so a later file_checksum() can
+    reuse it instead of reading the file again. A sidecar that no longer matches the file is ignored.
+    """
+    stat = os.stat(path)
+    with open(_sidecar_path(path, algorithm), "w") as sidecar:
+        sidecar.write(f"{checksum[0]} {stat.st_size} {stat.st_mtime_ns}")
+
+
+def _remembered(path: str, algorithm: str, stat: os.stat_result):
+    try:
+        with open(_sidecar_path(path, algorithm)) as sidecar:
+            digest, size, mtime_ns = sidecar.read().split()
+    except (FileNotFoundError, ValueError):
+        return None
+    if int(size) != stat.st_size or int(mtime_ns) != stat.st_mtime_ns:
+        return None
+    return digest, stat.st_size
+
+
+def save_stream(stream: BinaryIO, path: str, algorithm: str = "md5", chunk_size: int = CHUNK_SIZE) -> Checksum:
+    """
+    Writes a stream (e.g. an uploaded file) to `path`, hashing it on the way through, and remembers the checksum
+    for file_checksum(). The data is read once, in fixed-size chunks, so memory use does not depend on its size.
+    """
+    digest = hashlib.new(algorithm)
+    size = 0
+    with open(path, "wb") as destination:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+            destination.write(chunk)
+            size += len(chunk)
+    checksum = (digest.hexdigest(), size)
+    _remember(path, algorithm, checksum)
+    return checksum
+
+
+def file_checksum(path: str, algorithm: str = "md5", chunk_size: int = CHUNK_SIZE) -> Checksum:
+    """Checksum and size of a file, read in fixed-size chunks into a reused buffer unless already remembered."""
+    stat = os.stat(path)
+    remembered = _remembered(path, algorithm, stat)
+    if remembered is not None:
+        return remembered
+
+    digest = hashlib.new(algorithm)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    size = 0
+    with open(path, "rb", buffering=0) as file:
+        while True:
+            read = file.readinto(buffer)
+            if not read:
+                break
+            digest.update(view[:read])
+            size += read
+    return digest.hexdigest(), size
+
+
+def file_checksums(paths: Sequence[str], algorithm: str = "md5") -> List[Checksum]:
+    """
+    Checksums of several files, in the same order. hashlib releases the GIL while hashing large buffers, so the
+    files are hashed in parallel on the shared thread pool.
+    """
+    if len(paths) <= 1:
+        return [file_checksum(path, algorithm) for path in paths]
+    return list(get_thread_pool().map(lambda path: file_checksum(path, algorithm), paths))
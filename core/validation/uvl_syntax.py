@@ -0,0 +1,38 @@
+import time
+
+from antlr4 import CommonTokenStream, FileStream
+from antlr4.error.ErrorListener import ErrorListener
+from uvl.UVLCustomLexer import UVLCustomLexer
+from uvl.UVLPythonParser import UVLPythonParser
+
+
+class _CollectingErrorListener(ErrorListener):
+    def __init__(self):
+        self.errors = []
+
+    def syntaxError(self, recognizer, offendingSymbol, line, column, msg, e):
+        kind = "warning" if "\\t" in msg else "error"
+        self.errors.append(f"The UVL has the following {kind} that prevents reading it: Line {line}:{column} - {msg}")
+
+
+def validate_uvl(path: str) -> dict:
+    """
+    Fully parses a UVL file and returns {"valid", "errors", "seconds"}.
+
+    Runs inside the process pool, so it only receives a path and does not use the Flask application.
+    """
+    started = time.perf_counter()
+    errors = _CollectingErrorListener()
+    try:
+        lexer = UVLCustomLexer(FileStream(path, encoding="utf-8"))
+        lexer.removeErrorListeners()
+        lexer.addErrorListener(errors)
+
+        parser = UVLPythonParser(CommonTokenStream(lexer))
+        parser.removeErrorListeners()
+        parser.addErrorListener(errors)
+        parser.featureModel()
+    except Exception as exc:
+        errors.errors.append(f"The UVL could not be read: {exc}")
+
+    return {"valid": not errors.errors, "errors": errors.errors, "seconds": round(time.perf_counter() - started, 4)}
@@ -0,0 +1,201 @@
+import json
+import os
+import shutil
+import uuid
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+ASSIGN_BATCH = 65_536
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray, batch: int = ASSIGN_BATCH) -> np.ndarray:
+    """Index of the most similar centroid (by dot product) of every vector, computed in batches."""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), batch):
+        labels[start : start + batch] = np.argmax(np.asarray(vectors[start : start + batch]) @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Unit-length centroids of k clusters of unit vectors (k-means under cosine similarity)."""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        empty = ~sums.any(axis=1)
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+class IVFIndex:
+    """
+    Inverted-file nearest-neighbor index over unit vectors.
+
+    Vectors are clustered around `nlist` centroids and stored contiguously per cluster, so a query only scores the
+    vectors of the `nprobe` clusters closest to it: with nlist ~ sqrt(n), a million 256-dimensional vectors are
+    searched by reading a few thousand of them. The arrays are saved as .npy files and loaded with mmap_mode="r",
+    which lets every worker process share one copy through the page cache.
+    """
+
+    FILES = ("centroids", "vectors", "ids", "offsets", "lookup_ids", "lookup_positions")
+
+    def __init__(self, centroids, vectors, ids, offsets, lookup_ids, lookup_positions, meta: Optional[dict] = None):
+        self.centroids = centroids
+        self.vectors = vectors
+        self.ids = ids
+        self.offsets = offsets
+        # ids in ascending order and their positions in `ids`, for binary search by id
+        self.lookup_ids = lookup_ids
+        self.lookup_positions = lookup_positions
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(
+        cls,
+        directory: str,
+        ids: np.ndarray,
+        vectors: np.ndarray,
+        nlist: Optional[int] = None,
+        sample_size: int = 100_000,
+        seed: int = 0,
+        chunk: int = ASSIGN_BATCH,
+        meta: Optional[dict] = None,
+    ) -> "IVFIndex":
+        """
+        Clusters a sample of the vectors, assigns every vector in batches and writes the index to `directory`.
+        `vectors` may itself be a memory-mapped array, so building never needs all of them in memory at once.
+        """
+        os.makedirs(directory, exist_ok=True)
+        ids = np.asarray(ids, dtype=np.int64)
+        count = len(ids)
+        nlist = nlist or max(1, min(4096, int(np.sqrt(count))))
+
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(count, size=min(count, sample_size), replace=False)) if count else []
+        if count:
+            centroids = spherical_kmeans(np.asarray(vectors[sample]), min(nlist, len(sample)), seed=seed)
+        else:
+            centroids = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+
+        labels = assign(vectors, centroids) if count else np.zeros(0, dtype=np.int32)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.searchsorted(labels[order], np.arange(len(centroids) + 1)).astype(np.int64)
+
+        sorted_vectors = np.lib.format.open_memmap(
+            os.path.join(directory, "vectors.npy"), mode="w+", dtype=np.float32, shape=(count, vectors.shape[1])
+        )
+        for start in range(0, count, chunk):
+            sorted_vectors[start : start + chunk] = vectors[order[start : start + chunk]]
+        sorted_vectors.flush()
+        del sorted_vectors
+
+        sorted_ids = ids[order]
+        np.save(os.path.join(directory, "centroids.npy"), centroids)
+        np.save(os.path.join(directory, "ids.npy"), sorted_ids)
+        np.save(os.path.join(directory, "offsets.npy"), offsets)
+        lookup = np.argsort(sorted_ids, kind="stable")
+        np.save(os.path.join(directory, "lookup_ids.npy"), sorted_ids[lookup])
+        np.save(os.path.join(directory, "lookup_positions.npy"), lookup)
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta or {}, f)
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "IVFIndex":
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode) for name in cls.FILES}
+        meta = {}
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        return cls(meta=meta, **arrays)
+
+    def position(self, item_id: int) -> Optional[int]:
+        slot = int(np.searchsorted(self.lookup_ids, item_id))
+        if slot < len(self.lookup_ids) and self.lookup_ids[slot] == item_id:
+            return int(self.lookup_positions[slot])
+        return None
+
+    def cluster_of(self, position: int) -> int:
+        return int(np.searchsorted(self.offsets, position, side="right")) - 1
+
+    def vector(self, item_id: int) -> Optional[np.ndarray]:
+        position = self.position(item_id)
+        return None if position is None else np.asarray(self.vectors[position])
+
+    def probe(self, query: np.ndarray, nprobe: int) -> List[int]:
+        """The clusters whose centroids are most similar to the query."""
+        if not len(self.centroids):
+            return []
+        similarities = self.centroids @ query
+        nprobe = min(nprobe, len(similarities))
+        return [int(i) for i in np.argpartition(-similarities, nprobe - 1)[:nprobe]]
+
+    def search(
+        self, query: np.ndarray, k: int, nprobe: int = 8, exclude: Iterable[int] = ()
+    ) -> List[Tuple[int, float]]:
+        """The k (id, similarity) pairs closest to the unit query vector among the probed clusters, best first."""
+        candidates, scores = [], []
+        for cluster in self.probe(query, nprobe):
+            start, end = int(self.offsets[cluster]), int(self.offsets[cluster + 1])
+            if start == end:
+                continue
+            candidates.append(np.asarray(self.ids[start:end]))
+            scores.append(np.asarray(self.vectors[start:end]) @ query)
+        if not candidates:
+            return []
+        return top_k(np.concatenate(candidates), np.concatenate(scores), k, exclude)
+
+
+def top_k(ids: np.ndarray, scores: np.ndarray, k: int, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+    exclude = set(exclude)
+    if exclude:
+        keep = ~np.isin(ids, list(exclude))
+        ids, scores = ids[keep], scores[keep]
+    if not len(ids):
+        return []
+    k = min(k, len(ids))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind="stable")]
+    return [(int(ids[i]), float(scores[i])) for i in best]
+
+
+def publish(root: str, build) -> str:
+    """
+    Builds a new index version under `root` with build(directory) and points root/CURRENT at it atomically, so
+    readers either see the previous complete version or the new one. Older versions are removed; processes that
+    still have them memory-mapped keep reading them until they reload.
+    """
+    os.makedirs(root, exist_ok=True)
+    version = uuid.uuid4().hex
+    build(os.path.join(root, version))
+
+    pointer = os.path.join(root, "CURRENT")
+    temporary = f"{pointer}.{version}"
+    with open(temporary, "w") as f:
+        f.write(version)
+    os.replace(temporary, pointer)
+
+    for entry in os.listdir(root):
+        path = os.path.join(root, entry)
+        if entry != version and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    return version
+
+
+def current_version(root: str) -> Optional[str]:
+    try:
+        with open(os.path.join(root, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,80 @@
+import math
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import unidecode
+
+from core.sketches.hyperloglog import hash64
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset(
+    "a an and are as at be but by for from has he her his in into is it its of on or she that the their them they "
+    "this to was were which while who will with".split()
+)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    words = TOKEN_PATTERN.findall(unidecode.unidecode(text).lower())
+    return [word for word in words if len(word) > 1 and word not in STOP_WORDS]
+
+
+@lru_cache(maxsize=200_000)
+def _direction(token: str, dim: int) -> np.ndarray:
+    rng = np.random.default_rng(hash64(token))
+    return (rng.integers(0, 2, size=dim, dtype=np.int8) * 2 - 1).astype(np.float32) / np.float32(math.sqrt(dim))
+
+
+class HashedTfidfEncoder:
+    """
+    Turns weighted bags of tokens into dense unit vectors of `dim` floats.
+
+    Each token gets a TF-IDF weight and a fixed pseudo-random +-1 direction derived from its hash, and a document
+    is the weighted sum of its tokens' directions. That is feature hashing followed by a sparse random projection,
+    which approximately preserves cosine similarity without a vocabulary or a stored projection matrix, so any
+    process encodes the same text to the same vector. Document frequencies are counted in `buckets` hashed slots;
+    they are fixed when an index is built and only refreshed by the next build.
+    """
+
+    def __init__(
+        self,
+        dim: int = 256,
+        buckets: int = 1 << 20,
+        document_frequencies: Optional[np.ndarray] = None,
+        documents: int = 0,
+    ):
+        self.dim = dim
+        self.buckets = buckets
+        self.document_frequencies = (
+            np.zeros(buckets, dtype=np.int32) if document_frequencies is None else document_frequencies
+        )
+        self.documents = documents
+
+    def _bucket(self, token: str) -> int:
+        return hash64(token) % self.buckets
+
+    def count(self, bags: Iterable[Dict[str, float]]):
+        """Adds documents to the document frequencies."""
+        for bag in bags:
+            buckets = np.fromiter((self._bucket(token) for token in bag), dtype=np.int64, count=len(bag))
+            np.add.at(self.document_frequencies, np.unique(buckets), 1)
+            self.documents += 1
+
+    def idf(self, token: str) -> float:
+        return math.log((1 + self.documents) / (1 + self.document_frequencies[self._bucket(token)])) + 1.0
+
+    def encode(self, bag: Dict[str, float]) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token, weight in bag.items():
+            vector += np.float32(math.log1p(weight) * self.idf(token)) * _direction(token, self.dim)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def encode_many(self, bags: List[Dict[str, float]]) -> np.ndarray:
+        if not bags:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.vstack([self.encode(bag) for bag in bags])
@@ -0,0 +1,164 @@
+import logging
+import multiprocessing
+import queue
+import resource
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TaskTimeout(TimeoutError):
+    """A task overran its timeout: its worker process was killed."""
+
+
+class WorkerCrashed(RuntimeError):
+    """The worker process running a task died, e.g. killed by the OOM killer or crashed in native code."""
+
+
+def _worker_main(conn):
+    """Entry point of pool processes: runs (func, args, memory_limit) tasks and sends back (ok, result)."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        func, args, memory_limit = task
+        if memory_limit:
+            # Only the soft limit is lowered, so it can be restored for the next task
+            limit = memory_limit if hard == resource.RLIM_INFINITY else min(memory_limit, hard)
+            resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+        try:
+            reply = (True, func(*args))
+        except BaseException as exc:
+            reply = (False, exc)
+        finally:
+            if memory_limit:
+                resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+        try:
+            conn.send(reply)
+        except Exception as exc:
+            conn.send((False, RuntimeError(f"Task result could not be sent back: {type(exc).__name__}: {exc}")))
+
+
+class KillablePool:
+    """
+    Process pool for CPU-bound tasks that may never finish.
+
+    Unlike ProcessPoolExecutor, every task has its own timeout, after which its worker process is killed and
+    replaced instead of being left to run, and an optional address-space limit (RLIMIT_AS), so a pathological
+    input can neither keep a worker busy nor exhaust the memory of the machine. Workers are 'spawn' processes,
+    started on first use and reused across tasks; each one is driven by a supervisor thread of this process.
+    Tasks must be importable functions from modules that do not import the Flask application.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._tasks = queue.Queue()
+        self._threads = []
+        self._processes = set()
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def submit(
+        self, func: Callable, *args, timeout: Optional[float] = None, memory_limit: Optional[int] = None
+    ) -> Future:
+        """Queues func(*args). Its worker is killed once it has run for timeout seconds (TaskTimeout)."""
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit tasks after shutdown")
+            self._tasks.put((future, func, args, timeout, memory_limit))
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._supervise, name="killable-pool", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+        return future
+
+    def _spawn(self):
+        context = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        with self._lock:
+            self._processes.add(process)
+        return process, parent_conn
+
+    def _kill(self, process, conn):
+        conn.close()
+        if process.is_alive():
+            process.kill()
+        process.join()
+        with self._lock:
+            self._processes.discard(process)
+
+    def _supervise(self):
+        process = conn = None
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+            future, func, args, timeout, memory_limit = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            if process is None or not process.is_alive():
+                if process is not None:
+                    self._kill(process, conn)
+                process, conn = self._spawn()
+
+            try:
+                conn.send((func, args, memory_limit))
+            except Exception as exc:
+                # Usually arguments that cannot be pickled: the worker never got the task
+                future.set_exception(exc)
+                continue
+
+            try:
+                if conn.poll(timeout):
+                    ok, value = conn.recv()
+                    if ok:
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+                    continue
+                error = TaskTimeout(f"Task {getattr(func, '__name__', func)} timed out after {timeout:g} seconds")
+            except (EOFError, OSError):
+                error = None
+
+            self._kill(process, conn)
+            if error is None:
+                name = getattr(func, "__name__", func)
+                error = WorkerCrashed(f"Worker process running {name} died (exit code {process.exitcode})")
+            logger.warning(str(error))
+            future.set_exception(error)
+            process = conn = None
+
+        if process is not None:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            self._kill(process, conn)
+
+    def shutdown(self):
+        """Stops the pool: queued tasks are cancelled and running ones killed."""
+        with self._lock:
+            self._shutdown = True
+            processes = list(self._processes)
+        while True:
+            try:
+                task = self._tasks.get_nowait()
+            except queue.Empty:
+                break
+            if task is not None:
+                task[0].cancel()
+        for _ in self._threads:
+            self._tasks.put(None)
+        for process in processes:
+            if process.is_alive():
+                process.kill()
@@ -0,0 +1,57 @@
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from core.workers.killable import KillablePool
+
+_lock = threading.Lock()
+_process_pool = None
+_thread_pool = None
+_owner_pid = None
+
+
+def _pool_size(env_name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(env_name, default)))
+    except ValueError:
+        return default
+
+
+def get_process_pool() -> KillablePool:
+    """
+    Returns the process pool shared by CPU-bound tasks (text diffs, UVL parsing, conversions).
+
+    The pool is created lazily once per process and uses the 'spawn' start method, so workers never inherit
+    the parent's database connections or threads. Tasks submitted to it must be importable functions from
+    modules that do not import the Flask application (see core/diffs for an example). Give every task a timeout:
+    its worker is killed when it overruns it, so a runaway task cannot hold the pool.
+    """
+    global _process_pool, _owner_pid
+
+    with _lock:
+        if _process_pool is None or _owner_pid != os.getpid():
+            _process_pool = KillablePool(_pool_size("PROCESS_POOL_SIZE", max(1, (os.cpu_count() or 2) - 1)))
+            _owner_pid = os.getpid()
+        return _process_pool
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    """Returns the thread pool shared by I/O-bound tasks and GIL-releasing work such as hashing."""
+    global _thread_pool
+
+    with _lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=_pool_size("THREAD_POOL_SIZE", min(32, (os.cpu_count() or 1) + 4)),
+                thread_name_prefix="core-worker",
+            )
+        return _thread_pool
+
+
+@atexit.register
+def _shutdown_pools():
+    if _process_pool is not None and _owner_pid == os.getpid():
+        _process_pool.shutdown()
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,22 @@
+import click
+from flask.cli import with_appcontext
+
+from app import create_app
+
+
+@click.command("blobs:gc", help="Deletes stored file contents that no dataset or version references any more.")
+@click.option("--adopt", is_flag=True, help="First move existing dataset and version files into the blob store.")
+@click.option("--min-age", default=3600, show_default=True, help="Keep blobs unlinked for less than this many seconds.")
+@with_appcontext
+def blobs_gc(adopt, min_age):
+    app = create_app()
+    with app.app_context():
+        from app.modules.dataset.services import DataSetService
+        from core.storage.blobs import get_blob_store
+
+        if adopt:
+            freed = DataSetService().deduplicate_files()
+            click.echo(click.style(f"Moved files into the blob store ({freed} duplicates freed).", fg="green"))
+
+        deleted = get_blob_store().gc(min_age=min_age)
+        click.echo(click.style(f"Blob store cleaned ({deleted} unreferenced files deleted).", fg="green"))
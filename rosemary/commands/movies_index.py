@@ -0,0 +1,24 @@
+import click
+from flask.cli import with_appcontext
+
+from app import create_app
+
+
+@click.command(
+    "movies:index",
+    help="Adds the movies created since the last similar-movies index build to the index.",
+)
+@click.option("--full", is_flag=True, help="Rebuild the index from every movie instead.")
+@with_appcontext
+def movies_index(full):
+    app = create_app()
+    with app.app_context():
+        from app.modules.movie.services import MovieSimilarityService
+
+        service = MovieSimilarityService()
+        if full:
+            indexed = service.build_index()
+            click.echo(click.style(f"Similar-movies index rebuilt ({indexed} movies).", fg="green"))
+        else:
+            indexed = service.index_new_movies()
+            click.echo(click.style(f"Similar-movies index updated ({indexed} new movies).", fg="green"))
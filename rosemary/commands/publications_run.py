@@ -0,0 +1,25 @@
+import click
+from flask.cli import with_appcontext
+
+from app import create_app
+
+
+@click.command("publications:run", help="Runs the Zenodo publications that are due, resuming interrupted ones.")
+@click.option("--retry-failed", is_flag=True, help="First requeue the publications that ran out of attempts.")
+@with_appcontext
+def publications_run(retry_failed):
+    app = create_app()
+    with app.app_context():
+        from app import db
+        from app.modules.dataset.models import PublicationJob
+        from core.jobs.worker import publication_worker
+
+        if retry_failed:
+            requeued = PublicationJob.query.filter_by(status=PublicationJob.FAILED).update(
+                {"status": PublicationJob.PENDING, "attempts": 0, "error": None, "next_attempt_at": None}
+            )
+            db.session.commit()
+            click.echo(click.style(f"Requeued {requeued} failed publications.", fg="yellow"))
+
+        done = publication_worker.run_due()
+        click.echo(click.style(f"Ran {done} publications.", fg="green"))
@@ -0,0 +1,23 @@
+import click
+from flask.cli import with_appcontext
+
+from app import create_app
+
+
+@click.command(
+    "recommendations:update",
+    help="Folds new view and download records into the related-datasets recommendations and recomputes the "
+    "content signatures of datasets with new versions.",
+)
+@click.option("--full", is_flag=True, help="Rebuild the recommendations from every record instead.")
+@with_appcontext
+def recommendations_update(full):
+    app = create_app()
+    with app.app_context():
+        from app.modules.recommendation.services import DatasetSimilarityService, RecommendationService
+
+        processed = RecommendationService().update(full=full)
+        click.echo(click.style(f"Recommendations updated ({processed} records processed).", fg="green"))
+
+        signatures = DatasetSimilarityService().refresh(full=full)
+        click.echo(click.style(f"Dataset signatures updated ({signatures} datasets processed).", fg="green"))
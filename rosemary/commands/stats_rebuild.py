@@ -0,0 +1,22 @@
+import click
+from flask.cli import with_appcontext
+
+from app import create_app
+
+
+@click.command(
+    "stats:rebuild",
+    help="Recomputes the statistics rollups, counters and distinct-visitor sketches from the raw records.",
+)
+@click.option("--sketches-only", is_flag=True, help="Only rebuild the distinct-visitor sketches.")
+@with_appcontext
+def stats_rebuild(sketches_only):
+    app = create_app()
+    with app.app_context():
+        from app.modules.stats.services import StatsService
+
+        if sketches_only:
+            StatsService().rebuild_sketches()
+        else:
+            StatsService().rebuild()
+        click.echo(click.style("Statistics rebuilt.", fg="green"))